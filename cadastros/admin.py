@@ -1,20 +1,21 @@
 from django.contrib import admin
 from .models import (
     Estado, Cidade, Fornecedor, Frota,
-    CategoriaItem, Item, Pedido, ItemPedido, MovimentacaoPedido
+    CategoriaItem, Item, Pedido, ItemPedido, MovimentacaoPedido, ResumoDiarioPedido
 )
 
 @admin.register(Estado)
 class EstadoAdmin(admin.ModelAdmin):
-    list_display = ('nome', 'sigla')
-    search_fields = ('nome', 'sigla')
+    list_display = ('nome', 'sigla', 'codigo_ibge')
+    search_fields = ('nome', 'sigla', 'codigo_ibge')
 
 
 @admin.register(Cidade)
 class CidadeAdmin(admin.ModelAdmin):
-    list_display = ('nome', 'estado')
+    list_display = ('nome', 'estado', 'codigo_ibge')
     list_filter = ('estado',)
-    search_fields = ('nome',)
+    list_select_related = ('estado',)
+    search_fields = ('nome', 'codigo_ibge')
 
 
 @admin.register(Fornecedor)
@@ -48,6 +49,8 @@ class PedidoAdmin(admin.ModelAdmin):
     list_display = ('id', 'fornecedor', 'data_pedido', 'status', 'criado_por', 'valor_total')
     list_filter = ('status', 'data_pedido', 'fornecedor')
     search_fields = ('descricao',)
+    # Mantido pelos itens; use o comando valor_total_pedidos para corrigir
+    readonly_fields = ('valor_total',)
 
 
 @admin.register(ItemPedido)
@@ -64,9 +67,25 @@ class MovimentacaoPedidoAdmin(admin.ModelAdmin):
     search_fields = ('pedido__id', 'observacao')
     readonly_fields = ('pedido', 'tipo', 'status_anterior', 'status_novo', 'observacao', 'data_movimentacao', 'usuario')
     date_hierarchy = 'data_movimentacao'
+    # Evita o COUNT(*) da tabela inteira a cada página filtrada
+    show_full_result_count = False
 
     def has_add_permission(self, request):
         return False
 
     def has_delete_permission(self, request, obj=None):
         return False
+
+
+@admin.register(ResumoDiarioPedido)
+class ResumoDiarioPedidoAdmin(admin.ModelAdmin):
+    list_display = ('dia', 'criado_por', 'fornecedor', 'status', 'num_pedidos', 'quantidade_itens', 'valor_total')
+    list_filter = ('status', 'dia')
+    date_hierarchy = 'dia'
+
+    # Mantido automaticamente; use o comando resumo_pedidos para corrigir
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CadastrosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cadastros'
+
+    def ready(self):
+        # Registra a manutencao incremental do ResumoDiarioPedido
+        from . import signals  # noqa: F401
@@ -0,0 +1,323 @@
+"""
+Particionamento mensal e arquivamento das movimentacoes de pedido.
+
+MovimentacaoPedido so recebe insercoes e e a maior tabela do sistema. Os
+meses sao contados em UTC.
+
+PostgreSQL: a tabela e particionada por mes (RANGE em data_movimentacao),
+com uma particao padrao para datas que ainda nao tem particao propria.
+``garantir_particoes`` cria as particoes dos proximos meses e
+``arquivar_mes`` grava um mes em JSONL comprimido e descarta a particao
+inteira (DETACH + DROP), sem DELETE linha a linha. Meses antigos que so
+tem linhas na particao padrao ganham uma particao na hora de arquivar.
+Consultas por data, como as do admin, leem apenas as particoes do periodo.
+
+SQLite: sem particoes, as linhas mais antigas que a janela ativa sao
+movidas para a tabela de arquivo (``TABELA_ARQUIVO``), mantendo a tabela
+principal pequena; e dela que os meses antigos saem para os arquivos JSONL.
+
+Os arquivos ficam em ``settings.ARQUIVO_MOVIMENTACOES_DIR``, um por mes
+(movimentacoes-AAAA-MM.jsonl.gz), cada um com um indice dos pedidos que
+contem. ``historico_pedido`` junta as tres origens. As movimentacoes
+arquivadas nao sao apagadas junto com o pedido.
+"""
+import datetime
+import gzip
+import json
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection as conexao_padrao, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import MovimentacaoPedido
+
+TABELA = MovimentacaoPedido._meta.db_table
+TABELA_PADRAO = f'{TABELA}_padrao'
+TABELA_ARQUIVO = f'{TABELA}_arquivo'
+COLUNAS = [
+    'id', 'pedido_id', 'tipo', 'status_anterior', 'status_novo',
+    'observacao', 'data_movimentacao', 'usuario_id',
+]
+
+
+# === MESES ===
+
+def inicio_do_mes(data, deslocamento=0):
+    """Primeiro dia do mes de ``data``, deslocado em ``deslocamento`` meses."""
+    indice = data.year * 12 + data.month - 1 + deslocamento
+    return datetime.date(indice // 12, indice % 12 + 1, 1)
+
+
+def limites(mes):
+    """Inicio (inclusivo) e fim (exclusivo) do mes, em UTC."""
+    inicio = datetime.datetime(mes.year, mes.month, 1, tzinfo=datetime.timezone.utc)
+    proximo = inicio_do_mes(mes, 1)
+    fim = datetime.datetime(proximo.year, proximo.month, 1, tzinfo=datetime.timezone.utc)
+    return inicio, fim
+
+
+def meses_entre(primeiro, ultimo):
+    mes = inicio_do_mes(primeiro)
+    while mes <= ultimo:
+        yield mes
+        mes = inicio_do_mes(mes, 1)
+
+
+def _mes_utc(momento):
+    if timezone.is_naive(momento):
+        return momento.date()
+    return momento.astimezone(datetime.timezone.utc).date()
+
+
+# === PARTICOES (POSTGRESQL) ===
+
+def nome_particao(mes):
+    return f'{TABELA}_p{mes:%Y%m}'
+
+
+def particoes(connection=conexao_padrao):
+    """Meses (primeiro dia) que ja tem particao propria."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT filha.relname FROM pg_inherits '
+            'JOIN pg_class filha ON filha.oid = pg_inherits.inhrelid '
+            'JOIN pg_class mae ON mae.oid = pg_inherits.inhparent '
+            'WHERE mae.relname = %s',
+            [TABELA],
+        )
+        nomes = [linha[0] for linha in cursor.fetchall()]
+
+    meses = []
+    for nome in nomes:
+        encontrado = re.fullmatch(rf'{TABELA}_p(\d{{4}})(\d{{2}})', nome)
+        if encontrado:
+            meses.append(datetime.date(int(encontrado[1]), int(encontrado[2]), 1))
+    return sorted(meses)
+
+
+def criar_particao(mes, connection=conexao_padrao):
+    """
+    Cria a particao do mes. Linhas do periodo que ja estejam na particao
+    padrao sao movidas para ela antes do ATTACH, que falharia com elas la.
+    """
+    nome = nome_particao(mes)
+    inicio, fim = (f"'{limite.isoformat()}'" for limite in limites(mes))
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {nome} (LIKE {TABELA} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH movidas AS ('
+            f'DELETE FROM {TABELA_PADRAO} WHERE data_movimentacao >= {inicio} AND data_movimentacao < {fim} '
+            f'RETURNING *) INSERT INTO {nome} SELECT * FROM movidas'
+        )
+        cursor.execute(f'ALTER TABLE {TABELA} ATTACH PARTITION {nome} FOR VALUES FROM ({inicio}) TO ({fim})')
+
+
+def garantir_particoes(meses_a_frente=3, desde=None, connection=conexao_padrao):
+    """
+    Cria as particoes que faltam, do mes de ``desde`` (ou do mes atual) ate
+    ``meses_a_frente`` meses adiante. Retorna os meses criados.
+    """
+    if connection.vendor != 'postgresql':
+        return []
+
+    atual = _mes_utc(timezone.now())
+    primeiro = _mes_utc(desde) if desde else atual
+    existentes = set(particoes(connection))
+    criadas = []
+    with transaction.atomic(using=connection.alias):
+        for mes in meses_entre(primeiro, inicio_do_mes(atual, meses_a_frente)):
+            if mes not in existentes:
+                criar_particao(mes, connection)
+                criadas.append(mes)
+    return criadas
+
+
+# === TABELA DE ARQUIVO (SQLITE) ===
+
+def mover_para_tabela_arquivo(antes_de, connection=conexao_padrao):
+    """Move as movimentacoes anteriores a ``antes_de`` para a tabela de arquivo."""
+    if connection.vendor != 'sqlite':
+        return 0
+
+    colunas = ', '.join(COLUNAS)
+    limite = connection.ops.adapt_datetimefield_value(antes_de)
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {TABELA_ARQUIVO} ({colunas}) '
+            f'SELECT {colunas} FROM {TABELA} WHERE data_movimentacao < %s',
+            [limite],
+        )
+        cursor.execute(f'DELETE FROM {TABELA} WHERE data_movimentacao < %s', [limite])
+        return cursor.rowcount
+
+
+# === ARQUIVOS JSONL ===
+
+def diretorio_arquivo():
+    return Path(settings.ARQUIVO_MOVIMENTACOES_DIR)
+
+
+def _caminhos(mes, destino):
+    nome = f'movimentacoes-{mes:%Y-%m}'
+    return Path(destino) / f'{nome}.jsonl.gz', Path(destino) / f'{nome}.indice.json'
+
+
+def _origem(connection):
+    """Tabela de onde saem os meses arquivados."""
+    if connection.vendor == 'postgresql':
+        return TABELA
+    if connection.vendor == 'sqlite':
+        return TABELA_ARQUIVO
+    return TABELA
+
+
+def meses_para_arquivar(antes_de, connection=conexao_padrao):
+    """Meses anteriores a ``antes_de`` com movimentacoes ainda no banco."""
+    if connection.vendor == 'postgresql':
+        limite = _mes_utc(antes_de)
+        meses = {mes for mes in particoes(connection) if mes < limite}
+        # Linhas antigas que cairam na particao padrao (meses sem particao
+        # propria na epoca da insercao) tambem precisam ser arquivadas
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT DISTINCT date_trunc('month', data_movimentacao AT TIME ZONE 'UTC') "
+                f'FROM {TABELA_PADRAO} WHERE data_movimentacao < %s',
+                [limites(limite)[0]],
+            )
+            meses.update(linha[0].date() for linha in cursor.fetchall())
+        return sorted(meses)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT MIN(data_movimentacao) FROM {_origem(connection)} WHERE data_movimentacao < %s',
+            [connection.ops.adapt_datetimefield_value(antes_de)],
+        )
+        primeira = cursor.fetchone()[0]
+    if primeira is None:
+        return []
+    if isinstance(primeira, str):
+        primeira = parse_datetime(primeira)
+    return list(meses_entre(_mes_utc(primeira), inicio_do_mes(_mes_utc(antes_de), -1)))
+
+
+def _data_iso(valor):
+    if isinstance(valor, str):
+        valor = parse_datetime(valor)
+    if timezone.is_naive(valor):
+        valor = timezone.make_aware(valor, datetime.timezone.utc)
+    return valor.isoformat()
+
+
+def arquivar_mes(mes, destino=None, connection=conexao_padrao):
+    """
+    Grava as movimentacoes do mes em JSONL comprimido e as remove do banco.
+    O arquivo e gravado por inteiro (e renomeado) antes da remocao; se o
+    processo parar no meio, repetir o comando completa o mesmo arquivo.
+    Retorna o numero de movimentacoes no arquivo do mes.
+    """
+    if connection.vendor == 'postgresql' and mes not in particoes(connection):
+        # Mes so com linhas na particao padrao: a particao nova as recebe e e
+        # descartada inteira ao final, como as demais
+        with transaction.atomic(using=connection.alias):
+            criar_particao(mes, connection)
+
+    destino = Path(destino or diretorio_arquivo())
+    destino.mkdir(parents=True, exist_ok=True)
+    caminho, caminho_indice = _caminhos(mes, destino)
+    inicio, fim = (connection.ops.adapt_datetimefield_value(limite) for limite in limites(mes))
+    origem = _origem(connection)
+
+    pedidos = set()
+    ja_arquivadas = set()
+    total = 0
+    temporario = caminho.with_name(caminho.name + '.tmp')
+    with gzip.open(temporario, 'wt', encoding='utf-8') as saida:
+        # Um arquivo ja existente do mesmo mes (execucao interrompida) e mantido
+        if caminho.exists():
+            with gzip.open(caminho, 'rt', encoding='utf-8') as anterior:
+                for linha in anterior:
+                    registro = json.loads(linha)
+                    saida.write(linha)
+                    ja_arquivadas.add(registro['id'])
+                    pedidos.add(registro['pedido_id'])
+                    total += 1
+
+        # chunked_cursor: cursor do lado do servidor no PostgreSQL, sem carregar o mes inteiro
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(
+                f'SELECT {", ".join(COLUNAS)} FROM {origem} '
+                f'WHERE data_movimentacao >= %s AND data_movimentacao < %s '
+                f'ORDER BY pedido_id, data_movimentacao, id',
+                [inicio, fim],
+            )
+            while True:
+                linhas = cursor.fetchmany(2000)
+                if not linhas:
+                    break
+                for linha in linhas:
+                    registro = dict(zip(COLUNAS, linha))
+                    if registro['id'] in ja_arquivadas:
+                        continue
+                    registro['data_movimentacao'] = _data_iso(registro['data_movimentacao'])
+                    saida.write(json.dumps(registro, ensure_ascii=False) + '\n')
+                    pedidos.add(registro['pedido_id'])
+                    total += 1
+
+    if total:
+        os.replace(temporario, caminho)
+        caminho_indice.write_text(json.dumps({'movimentacoes': total, 'pedidos': sorted(pedidos)}))
+    else:
+        temporario.unlink()
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            particao = nome_particao(mes)
+            cursor.execute(f'ALTER TABLE {TABELA} DETACH PARTITION {particao}')
+            cursor.execute(f'DROP TABLE {particao}')
+        else:
+            cursor.execute(
+                f'DELETE FROM {origem} WHERE data_movimentacao >= %s AND data_movimentacao < %s',
+                [inicio, fim],
+            )
+    return total
+
+
+def movimentacoes_arquivadas(pedido_id, destino=None):
+    """
+    Movimentacoes de ``pedido_id`` nos arquivos JSONL, como instancias nao
+    salvas. Pelos indices, so os meses que tem o pedido sao descomprimidos.
+    """
+    destino = Path(destino or diretorio_arquivo())
+    movimentacoes = []
+    for caminho_indice in sorted(destino.glob('movimentacoes-*.indice.json')):
+        if pedido_id not in json.loads(caminho_indice.read_text())['pedidos']:
+            continue
+        caminho = caminho_indice.with_name(caminho_indice.name.replace('.indice.json', '.jsonl.gz'))
+        with gzip.open(caminho, 'rt', encoding='utf-8') as entrada:
+            for linha in entrada:
+                registro = json.loads(linha)
+                if registro['pedido_id'] == pedido_id:
+                    registro['data_movimentacao'] = parse_datetime(registro['data_movimentacao'])
+                    movimentacoes.append(MovimentacaoPedido(**registro))
+    return movimentacoes
+
+
+def historico_pedido(pedido_id, destino=None, connection=conexao_padrao):
+    """
+    Todas as movimentacoes do pedido, da mais recente para a mais antiga:
+    tabela principal, tabela de arquivo (SQLite) e arquivos JSONL.
+    """
+    movimentacoes = list(
+        MovimentacaoPedido.objects.using(connection.alias).filter(pedido_id=pedido_id).select_related('usuario')
+    )
+    if connection.vendor == 'sqlite':
+        movimentacoes += list(MovimentacaoPedido.objects.using(connection.alias).raw(
+            f'SELECT {", ".join(COLUNAS)} FROM {TABELA_ARQUIVO} WHERE pedido_id = %s', [pedido_id]
+        ))
+    movimentacoes += movimentacoes_arquivadas(pedido_id, destino)
+    movimentacoes.sort(key=lambda m: (m.data_movimentacao, m.pk), reverse=True)
+    return movimentacoes
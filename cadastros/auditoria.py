@@ -0,0 +1,144 @@
+"""
+Registro das movimentacoes de pedido (auditoria).
+
+As entradas de uma operacao sao acumuladas em um RegistroMovimentacoes e
+gravadas em um unico bulk_create quando a transacao e confirmada
+(``transaction.on_commit``); se ela for desfeita, nada e gravado.
+
+Com ``AUDITORIA_ADIADA = True`` nas settings, a gravacao sai da requisicao:
+no commit as entradas vao para a fila de uma thread de fundo, que junta as
+filas de varias requisicoes em um mesmo bulk_create. Nesse modo a
+data_movimentacao e a da gravacao, alguns milissegundos depois, e as
+entradas ainda na fila se perdem se o processo for morto.
+"""
+import atexit
+import logging
+import queue
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import MovimentacaoPedido
+
+logger = logging.getLogger(__name__)
+
+
+class RegistroMovimentacoes:
+    """
+    Coleta as movimentacoes de uma operacao. Usado como gerenciador de
+    contexto, abre uma transacao e agenda a gravacao para o commit dela:
+
+        with RegistroMovimentacoes(request.user) as auditoria:
+            pedido = form.save(auditoria=auditoria)
+            auditoria.registrar(pedido, 'criacao', status_novo=pedido.status)
+    """
+
+    def __init__(self, usuario=None, using=None):
+        self.usuario = usuario
+        self.using = using
+        self.entradas = []
+
+    def registrar(self, pedido, tipo, observacao='', status_anterior=None, status_novo=None):
+        self.entradas.append(MovimentacaoPedido(
+            pedido_id=pedido.pk,
+            tipo=tipo,
+            status_anterior=status_anterior,
+            status_novo=status_novo,
+            observacao=observacao,
+            usuario=self.usuario,
+        ))
+
+    def registrar_itens(self, adicionados=(), removidos=()):
+        """Uma entrada adicao_item/remocao_item para cada ItemPedido."""
+        for tipo, itens in (('adicao_item', adicionados), ('remocao_item', removidos)):
+            for item in itens:
+                self.entradas.append(MovimentacaoPedido(
+                    pedido_id=item.pedido_id,
+                    tipo=tipo,
+                    observacao=f'{item.quantidade}x {item.item.nome} a R$ {item.valor_unitario}',
+                    usuario=self.usuario,
+                ))
+
+    def agendar(self):
+        """Agenda a gravacao das entradas coletadas para o commit da transacao atual."""
+        entradas, self.entradas = self.entradas, []
+        if entradas:
+            transaction.on_commit(partial(gravar_movimentacoes, entradas), using=self.using)
+
+    def __enter__(self):
+        self._atomic = transaction.atomic(using=self.using)
+        self._atomic.__enter__()
+        return self
+
+    def __exit__(self, tipo, valor, traceback):
+        if tipo is None:
+            self.agendar()
+        else:
+            self.entradas = []
+        return self._atomic.__exit__(tipo, valor, traceback)
+
+
+def gravar_movimentacoes(entradas):
+    """Grava as entradas agora ou, no modo adiado, entrega-as a thread de fundo."""
+    if getattr(settings, 'AUDITORIA_ADIADA', False):
+        gravador.enviar(entradas)
+    else:
+        MovimentacaoPedido.objects.bulk_create(entradas)
+
+
+class GravadorAdiado:
+    """Thread de fundo que grava as movimentacoes recebidas pela fila."""
+
+    def __init__(self, tamanho_lote=500):
+        self.tamanho_lote = tamanho_lote
+        self.fila = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enviar(self, entradas):
+        self._iniciar()
+        self.fila.put(entradas)
+
+    def esperar(self):
+        """Bloqueia ate as entradas enviadas serem gravadas."""
+        self.fila.join()
+
+    def _iniciar(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is None:
+                    # Tenta esvaziar a fila quando o processo termina normalmente
+                    atexit.register(self.esperar)
+                self._thread = threading.Thread(target=self._executar, name='auditoria-pedidos', daemon=True)
+                self._thread.start()
+
+    def _executar(self):
+        while True:
+            lote = self.fila.get()
+            recebidos = 1
+            # Junta o que mais estiver na fila em um mesmo bulk_create
+            while len(lote) < self.tamanho_lote:
+                try:
+                    lote = lote + self.fila.get_nowait()
+                except queue.Empty:
+                    break
+                recebidos += 1
+            try:
+                self.gravar(lote)
+            finally:
+                for _ in range(recebidos):
+                    self.fila.task_done()
+
+    def gravar(self, lote):
+        try:
+            MovimentacaoPedido.objects.bulk_create(lote, batch_size=self.tamanho_lote)
+        except Exception:
+            logger.exception('Falha ao gravar %d movimentacoes de pedido', len(lote))
+        finally:
+            # A thread nao passa pelos sinais de fim de requisicao
+            close_old_connections()
+
+
+gravador = GravadorAdiado()
@@ -0,0 +1,70 @@
+"""
+Busca por trecho de texto nos campos usados pelos filtros de pedidos.
+
+Um ``icontains`` vira ``UPPER(campo) LIKE '%termo%'``, que nenhum indice
+B-tree atende. A migracao 0004 cria, para cada campo de CAMPOS_BUSCA:
+
+* no PostgreSQL, um indice GIN ``pg_trgm`` sobre ``UPPER(campo::text)``, a
+  mesma expressao que o ``icontains`` gera, entao o LIKE passa a usar o indice
+  sem mudar a consulta;
+* no SQLite, uma tabela virtual FTS5 com tokenizador de trigramas, mantida
+  por triggers, consultada aqui com MATCH.
+
+``ids_contendo`` devolve os ids que casam com o termo como subconsulta, para
+que o filtro use ``campo_id IN (...)`` em vez de um JOIN com a tabela buscada.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.expressions import RawSQL
+
+from .models import Fornecedor, Frota
+
+# Campos com indice de busca (modelo, campo)
+CAMPOS_BUSCA = [
+    (Fornecedor, 'nome'),
+    (Frota, 'prefixo'),
+]
+
+# Trigramas so casam termos com pelo menos 3 caracteres
+TAMANHO_MINIMO_TERMO = 3
+
+# Tabelas FTS encontradas por banco, para nao consultar o catalogo a cada busca
+_tabelas_fts = {}
+
+
+def tabela_busca(modelo, campo):
+    """Nome da tabela FTS5 (SQLite) do campo."""
+    return f'{modelo._meta.db_table}_{campo}_fts'
+
+
+def _tem_tabela_fts(connection, tabela):
+    if connection.vendor != 'sqlite':
+        return False
+
+    chave = (connection.alias, connection.settings_dict['NAME'])
+    if chave not in _tabelas_fts:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE %s", ['%_fts'])
+            _tabelas_fts[chave] = {nome for nome, in cursor.fetchall()}
+    return tabela in _tabelas_fts[chave]
+
+
+def _frase(termo):
+    # Entre aspas o termo e uma frase: casa trigramas consecutivos, ou seja,
+    # o trecho exato, sem interpretar operadores da sintaxe do FTS5
+    return '"%s"' % termo.replace('"', '""')
+
+
+def ids_contendo(modelo, campo, termo, using=DEFAULT_DB_ALIAS):
+    """
+    Subconsulta com os ids de ``modelo`` cujo ``campo`` contem ``termo``
+    (sem diferenciar maiusculas), para uso em filtros ``__in``.
+    """
+    connection = connections[using]
+    tabela = tabela_busca(modelo, campo)
+
+    if len(termo) >= TAMANHO_MINIMO_TERMO and _tem_tabela_fts(connection, tabela):
+        tabela = connection.ops.quote_name(tabela)
+        return RawSQL(f'SELECT rowid FROM {tabela} WHERE {tabela} MATCH %s', [_frase(termo)])
+
+    # PostgreSQL (indice de trigramas) e termos curtos no SQLite
+    return modelo.objects.using(using).filter(**{f'{campo}__icontains': termo}).values('pk')
@@ -0,0 +1,33 @@
+"""
+Contadores por usuario mantidos no cache.
+
+O total de pedidos de um usuario aparece em toda pagina da lista de pedidos,
+mas so muda quando um pedido e criado ou excluido. Ele e lido do resumo
+diario (uma linha por dia, nao por pedido) e fica em cache ate a proxima
+criacao/exclusao, que o descarta (ver signals.py).
+"""
+from django.core.cache import cache
+from django.db.models import Sum
+
+from .models import ResumoDiarioPedido
+
+TIMEOUT_CONTADORES = 300  # segundos
+
+
+def _chave_total_pedidos(user_id):
+    return f'pedidos:{user_id}:total'
+
+
+def total_pedidos(user):
+    """Total de pedidos do usuario, sem filtros."""
+    def calcular():
+        total = ResumoDiarioPedido.objects.filter(criado_por=user).aggregate(
+            total=Sum('num_pedidos')
+        )['total']
+        return total or 0
+
+    return cache.get_or_set(_chave_total_pedidos(user.pk), calcular, TIMEOUT_CONTADORES)
+
+
+def invalidar_total_pedidos(user_id):
+    cache.delete(_chave_total_pedidos(user_id))
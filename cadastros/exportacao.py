@@ -0,0 +1,206 @@
+"""
+Exportacao da lista de pedidos em CSV e XLSX, gerada sob demanda.
+
+As linhas saem de uma unica consulta ``values_list`` percorrida com
+``iterator()``: nenhuma instancia de modelo e criada e o resultado nunca fica
+inteiro na memoria. Os geradores deste modulo produzem o arquivo em blocos
+para um StreamingHttpResponse.
+"""
+import csv
+import re
+import zipfile
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .models import Pedido
+
+# Linhas buscadas do banco por vez
+TAMANHO_LOTE = 2000
+
+CABECALHO = (
+    'Tipo', 'Pedido', 'Data do pedido', 'Fornecedor', 'Status', 'Previsão de entrega',
+    'Descrição', 'Item', 'Frota', 'Quantidade', 'Valor unitário', 'Valor total',
+)
+
+STATUS = dict(Pedido.STATUS_CHOICES)
+
+# Uma linha por item; pedidos sem itens aparecem uma vez com os campos do item nulos
+CAMPOS = (
+    'id', 'data_pedido', 'fornecedor__nome', 'status', 'previsao_entrega', 'descricao',
+    'itempedido__id', 'itempedido__item__nome', 'itempedido__frota__prefixo',
+    'itempedido__quantidade', 'itempedido__valor_unitario',
+)
+
+
+def linhas_exportacao(pedidos, tamanho_lote=TAMANHO_LOTE):
+    """
+    Gera o cabecalho, uma linha de totais por pedido seguida das linhas dos
+    seus itens e, ao final, o total geral. Apenas os itens do pedido corrente
+    ficam em memoria.
+    """
+    yield CABECALHO
+
+    linhas = pedidos.order_by(
+        '-data_pedido', '-id', 'itempedido__item_id', 'itempedido__id'
+    ).values_list(*CAMPOS).iterator(chunk_size=tamanho_lote)
+
+    num_pedidos = 0
+    quantidade_geral = 0
+    valor_geral = Decimal('0')
+
+    for pedido_id, grupo in groupby(linhas, key=itemgetter(0)):
+        grupo = list(grupo)
+        _, data_pedido, fornecedor, status, previsao, descricao = grupo[0][:6]
+
+        itens = []
+        for *_, item_pedido_id, item, frota, quantidade, valor_unitario in grupo:
+            if item_pedido_id is not None:
+                itens.append(('Item', pedido_id, '', '', '', '', '', item, frota or '',
+                              quantidade, valor_unitario, quantidade * valor_unitario))
+
+        quantidade_pedido = sum(linha[9] for linha in itens)
+        valor_pedido = sum((linha[11] for linha in itens), Decimal('0'))
+
+        yield (
+            'Pedido', pedido_id, timezone.localtime(data_pedido), fornecedor, STATUS.get(status, status),
+            previsao, descricao, '', '', quantidade_pedido, '', valor_pedido,
+        )
+        yield from itens
+
+        num_pedidos += 1
+        quantidade_geral += quantidade_pedido
+        valor_geral += valor_pedido
+
+    yield ('Total geral', num_pedidos, '', '', '', '', '', '', '', quantidade_geral, '', valor_geral)
+
+
+def _texto(valor):
+    """Representacao textual de um valor, no formato usado no Brasil."""
+    if valor is None:
+        return ''
+    if hasattr(valor, 'hour'):
+        return valor.strftime('%d/%m/%Y %H:%M')
+    if hasattr(valor, 'strftime'):
+        return valor.strftime('%d/%m/%Y')
+    if isinstance(valor, Decimal):
+        return str(valor).replace('.', ',')
+    return str(valor)
+
+
+class _Eco:
+    """Pseudo-arquivo que devolve o que recebe, para o csv.writer."""
+
+    def write(self, valor):
+        return valor
+
+
+def gerar_csv(linhas):
+    """CSV separado por ponto e virgula, como o Excel em portugues espera."""
+    escritor = csv.writer(_Eco(), delimiter=';')
+    # BOM para o Excel reconhecer o UTF-8
+    yield '\ufeff'
+    for linha in linhas:
+        yield escritor.writerow([_texto(valor) for valor in linha])
+
+
+class _Saida:
+    """
+    Arquivo somente de escrita e sem seek: o zipfile grava os membros com
+    descritores de dados, e o que foi escrito e retirado a cada bloco.
+    """
+
+    def __init__(self):
+        self.partes = []
+        self.posicao = 0
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        self.posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self.posicao
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+# Caracteres de controle nao permitidos em XML
+_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_ARQUIVOS_XLSX = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Pedidos" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _celula_xlsx(valor):
+    if isinstance(valor, (int, Decimal)) and not isinstance(valor, bool):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(_INVALIDOS_XML.sub('', _texto(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def gerar_xlsx(linhas, linhas_por_bloco=500):
+    """
+    Planilha XLSX minima (uma aba, textos inline, sem estilos) montada
+    diretamente no formato SpreadsheetML, sem depender de bibliotecas externas.
+    """
+    saida = _Saida()
+    with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_DEFLATED) as arquivo:
+        for nome, conteudo in _ARQUIVOS_XLSX.items():
+            arquivo.writestr(nome, conteudo)
+        yield saida.retirar()
+
+        with arquivo.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as planilha:
+            planilha.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetData>'
+            )
+            for numero, linha in enumerate(linhas, start=1):
+                planilha.write(f'<row>{"".join(_celula_xlsx(v) for v in linha)}</row>'.encode())
+                if numero % linhas_por_bloco == 0:
+                    yield saida.retirar()
+            planilha.write(b'</sheetData></worksheet>')
+
+    yield saida.retirar()
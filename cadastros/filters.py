@@ -1,12 +1,14 @@
 import django_filters
+from dal import autocomplete
 from django import forms
-from .models import Pedido, Fornecedor, Item, Frota
+from .busca import ids_contendo
+from .models import Pedido, Fornecedor, Item, Frota, ItemPedido
 
 
 class PedidoFilter(django_filters.FilterSet):
     fornecedor__nome = django_filters.CharFilter(
         field_name='fornecedor__nome',
-        lookup_expr='icontains',
+        method='filtrar_nome_fornecedor',
         label='Nome do Fornecedor',
         widget=forms.TextInput(attrs={
             'class': 'form-control',
@@ -18,7 +20,13 @@ class PedidoFilter(django_filters.FilterSet):
         queryset=Fornecedor.objects.all(),
         label='Fornecedor (seleção)',
         empty_label='Selecione um fornecedor',
-        widget=forms.Select(attrs={'class': 'form-select'})
+        # Renderiza só o fornecedor escolhido; os demais vêm do autocomplete
+        widget=autocomplete.ModelSelect2(url='autocomplete-fornecedor', attrs={
+            'class': 'form-select',
+            'data-placeholder': 'Selecione um fornecedor',
+            'data-allow-clear': 'true',
+            'data-width': '100%'
+        })
     )
 
     status = django_filters.ChoiceFilter(
@@ -70,13 +78,12 @@ class PedidoFilter(django_filters.FilterSet):
 
     itempedido__frota__prefixo = django_filters.CharFilter(
         field_name='itempedido__frota__prefixo',
-        lookup_expr='icontains',
+        method='filtrar_prefixo_frota',
         label='Prefixo da Frota',
         widget=forms.TextInput(attrs={
             'class': 'form-control',
             'placeholder': 'Ex: 01-001, 05-002...'
-        }),
-        distinct=True
+        })
     )
 
     class Meta:
@@ -87,9 +94,17 @@ class PedidoFilter(django_filters.FilterSet):
         super().__init__(data, queryset, request=request, prefix=prefix)
 
         if request and hasattr(request, 'user') and request.user.is_authenticated:
-            self.filters['fornecedor'].queryset = Fornecedor.objects.select_related(
-                'cidade', 'estado'
-            ).filter(
-                criado_por=request.user
-            ).order_by('nome')
+            self.filters['fornecedor'].queryset = Fornecedor.objects.filter(criado_por=request.user)
+
+    def filtrar_nome_fornecedor(self, queryset, name, value):
+        # Os ids saem do índice de busca (ver busca.py), sem JOIN com fornecedor
+        return queryset.filter(fornecedor_id__in=ids_contendo(Fornecedor, 'nome', value, using=queryset.db))
+
+    def filtrar_prefixo_frota(self, queryset, name, value):
+        # Subconsulta em vez de JOIN com os itens: cada pedido aparece uma
+        # única vez, sem precisar de distinct
+        itens = ItemPedido.objects.filter(
+            frota_id__in=ids_contendo(Frota, 'prefixo', value, using=queryset.db)
+        ).values('pedido_id')
+        return queryset.filter(pk__in=itens)
 
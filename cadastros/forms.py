@@ -1,9 +1,17 @@
+from dal import autocomplete
 from django import forms
+from django.db import transaction
 from django.forms import inlineformset_factory
-from .models import Pedido, ItemPedido, Fornecedor, Item, Frota
+from naes2025.metricas import DURACAO_FORMULARIO
+from paginasweb.cache_dashboard import invalidar_snapshot
+from . import resumo
+from .models import Fornecedor, Frota, Item, Pedido, ItemPedido
+from .opcoes import CampoEscolhaCompartilhada, OpcoesCompartilhadasFormMixin, opcoes_pedido
+from .referencia import opcoes_referencia
+from .totais import CENTAVO
 
 
-class PedidoForm(forms.ModelForm):
+class PedidoForm(OpcoesCompartilhadasFormMixin, forms.ModelForm):
     previsao_entrega = forms.DateField(
         required=False,
         widget=forms.DateInput(attrs={
@@ -17,10 +25,16 @@ class PedidoForm(forms.ModelForm):
     class Meta:
         model = Pedido
         fields = ['fornecedor', 'descricao', 'previsao_entrega', 'status']
+        field_classes = {'fornecedor': CampoEscolhaCompartilhada}
+        # As opções são buscadas pelo autocomplete; o widget renderiza só a
+        # escolhida, a partir das choices de OpcoesCompartilhadas (uma lista,
+        # por isso ListSelect2 e não ModelSelect2)
         widgets = {
-            'fornecedor': forms.Select(attrs={
+            'fornecedor': autocomplete.ListSelect2(url='autocomplete-fornecedor', attrs={
                 'class': 'form-select',
-                'id': 'id_fornecedor'
+                'id': 'id_fornecedor',
+                'data-placeholder': 'Selecione um fornecedor',
+                'data-width': '100%'
             }),
             'descricao': forms.Textarea(attrs={
                 'class': 'form-control',
@@ -39,14 +53,20 @@ class PedidoForm(forms.ModelForm):
         }
 
 
-class ItemPedidoForm(forms.ModelForm):
+class ItemPedidoForm(OpcoesCompartilhadasFormMixin, forms.ModelForm):
     class Meta:
         model = ItemPedido
         fields = ['item', 'quantidade', 'valor_unitario', 'frota']
+        field_classes = {
+            'item': CampoEscolhaCompartilhada,
+            'frota': CampoEscolhaCompartilhada,
+        }
         widgets = {
-            'item': forms.Select(attrs={
+            'item': autocomplete.ListSelect2(url='autocomplete-item', attrs={
                 'class': 'form-select item-select',
-                'required': True
+                'required': True,
+                'data-placeholder': 'Selecione um item',
+                'data-width': '100%'
             }),
             'quantidade': forms.NumberInput(attrs={
                 'class': 'form-control',
@@ -58,9 +78,12 @@ class ItemPedidoForm(forms.ModelForm):
                 'step': '0.01',
                 'min': '0.01'
             }),
-            'frota': forms.Select(attrs={
+            'frota': autocomplete.ListSelect2(url='autocomplete-frota', attrs={
                 'class': 'form-select',
-                'required': False
+                'required': False,
+                'data-placeholder': 'Selecione uma frota (opcional)',
+                'data-allow-clear': 'true',
+                'data-width': '100%'
             }),
         }
         labels = {
@@ -76,6 +99,10 @@ class ItemPedidoForm(forms.ModelForm):
         self.fields['item'].empty_label = "Selecione um item"
 
 
+# Campos gravados pelo bulk_update das linhas alteradas do pedido
+CAMPOS_ITEM_ATUALIZADOS = ['item', 'quantidade', 'valor_unitario', 'frota', 'criado_por']
+
+
 ItemPedidoFormSet = inlineformset_factory(
     Pedido,
     ItemPedido,
@@ -97,10 +124,14 @@ class PedidoComItensForm:
         self.user = user
         self.instance = instance
 
+        # Registros escolhidos nos selects, buscados uma vez e compartilhados
+        # por todos os forms (ver opcoes.py)
+        self.opcoes = opcoes_pedido(user) if user else None
+
         if instance:
-            self.pedido_form = PedidoForm(data=data, instance=instance)
+            self.pedido_form = PedidoForm(data=data, instance=instance, opcoes=self.opcoes)
         else:
-            class PedidoCreateForm(forms.ModelForm):
+            class PedidoCreateForm(OpcoesCompartilhadasFormMixin, forms.ModelForm):
                 previsao_entrega = forms.DateField(
                     required=False,
                     widget=forms.DateInput(attrs={
@@ -114,10 +145,13 @@ class PedidoComItensForm:
                 class Meta:
                     model = Pedido
                     fields = ['fornecedor', 'descricao', 'previsao_entrega']
+                    field_classes = {'fornecedor': CampoEscolhaCompartilhada}
                     widgets = {
-                        'fornecedor': forms.Select(attrs={
+                        'fornecedor': autocomplete.ListSelect2(url='autocomplete-fornecedor', attrs={
                             'class': 'form-select',
-                            'id': 'id_fornecedor'
+                            'id': 'id_fornecedor',
+                            'data-placeholder': 'Selecione um fornecedor',
+                            'data-width': '100%'
                         }),
                         'descricao': forms.Textarea(attrs={
                             'class': 'form-control',
@@ -130,55 +164,66 @@ class PedidoComItensForm:
                         'descricao': 'Descrição/Observações',
                     }
             
-            self.pedido_form = PedidoCreateForm(data=data)
+            self.pedido_form = PedidoCreateForm(data=data, opcoes=self.opcoes)
 
         self.item_formset = ItemPedidoFormSet(
             data=data,
             instance=instance,
-            prefix='itens'
+            prefix='itens',
+            form_kwargs={'opcoes': self.opcoes}
         )
-
-        if user:
-            self.pedido_form.fields['fornecedor'].queryset = Fornecedor.objects.select_related(
-                'cidade', 'estado'
-            ).filter(criado_por=user).order_by('nome')
-
-            for form in self.item_formset:
-                form.fields['item'].queryset = Item.objects.select_related(
-                    'categoria'
-                ).filter(criado_por=user).order_by('nome')
-
-                form.fields['frota'].queryset = Frota.objects.filter(
-                    criado_por=user
-                ).order_by('prefixo')
     
     def is_valid(self):
         return self.pedido_form.is_valid() and self.item_formset.is_valid()
 
-    def save(self, commit=True):
+    def save(self, commit=True, auditoria=None):
+        """
+        Salva o pedido e os itens em uma transação: linhas novas em um
+        bulk_create, alteradas em um bulk_update e excluídas em um único
+        DELETE. O valor total vem de uma agregação no banco. Com um
+        RegistroMovimentacoes em ``auditoria``, registra nele as adições e
+        remoções de itens.
+        """
         pedido = self.pedido_form.save(commit=False)
         if self.user:
             pedido.criado_por = self.user
 
-        if commit:
+        if not commit:
+            return pedido
+
+        with DURACAO_FORMULARIO.cronometrar(formulario='pedido'), transaction.atomic():
+            # Totais dos itens antes das escritas, para ajustar o resumo diário
+            if pedido.pk:
+                quantidade_anterior, valor_anterior = resumo.totais_itens(pedido.pk)
+            else:
+                quantidade_anterior, valor_anterior = 0, 0
+
             pedido.save()
 
             self.item_formset.instance = pedido
-            itens_modificados = self.item_formset.save(commit=False)
+            self.item_formset.save(commit=False)
 
-            for item in itens_modificados:
-                item.criado_por = self.user
-                item.save()
+            novos = self.item_formset.new_objects
+            alterados = [item for item, _ in self.item_formset.changed_objects]
+            for item in novos + alterados:
+                item.criado_por = self.user or pedido.criado_por
 
-            for item in self.item_formset.deleted_objects:
-                item.delete()
+            ItemPedido.objects.bulk_create(novos)
+            ItemPedido.objects.bulk_update(alterados, CAMPOS_ITEM_ATUALIZADOS)
 
-            valor_total = 0
-            for item_pedido in pedido.itempedido_set.all():
-                valor_total += item_pedido.quantidade * item_pedido.valor_unitario
+            excluidos = [item.pk for item in self.item_formset.deleted_objects]
+            if auditoria is not None:
+                auditoria.registrar_itens(novos, self.item_formset.deleted_objects)
+            if excluidos:
+                resumo.excluir_itens_do_pedido(ItemPedido.objects.filter(pedido=pedido, pk__in=excluidos))
 
-            pedido.valor_total = valor_total
-            pedido.save()
+            # As escritas em lote não disparam os sinais do resumo diário
+            _, valor_total = resumo.recalcular_pedido(pedido, quantidade_anterior, valor_anterior)
+            # No SQLite a soma volta em ponto flutuante, sem as casas decimais
+            pedido.valor_total = valor_total.quantize(CENTAVO)
+            Pedido.objects.filter(pk=pedido.pk).update(valor_total=pedido.valor_total)
+
+        invalidar_snapshot(pedido.criado_por_id)
 
         return pedido
 
@@ -189,4 +234,62 @@ class PedidoComItensForm:
             errors['pedido'] = self.pedido_form.errors
         if self.item_formset.errors:
             errors['itens'] = self.item_formset.errors
-        return errors
\ No newline at end of file
+        return errors
+
+class FornecedorForm(OpcoesCompartilhadasFormMixin, forms.ModelForm):
+    class Meta:
+        model = Fornecedor
+        fields = ['nome', 'cnpj', 'telefone', 'email', 'cidade', 'estado']
+        # Estado e cidade são renderizados e validados a partir do cache de
+        # referência (ver referencia.py), sem consultar o banco
+        field_classes = {
+            'cidade': CampoEscolhaCompartilhada,
+            'estado': CampoEscolhaCompartilhada,
+        }
+        widgets = {
+            # Com o estado preenchido, o autocomplete lista só as cidades dele
+            'cidade': autocomplete.ListSelect2(url='autocomplete-cidade', forward=['estado'], attrs={
+                'data-placeholder': 'Digite o nome da cidade',
+                'data-width': '100%'
+            }),
+        }
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('opcoes', opcoes_referencia())
+        super().__init__(*args, **kwargs)
+
+
+class FornecedorUpdateForm(FornecedorForm):
+    class Meta(FornecedorForm.Meta):
+        fields = ['nome', 'cnpj', 'telefone', 'email', 'cidade']
+
+
+class ItemPedidoAvulsoForm(forms.ModelForm):
+    """Item de pedido cadastrado fora do formulário do pedido."""
+
+    class Meta:
+        model = ItemPedido
+        fields = ['item', 'frota', 'pedido', 'status', 'quantidade', 'valor_unitario']
+        widgets = {
+            'item': autocomplete.ModelSelect2(url='autocomplete-item', attrs={
+                'data-placeholder': 'Selecione um item',
+                'data-width': '100%'
+            }),
+            'frota': autocomplete.ModelSelect2(url='autocomplete-frota', attrs={
+                'data-placeholder': 'Selecione uma frota (opcional)',
+                'data-allow-clear': 'true',
+                'data-width': '100%'
+            }),
+            'pedido': autocomplete.ModelSelect2(url='autocomplete-pedido', attrs={
+                'data-placeholder': 'Número do pedido ou nome do fornecedor',
+                'data-width': '100%'
+            }),
+        }
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Só os cadastros do usuário podem ser escolhidos
+        if user is not None:
+            self.fields['item'].queryset = Item.objects.filter(criado_por=user)
+            self.fields['frota'].queryset = Frota.objects.filter(criado_por=user)
+            self.fields['pedido'].queryset = Pedido.objects.select_related('fornecedor').filter(criado_por=user)
@@ -0,0 +1,380 @@
+"""
+Gerador deterministico de dados sinteticos em escala de producao.
+
+Cada usuario gerado e uma fatia independente: seus cadastros, pedidos,
+itens e movimentacoes saem de um random.Random semeado com
+``'{semente}:{indice}'``, entao o resultado nao depende da ordem nem do
+numero de processos usados. A distribuicao imita o uso real: poucos
+fornecedores concentram a maior parte dos pedidos e os itens seguem uma
+cauda longa (pesos de Zipf), ha mais pedidos recentes que antigos e os
+antigos em geral ja estao finalizados.
+
+A gravacao usa bulk_create em lotes ou, no PostgreSQL, COPY. Nenhum dos dois
+dispara sinais: o valor_total dos pedidos e calculado aqui e o resumo diario
+e reconstruido ao final (ver o comando popular_dados).
+"""
+import io
+import math
+import random
+import re
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from .models import (
+    CategoriaItem, Fornecedor, Frota, Item, ItemPedido, MovimentacaoPedido, Pedido, ResumoDiarioPedido,
+)
+
+RAMOS = ['Agro', 'Auto', 'Diesel', 'Mecânica', 'Distribuidora', 'Comercial', 'Pneus', 'Hidráulica', 'Elétrica', 'Tratores']
+REGIOES = ['Noroeste', 'Paraná', 'Vale', 'Norte', 'Central', 'Sul', 'Oeste', 'Brasil', 'Planalto', 'Cerrado']
+SUFIXOS = ['Ltda', 'ME', 'EIRELI', 'S.A.']
+CATEGORIAS = [
+    'Filtros', 'Pneus', 'Óleos e Lubrificantes', 'Freios', 'Suspensão', 'Elétrica', 'Motor', 'Transmissão',
+    'Hidráulica', 'Ferramentas', 'EPI', 'Limpeza', 'Rolamentos', 'Correias', 'Iluminação', 'Arrefecimento',
+]
+VEICULOS = ['Trator', 'Caminhão', 'Colheitadeira', 'Pulverizador', 'Caminhonete', 'Ônibus', 'Retroescavadeira']
+DESCRICOES = [
+    'Reposição de estoque', 'Manutenção preventiva', 'Manutenção corretiva', 'Compra emergencial',
+    'Revisão periódica', 'Preparação para a safra',
+]
+QUANTIDADES = [1, 1, 1, 1, 2, 2, 2, 3, 4, 5, 6, 10, 12, 20, 50]
+
+# Tabelas gravadas pelo gerador, na ordem em que as exclusoes as esvaziam
+TABELAS_GERADAS = (
+    MovimentacaoPedido, ItemPedido, ResumoDiarioPedido, Pedido, Fornecedor, Frota, Item, CategoriaItem,
+)
+
+
+@dataclass(frozen=True)
+class Escala:
+    """Quantidades geradas; todas, exceto ``usuarios``, sao por usuario."""
+    usuarios: int = 5
+    fornecedores: int = 200
+    categorias: int = 16
+    itens: int = 2000
+    frotas: int = 100
+    pedidos: int = 5000
+    itens_por_pedido: float = 4.0
+    dias: int = 730
+    lote: int = 2000
+
+
+@dataclass(frozen=True)
+class Tarefa:
+    """Um usuario a gerar; enviada aos processos do pool."""
+    indice: int
+    user_id: int
+    semente: int
+    escala: Escala
+    cidades: tuple
+    ate: datetime
+    usar_copy: bool
+
+
+def usuarios_gerados(prefixo):
+    """
+    Usuarios gerados com ``prefixo``: so os nomes ``{prefixo}`` seguidos dos
+    digitos do indice, nunca contas reais que so comecam com o prefixo.
+    """
+    return User.objects.filter(username__regex=rf'^{re.escape(prefixo)}[0-9]{{4,}}$').order_by('username')
+
+
+def criar_usuarios(prefixo, quantidade, senha):
+    """Cria ``quantidade`` usuarios ``{prefixo}0000``, ``{prefixo}0001``..."""
+    hash_senha = make_password(senha)
+    User.objects.bulk_create([
+        User(username=f'{prefixo}{indice:04d}', password=hash_senha) for indice in range(quantidade)
+    ])
+    return list(usuarios_gerados(prefixo))
+
+
+def remover_usuarios(usuarios):
+    """
+    Remove os usuarios e tudo que eles cadastraram com DELETEs diretos: a
+    exclusao pelo ORM buscaria e sinalizaria cada pedido e item.
+    """
+    ids = [usuario.pk for usuario in usuarios]
+    if not ids:
+        return
+    marcadores = ', '.join(['%s'] * len(ids))
+    pedidos = f'SELECT id FROM {Pedido._meta.db_table} WHERE criado_por_id IN ({marcadores})'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {MovimentacaoPedido._meta.db_table} WHERE pedido_id IN ({pedidos})', ids)
+        for model in TABELAS_GERADAS[1:]:
+            cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE criado_por_id IN ({marcadores})', ids)
+        User.objects.filter(pk__in=ids).delete()
+
+
+def analisar_tabelas():
+    """
+    Atualiza as estatisticas do planejador so das tabelas gravadas pelo
+    gerador, em vez de rodar ANALYZE no banco inteiro.
+    """
+    tabelas = [model._meta.db_table for model in TABELAS_GERADAS]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'ANALYZE {", ".join(tabelas)}')
+        elif connection.vendor == 'sqlite':
+            for tabela in tabelas:
+                cursor.execute(f'ANALYZE {tabela}')
+
+
+@contextmanager
+def datas_explicitas():
+    """
+    Desliga o auto_now_add das datas de pedido e movimentacao, para gravar as
+    datas geradas. Altera os campos do modelo no processo: uso so em comandos.
+    """
+    campos = [Pedido._meta.get_field('data_pedido'), MovimentacaoPedido._meta.get_field('data_movimentacao')]
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo in campos:
+            campo.auto_now_add = True
+
+
+def gerar_usuario(tarefa):
+    """Gera os dados de um usuario e retorna a contagem de linhas por modelo."""
+    with datas_explicitas():
+        return _GeradorUsuario(tarefa).gerar()
+
+
+class _GeradorUsuario:
+
+    def __init__(self, tarefa):
+        self.tarefa = tarefa
+        self.escala = tarefa.escala
+        self.user_id = tarefa.user_id
+        self.rng = random.Random(f'{tarefa.semente}:{tarefa.indice}')
+        self.contagem = Counter()
+
+    def gerar(self):
+        with transaction.atomic():
+            self.gerar_cadastros()
+        for inicio in range(0, self.escala.pedidos, self.escala.lote):
+            with transaction.atomic():
+                self.gerar_pedidos(min(self.escala.lote, self.escala.pedidos - inicio))
+        return self.contagem
+
+    # === CADASTROS ===
+
+    def gerar_cadastros(self):
+        rng, escala = self.rng, self.escala
+
+        nomes = CATEGORIAS[:escala.categorias] + [
+            f'Categoria {i}' for i in range(len(CATEGORIAS), escala.categorias)
+        ]
+        categorias = self.inserir(CategoriaItem, [CategoriaItem(nome=nome, criado_por_id=self.user_id) for nome in nomes])
+
+        itens = []
+        self.precos = []
+        for i in range(escala.itens):
+            categoria = categorias[i % len(categorias)]
+            itens.append(Item(
+                nome=f'{categoria.nome.split()[0]} {rng.choice("ABCDEFGHJKLMNPRSTUVWXZ")}{rng.randint(100, 9999)}',
+                categoria_id=categoria.pk, criado_por_id=self.user_id,
+            ))
+            # Precos log-normais: mediana perto de R$ 55, alguns itens caros
+            self.precos.append(max(100, int(math.exp(rng.gauss(4.0, 1.2)) * 100)))
+        self.itens = self.inserir(Item, itens)
+
+        fornecedores = []
+        for _ in range(escala.fornecedores):
+            cidade_id, estado_id = rng.choice(self.tarefa.cidades)
+            fornecedores.append(Fornecedor(
+                nome=f'{rng.choice(RAMOS)} {rng.choice(REGIOES)} {rng.choice(SUFIXOS)}',
+                cnpj=_cnpj(rng), telefone=f'(44) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}',
+                cidade_id=cidade_id, estado_id=estado_id, criado_por_id=self.user_id,
+            ))
+        self.fornecedores = self.inserir(Fornecedor, fornecedores)
+
+        self.frotas = self.inserir(Frota, [
+            Frota(
+                prefixo=f'{i // 100 + 1:02d}-{i % 100 + 1:03d}', descricao=rng.choice(VEICULOS),
+                ano=rng.randint(1995, 2025), criado_por_id=self.user_id,
+            )
+            for i in range(escala.frotas)
+        ])
+
+        # Ranking embaralhado por usuario: os mais pedidos nao sao os primeiros cadastrados
+        rng.shuffle(self.fornecedores)
+        self.ordem_itens = list(range(len(self.itens)))
+        rng.shuffle(self.ordem_itens)
+        self.pesos_fornecedores = _pesos_zipf(len(self.fornecedores), 1.2)
+        self.pesos_itens = _pesos_zipf(len(self.itens), 1.05)
+
+    # === PEDIDOS ===
+
+    def gerar_pedidos(self, quantidade):
+        rng, escala = self.rng, self.escala
+        fornecedores = rng.choices(self.fornecedores, cum_weights=self.pesos_fornecedores, k=quantidade)
+
+        pedidos, linhas = [], []
+        for fornecedor in fornecedores:
+            # Mais pedidos recentes que antigos
+            dias_atras = escala.dias * rng.random() ** 2
+            data_pedido = self.tarefa.ate - timedelta(days=dias_atras)
+            status = self.status_pedido(dias_atras)
+            previsao = None if rng.random() < 0.15 else data_pedido.date() + timedelta(days=rng.randint(3, 45))
+
+            itens = self.itens_pedido(status)
+            valor_total = sum(quantidade * valor for _, _, quantidade, valor, _ in itens)
+            pedidos.append(Pedido(
+                fornecedor_id=fornecedor.pk, descricao=rng.choice(DESCRICOES), data_pedido=data_pedido,
+                previsao_entrega=previsao, status=status, criado_por_id=self.user_id,
+                valor_total=Decimal(valor_total).scaleb(-2),
+            ))
+            linhas.append(itens)
+
+        pedidos = self.inserir(Pedido, pedidos, com_ids=True)
+
+        itens_pedido, movimentacoes = [], []
+        for pedido, itens in zip(pedidos, linhas):
+            movimentacoes.append(self.movimentacao(
+                pedido, 'criacao', pedido.data_pedido, status_novo='pendente',
+                observacao=f'Pedido criado com {len(itens)} itens. Valor total: R$ {pedido.valor_total}',
+            ))
+            for indice_item, frota, quantidade, valor, status in itens:
+                item = self.itens[indice_item]
+                valor_unitario = Decimal(valor).scaleb(-2)
+                itens_pedido.append(ItemPedido(
+                    item_id=item.pk, frota_id=frota.pk if frota else None, pedido_id=pedido.pk, status=status,
+                    quantidade=quantidade, valor_unitario=valor_unitario, criado_por_id=self.user_id,
+                ))
+                movimentacoes.append(self.movimentacao(
+                    pedido, 'adicao_item', pedido.data_pedido,
+                    observacao=f'{quantidade}x {item.nome} a R$ {valor_unitario}',
+                ))
+            movimentacoes += self.mudancas_status(pedido)
+
+        self.inserir(ItemPedido, itens_pedido)
+        self.inserir(MovimentacaoPedido, movimentacoes)
+
+    def status_pedido(self, dias_atras):
+        if dias_atras > 60:
+            return self.rng.choices(['finalizado', 'em_andamento', 'pendente'], weights=[90, 7, 3])[0]
+        return self.rng.choices(['pendente', 'em_andamento', 'finalizado'], weights=[40, 35, 25])[0]
+
+    def itens_pedido(self, status_pedido):
+        """Linhas (indice do item, frota, quantidade, valor em centavos, status)."""
+        rng = self.rng
+        media_extra = max(self.escala.itens_por_pedido - 1, 0)
+        quantidade_linhas = 1 + min(int(rng.expovariate(1 / media_extra)) if media_extra else 0, 49)
+        escolhidos = rng.choices(self.ordem_itens, cum_weights=self.pesos_itens, k=quantidade_linhas)
+
+        linhas = []
+        for indice_item in escolhidos:
+            frota = rng.choice(self.frotas) if self.frotas and rng.random() < 0.8 else None
+            valor = int(self.precos[indice_item] * rng.uniform(0.9, 1.1))
+            if status_pedido == 'finalizado':
+                status = rng.choices(['entregue', 'rejeitado'], weights=[95, 5])[0]
+            elif status_pedido == 'em_andamento':
+                status = rng.choice(['pendente', 'aprovado', 'aprovado', 'entregue'])
+            else:
+                status = 'pendente'
+            linhas.append((indice_item, frota, rng.choice(QUANTIDADES), valor, status))
+        return linhas
+
+    def mudancas_status(self, pedido):
+        caminho = {'pendente': [], 'em_andamento': ['em_andamento'], 'finalizado': ['em_andamento', 'finalizado']}
+        nomes = dict(Pedido.STATUS_CHOICES)
+        anterior, data = 'pendente', pedido.data_pedido
+        movimentacoes = []
+        for status in caminho[pedido.status]:
+            data = min(data + timedelta(hours=self.rng.uniform(2, 24 * 15)), self.tarefa.ate)
+            movimentacoes.append(self.movimentacao(
+                pedido, 'alteracao_status', data, status_anterior=anterior, status_novo=status,
+                observacao=f'Status alterado de "{nomes[anterior]}" para "{nomes[status]}"',
+            ))
+            anterior = status
+        return movimentacoes
+
+    def movimentacao(self, pedido, tipo, data, observacao='', status_anterior=None, status_novo=None):
+        return MovimentacaoPedido(
+            pedido_id=pedido.pk, tipo=tipo, observacao=observacao, data_movimentacao=data,
+            status_anterior=status_anterior, status_novo=status_novo, usuario_id=self.user_id,
+        )
+
+    # === GRAVACAO ===
+
+    def inserir(self, model, objetos, com_ids=False):
+        """Grava ``objetos``; os cadastros e, com ``com_ids``, os pedidos voltam com pk."""
+        self.contagem[model._meta.verbose_name_plural] += len(objetos)
+        if not objetos:
+            return objetos
+        if self.tarefa.usar_copy and (com_ids or model in (ItemPedido, MovimentacaoPedido)):
+            return copiar(model, objetos, com_ids)
+        return model.objects.bulk_create(objetos, batch_size=self.escala.lote)
+
+
+def copiar(model, objetos, com_ids=False):
+    """
+    Grava ``objetos`` com COPY (PostgreSQL). Com ``com_ids``, os ids sao
+    reservados antes na sequencia da tabela e atribuidos aos objetos.
+    """
+    tabela = model._meta.db_table
+    campos = [campo for campo in model._meta.concrete_fields if com_ids or not campo.primary_key]
+
+    with connection.cursor() as cursor:
+        if com_ids:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [tabela, len(objetos)],
+            )
+            for objeto, (pk,) in zip(objetos, cursor.fetchall()):
+                objeto.pk = pk
+
+        buffer = io.StringIO()
+        for objeto in objetos:
+            buffer.write(linha_copy(
+                campo.get_db_prep_save(getattr(objeto, campo.attname), connection) for campo in campos
+            ))
+        buffer.seek(0)
+        colunas = ', '.join(connection.ops.quote_name(campo.column) for campo in campos)
+        cursor.copy_expert(
+            f"COPY {tabela} ({colunas}) FROM STDIN WITH (FORMAT csv, NULL '{NULO_COPY}')", buffer,
+        )
+    return objetos
+
+
+NULO_COPY = r'\N'
+
+
+def linha_copy(valores):
+    """
+    Linha CSV para o COPY: None vira o marcador NULL sem aspas e os demais
+    valores vao entre aspas. No formato csv um campo entre aspas nunca e NULL,
+    entao textos vazios (ou iguais ao marcador) continuam textos.
+    """
+    return ','.join(
+        NULO_COPY if valor is None else '"' + str(valor).replace('"', '""') + '"' for valor in valores
+    ) + '\n'
+
+
+def _pesos_zipf(quantidade, expoente):
+    """Pesos acumulados 1/k^s para random.choices(cum_weights=...)."""
+    return list(accumulate(1 / (k ** expoente) for k in range(1, quantidade + 1)))
+
+
+def _cnpj(rng):
+    """CNPJ com digitos verificadores validos, formatado."""
+    numeros = [rng.randint(0, 9) for _ in range(8)] + [0, 0, 0, 1]
+    for pesos in ([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]):
+        resto = sum(n * p for n, p in zip(numeros, pesos)) % 11
+        numeros.append(0 if resto < 2 else 11 - resto)
+    d = ''.join(map(str, numeros))
+    return f'{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}'
+
+
+def fim_do_dia(data):
+    """Instante final de ``data`` em UTC, referencia das datas geradas."""
+    return datetime.combine(data, time(23, 59, 59), tzinfo=dt_timezone.utc)
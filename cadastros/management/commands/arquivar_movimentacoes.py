@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from cadastros.arquivamento import (
+    arquivar_mes, diretorio_arquivo, garantir_particoes, inicio_do_mes, limites,
+    meses_para_arquivar, mover_para_tabela_arquivo,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Arquiva em JSONL comprimido os meses de movimentações de pedido mais antigos que '
+        '--meses e os remove do banco. No PostgreSQL também cria as partições dos próximos '
+        'meses; no SQLite move para a tabela de arquivo o que passou da janela ativa.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--meses', type=int, default=12,
+            help='Meses mantidos no banco, além do atual (padrão: 12).',
+        )
+        parser.add_argument(
+            '--meses-ativos', type=int, default=3,
+            help='SQLite: meses mantidos na tabela principal, além do atual (padrão: 3).',
+        )
+        parser.add_argument(
+            '--meses-a-frente', type=int, default=3,
+            help='PostgreSQL: partições criadas antecipadamente (padrão: 3).',
+        )
+        parser.add_argument(
+            '--destino',
+            help='Diretório dos arquivos (padrão: settings.ARQUIVO_MOVIMENTACOES_DIR).',
+        )
+
+    def handle(self, *args, **options):
+        if options['meses_ativos'] > options['meses']:
+            raise CommandError('--meses-ativos não pode ser maior que --meses.')
+
+        destino = options['destino'] or diretorio_arquivo()
+        mes_atual = inicio_do_mes(timezone.now())
+
+        for mes in garantir_particoes(options['meses_a_frente']):
+            self.stdout.write(f'Partição criada: {mes:%Y-%m}')
+
+        corte_ativo, _ = limites(inicio_do_mes(mes_atual, -options['meses_ativos']))
+        movidas = mover_para_tabela_arquivo(corte_ativo)
+        if movidas:
+            self.stdout.write(f'{movidas} movimentação(ões) movida(s) para a tabela de arquivo.')
+
+        corte, _ = limites(inicio_do_mes(mes_atual, -options['meses']))
+        meses = meses_para_arquivar(corte)
+        for mes in meses:
+            total = arquivar_mes(mes, destino)
+            self.stdout.write(f'{mes:%Y-%m}: {total} movimentação(ões) arquivada(s).')
+
+        if not meses:
+            self.stdout.write(self.style.SUCCESS('Nenhum mês a arquivar.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{len(meses)} mês(es) arquivado(s) em {destino}.'))
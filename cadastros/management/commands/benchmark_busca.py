@@ -0,0 +1,145 @@
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from cadastros.filters import PedidoFilter
+from cadastros.models import (
+    CategoriaItem, Cidade, Estado, Fornecedor, Frota, Item, ItemPedido, Pedido
+)
+
+# Filtros medidos: nome do filtro -> (termo, consulta equivalente com icontains)
+FILTROS = {
+    'fornecedor__nome': ('dor 12', lambda qs, termo: qs.filter(fornecedor__nome__icontains=termo)),
+    'itempedido__frota__prefixo': (
+        '7-01',
+        lambda qs, termo: qs.filter(itempedido__frota__prefixo__icontains=termo).distinct(),
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara a latência dos filtros de texto de pedidos com icontains (antes) '
+        'e com o índice de busca (depois). Os dados sintéticos são gerados dentro '
+        'de uma transação desfeita ao final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanhos', type=int, nargs='+', default=[10000, 100000, 1000000],
+            help='Quantidades de pedidos medidas (padrão: 10000 100000 1000000).',
+        )
+        parser.add_argument(
+            '--repeticoes', type=int, default=5,
+            help='Execuções de cada consulta; é exibida a mediana (padrão: 5).',
+        )
+        parser.add_argument(
+            '--lote', type=int, default=5000,
+            help='Tamanho do lote do bulk_create (padrão: 5000).',
+        )
+
+    def handle(self, *args, **options):
+        self.lote = options['lote']
+        self.repeticoes = options['repeticoes']
+
+        self.stdout.write(f'Banco: {connection.vendor}')
+        self.stdout.write(f'{"pedidos":>10}  {"filtro":<28} {"antes (ms)":>11} {"depois (ms)":>12} {"ganho":>7}')
+
+        with transaction.atomic():
+            self.criar_cadastros()
+            criados = 0
+            for tamanho in sorted(options['tamanhos']):
+                self.criar_pedidos(criados, tamanho)
+                criados = tamanho
+                self.atualizar_estatisticas()
+                for nome, (termo, antes) in FILTROS.items():
+                    self.medir(tamanho, nome, termo, antes)
+            transaction.set_rollback(True)
+
+    def criar_cadastros(self):
+        self.user = User.objects.create_user('benchmark_busca')
+        estado = Estado.objects.create(nome='Paraná', sigla='PR')
+        cidade = Cidade.objects.create(nome='Paranavaí', estado=estado)
+        categoria = CategoriaItem.objects.create(nome='Peças', criado_por=self.user)
+        self.item = Item.objects.create(nome='Filtro', categoria=categoria, criado_por=self.user)
+        self.cidade, self.estado = cidade, estado
+        self.fornecedores = []
+        self.frotas = []
+
+    def criar_catalogos(self, tamanho):
+        """Fornecedores e frotas crescem com o volume de pedidos."""
+        num_fornecedores = max(100, tamanho // 100)
+        num_frotas = max(50, tamanho // 1000)
+
+        self.fornecedores += Fornecedor.objects.bulk_create(
+            [
+                Fornecedor(
+                    nome=f'Fornecedor {i}', cnpj='00.000.000/0001-00',
+                    cidade=self.cidade, estado=self.estado, criado_por=self.user,
+                )
+                for i in range(len(self.fornecedores), num_fornecedores)
+            ],
+            batch_size=self.lote,
+        )
+        self.frotas += Frota.objects.bulk_create(
+            [
+                Frota(prefixo=f'{i % 100:02d}-{i // 100:03d}', descricao='Trator', ano=2020, criado_por=self.user)
+                for i in range(len(self.frotas), num_frotas)
+            ],
+            batch_size=self.lote,
+        )
+
+    def criar_pedidos(self, inicio, fim):
+        self.criar_catalogos(fim)
+        hoje = timezone.now().date()
+        status = [s for s, _ in Pedido.STATUS_CHOICES]
+
+        for lote_inicio in range(inicio, fim, self.lote):
+            lote_fim = min(lote_inicio + self.lote, fim)
+            pedidos = Pedido.objects.bulk_create([
+                Pedido(
+                    fornecedor=self.fornecedores[i % len(self.fornecedores)],
+                    descricao='Pedido sintético', status=status[i % len(status)],
+                    previsao_entrega=hoje + timedelta(days=i % 30), criado_por=self.user,
+                )
+                for i in range(lote_inicio, lote_fim)
+            ])
+            ItemPedido.objects.bulk_create([
+                ItemPedido(
+                    item=self.item, frota=self.frotas[(pedido.pk * 7 + j) % len(self.frotas)],
+                    pedido=pedido, quantidade=1, valor_unitario=Decimal('10.00'), criado_por=self.user,
+                )
+                for pedido in pedidos
+                for j in range(2)
+            ])
+        self.stdout.write(f'{fim:>10}  pedidos gerados')
+
+    def atualizar_estatisticas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def cronometrar(self, queryset):
+        """Mediana, em ms, de contar os pedidos e buscar a primeira pagina."""
+        tempos = []
+        for _ in range(self.repeticoes):
+            inicio = time.perf_counter()
+            queryset.count()
+            list(queryset.order_by('-data_pedido', '-id').values_list('pk', flat=True)[:20])
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tempos)
+
+    def medir(self, tamanho, nome, termo, antes):
+        pedidos = Pedido.objects.filter(criado_por=self.user)
+        tempo_antes = self.cronometrar(antes(pedidos, termo))
+        tempo_depois = self.cronometrar(PedidoFilter({nome: termo}, queryset=pedidos).qs)
+
+        self.stdout.write(
+            f'{tamanho:>10}  {nome:<28} {tempo_antes:>11.1f} {tempo_depois:>12.1f} '
+            f'{tempo_antes / tempo_depois:>6.1f}x'
+        )
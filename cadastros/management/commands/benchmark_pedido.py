@@ -0,0 +1,110 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from cadastros.forms import PedidoComItensForm
+from cadastros.models import CategoriaItem, Cidade, Estado, Fornecedor, Frota, Item, Pedido
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede o tempo e o número de consultas para salvar um pedido com muitas linhas '
+        'pelo PedidoComItensForm (criação e edição). Os dados são gerados dentro de uma '
+        'transação desfeita ao final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--linhas', type=int, default=200,
+            help='Quantidade de itens do pedido (padrão: 200).',
+        )
+        parser.add_argument(
+            '--repeticoes', type=int, default=5,
+            help='Execuções de cada operação; é exibida a mediana (padrão: 5).',
+        )
+
+    def handle(self, *args, **options):
+        linhas = options['linhas']
+
+        self.stdout.write(f'Banco: {connection.vendor} - pedido com {linhas} linhas')
+        self.stdout.write(f'{"operação":<10} {"tempo (ms)":>11} {"consultas":>10}')
+
+        with transaction.atomic():
+            self.criar_cadastros()
+            for operacao in ('criação', 'edição'):
+                tempos = []
+                for _ in range(options['repeticoes']):
+                    tempo, consultas = self.medir(operacao, linhas)
+                    tempos.append(tempo)
+                self.stdout.write(f'{operacao:<10} {statistics.median(tempos):>11.1f} {consultas:>10}')
+            transaction.set_rollback(True)
+
+    def criar_cadastros(self):
+        self.user = User.objects.create_user('benchmark_pedido')
+        estado = Estado.objects.create(nome='Paraná', sigla='PR')
+        cidade = Cidade.objects.create(nome='Paranavaí', estado=estado)
+        self.fornecedor = Fornecedor.objects.create(
+            nome='Fornecedor', cnpj='00.000.000/0001-00', cidade=cidade, estado=estado, criado_por=self.user,
+        )
+        categoria = CategoriaItem.objects.create(nome='Peças', criado_por=self.user)
+        self.itens = [
+            Item.objects.create(nome=f'Item {i}', categoria=categoria, criado_por=self.user)
+            for i in range(20)
+        ]
+        self.frota = Frota.objects.create(prefixo='01-001', descricao='Trator', ano=2020, criado_por=self.user)
+
+    def dados(self, linhas, existentes=()):
+        """
+        Dados do formulario com ``linhas`` linhas. As ``existentes`` vem
+        primeiro: metade muda de quantidade e um quarto e excluido; as demais
+        linhas sao novas.
+        """
+        dados = {
+            'fornecedor': self.fornecedor.pk,
+            'descricao': 'Pedido de benchmark',
+            'status': 'pendente',
+            'itens-TOTAL_FORMS': linhas,
+            'itens-INITIAL_FORMS': len(existentes),
+            'itens-MIN_NUM_FORMS': 1,
+            'itens-MAX_NUM_FORMS': 1000,
+        }
+        for i in range(linhas):
+            dados.update({
+                f'itens-{i}-item': self.itens[i % len(self.itens)].pk,
+                f'itens-{i}-frota': self.frota.pk,
+                f'itens-{i}-quantidade': 1,
+                f'itens-{i}-valor_unitario': '10.00',
+            })
+            if i < len(existentes):
+                dados[f'itens-{i}-id'] = existentes[i]
+                if i % 2 == 0:
+                    dados[f'itens-{i}-quantidade'] = 2
+                elif i % 4 == 1:
+                    dados[f'itens-{i}-DELETE'] = 'on'
+        return dados
+
+    def medir(self, operacao, linhas):
+        pedido = None
+        existentes = ()
+        if operacao == 'edição':
+            form = PedidoComItensForm(data=self.dados(linhas), user=self.user)
+            form.is_valid()
+            pedido = form.save()
+            pedido = Pedido.objects.get(pk=pedido.pk)
+            existentes = list(pedido.itempedido_set.order_by('id').values_list('pk', flat=True))
+
+        # Na edicao, um quarto de linhas novas alem das existentes
+        total = linhas + linhas // 4 if existentes else linhas
+        form = PedidoComItensForm(data=self.dados(total, existentes), instance=pedido, user=self.user)
+        if not form.is_valid():
+            raise ValueError(form.errors)
+
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            form.save()
+            tempo = (time.perf_counter() - inicio) * 1000
+        return tempo, len(consultas)
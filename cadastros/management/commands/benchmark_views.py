@@ -0,0 +1,434 @@
+import json
+import math
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cadastros import geracao
+from cadastros.models import CategoriaItem, Cidade, Fornecedor, Frota, Item, ItemPedido, Pedido
+from cadastros.municipios import carregar_municipios, ler_municipios
+from cadastros.resumo import reconstruir_resumo
+from paginasweb.cache_dashboard import invalidar_snapshot
+
+BASE_PADRAO = Path(__file__).resolve().parents[2] / 'dados' / 'benchmark_views.json'
+
+# Usuario descartavel dono dos dados gerados
+USUARIO = 'benchmark_views'
+
+# Folga somada ao orcamento de tempo: absorve a variacao das views rapidas
+FOLGA_MS = 10
+
+# Media de linhas por pedido gerada com itens_por_pedido=4 (ver geracao.py)
+LINHAS_POR_PEDIDO = 3.5
+
+
+@dataclass(frozen=True)
+class Cenario:
+    """Uma requisicao medida: ``url`` e ``dados`` recebem o Contexto e o numero da execucao."""
+    nome: str
+    url: object
+    dados: object = None
+    status: int = 200
+    preparar: object = None
+
+
+class Contexto:
+    """Usuario medido e registros usados nas URLs e formularios."""
+
+    def __init__(self, user):
+        self.user = user
+        self.fornecedor = Fornecedor.objects.filter(criado_por=user).order_by('pk').first()
+        self.frota = Frota.objects.filter(criado_por=user).order_by('pk').first()
+        self.categoria = CategoriaItem.objects.filter(criado_por=user).order_by('pk').first()
+        self.item = Item.objects.filter(criado_por=user).order_by('pk').first()
+        # O pedido mais recente: e o que aparece no topo da lista
+        self.pedido = Pedido.objects.filter(criado_por=user).order_by('-data_pedido', '-pk').first()
+        self.itens_pedido = list(ItemPedido.objects.filter(pedido=self.pedido).order_by('pk'))
+
+
+def _formulario_pedido(ctx, n, existentes=()):
+    dados = {
+        'fornecedor': ctx.fornecedor.pk,
+        'descricao': f'Pedido de benchmark {n}',
+        'status': ctx.pedido.status,
+        'itens-TOTAL_FORMS': len(existentes) or 5,
+        'itens-INITIAL_FORMS': len(existentes),
+        'itens-MIN_NUM_FORMS': 1,
+        'itens-MAX_NUM_FORMS': 1000,
+    }
+    for i in range(len(existentes) or 5):
+        dados.update({
+            f'itens-{i}-item': ctx.item.pk,
+            f'itens-{i}-frota': ctx.frota.pk,
+            f'itens-{i}-quantidade': 1 + n % 3,
+            f'itens-{i}-valor_unitario': '10.00',
+        })
+        if existentes:
+            dados[f'itens-{i}-id'] = existentes[i].pk
+    return dados
+
+
+def _formulario_itempedido(ctx, n):
+    return {
+        'item': ctx.item.pk, 'frota': ctx.frota.pk, 'pedido': ctx.pedido.pk, 'status': 'pendente',
+        'quantidade': 1 + n % 3, 'valor_unitario': '10.00',
+    }
+
+
+def _fornecedor(ctx, n):
+    return {
+        'nome': f'Fornecedor benchmark {n}', 'cnpj': '11.222.333/0001-81', 'telefone': '', 'email': '',
+        'cidade': ctx.fornecedor.cidade_id, 'estado': ctx.fornecedor.estado_id,
+    }
+
+
+def _com_pk(nome, atributo):
+    return lambda ctx, n: reverse(nome, args=[getattr(ctx, atributo).pk])
+
+
+CENARIOS = [
+    # Listas e paginas de detalhe
+    Cenario('index', lambda ctx, n: reverse('index'), preparar=lambda ctx: invalidar_snapshot(ctx.user.pk)),
+    Cenario('index (cache)', lambda ctx, n: reverse('index')),
+    Cenario('estado-list', lambda ctx, n: reverse('estado-list')),
+    Cenario('cidade-list', lambda ctx, n: reverse('cidade-list')),
+    Cenario('fornecedor-list', lambda ctx, n: reverse('fornecedor-list')),
+    Cenario('frota-list', lambda ctx, n: reverse('frota-list')),
+    Cenario('categoriaitem-list', lambda ctx, n: reverse('categoriaitem-list')),
+    Cenario('item-list', lambda ctx, n: reverse('item-list')),
+    Cenario('pedido-list', lambda ctx, n: reverse('pedido-list')),
+    Cenario('pedido-list (status)', lambda ctx, n: reverse('pedido-list') + '?status=pendente'),
+    Cenario('pedido-list (fornecedor)', lambda ctx, n: reverse('pedido-list') + '?fornecedor__nome=Agro'),
+    Cenario('itempedido-list', lambda ctx, n: reverse('itempedido-list')),
+    Cenario('pedido-itens', _com_pk('pedido-itens', 'pedido')),
+    Cenario('pedido-historico', _com_pk('pedido-historico', 'pedido')),
+    Cenario('autocomplete-fornecedor', lambda ctx, n: reverse('autocomplete-fornecedor') + '?q=Agro'),
+    Cenario('autocomplete-item', lambda ctx, n: reverse('autocomplete-item') + '?q=Fil'),
+    Cenario('autocomplete-pedido', lambda ctx, n: reverse('autocomplete-pedido') + '?q=Auto'),
+    # Formularios de cadastro
+    Cenario('cadastrar-pedido (GET)', lambda ctx, n: reverse('cadastrar-pedido')),
+    Cenario('cadastrar-fornecedor', lambda ctx, n: reverse('cadastrar-fornecedor'), _fornecedor, 302),
+    Cenario('cadastrar-frota', lambda ctx, n: reverse('cadastrar-frota'),
+            lambda ctx, n: {'prefixo': f'B-{n:03d}', 'descricao': 'Trator', 'ano': 2020}, 302),
+    Cenario('cadastrar-categoriaitem', lambda ctx, n: reverse('cadastrar-categoriaitem'),
+            lambda ctx, n: {'nome': f'Categoria benchmark {n}'}, 302),
+    Cenario('cadastrar-item', lambda ctx, n: reverse('cadastrar-item'),
+            lambda ctx, n: {'nome': f'Item benchmark {n}', 'categoria': ctx.categoria.pk}, 302),
+    Cenario('cadastrar-itempedido', lambda ctx, n: reverse('cadastrar-itempedido'), _formulario_itempedido, 302),
+    Cenario('cadastrar-pedido', lambda ctx, n: reverse('cadastrar-pedido'), _formulario_pedido, 302),
+    # Formularios de edicao
+    Cenario('pedido-update (GET)', _com_pk('pedido-update', 'pedido')),
+    Cenario('fornecedor-update', _com_pk('fornecedor-update', 'fornecedor'), _fornecedor, 302),
+    Cenario('frota-update', _com_pk('frota-update', 'frota'),
+            lambda ctx, n: {'prefixo': ctx.frota.prefixo, 'descricao': f'Trator {n}', 'ano': 2020}, 302),
+    Cenario('categoriaitem-update', _com_pk('categoriaitem-update', 'categoria'),
+            lambda ctx, n: {'nome': f'{ctx.categoria.nome} {n}'}, 302),
+    Cenario('item-update', _com_pk('item-update', 'item'),
+            lambda ctx, n: {'nome': f'{ctx.item.nome} {n}', 'categoria': ctx.categoria.pk}, 302),
+    Cenario('itempedido-update', lambda ctx, n: reverse('itempedido-update', args=[ctx.itens_pedido[0].pk]),
+            _formulario_itempedido, 302),
+    Cenario('pedido-update', _com_pk('pedido-update', 'pedido'),
+            lambda ctx, n: _formulario_pedido(ctx, n, ctx.itens_pedido), 302),
+]
+
+
+class ContadorLinhas:
+    """
+    execute_wrapper que conta as linhas lidas do banco: troca o cursor do
+    driver por um que soma o que sai de fetchone/fetchmany/fetchall.
+    """
+
+    def __init__(self):
+        self.linhas = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        cursor = context['cursor']
+        if not isinstance(cursor.cursor, _CursorContado):
+            cursor.cursor = _CursorContado(cursor.cursor, self)
+        return execute(sql, params, many, context)
+
+
+class _CursorContado:
+
+    def __init__(self, cursor, contador):
+        self._cursor = cursor
+        self._contador = contador
+
+    def fetchone(self):
+        linha = self._cursor.fetchone()
+        if linha is not None:
+            self._contador.linhas += 1
+        return linha
+
+    def fetchmany(self, *args, **kwargs):
+        linhas = self._cursor.fetchmany(*args, **kwargs)
+        self._contador.linhas += len(linhas)
+        return linhas
+
+    def fetchall(self):
+        linhas = self._cursor.fetchall()
+        self._contador.linhas += len(linhas)
+        return linhas
+
+    def __iter__(self):
+        for linha in self._cursor:
+            self._contador.linhas += 1
+            yield linha
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede cada view de listagem, cadastro, edição e o dashboard pelo cliente de testes, '
+        'com dados sintéticos em várias escalas, gravados num usuário descartável que é '
+        'removido ao final. '
+        'Grava um relatório JSON e falha se alguma view passar do orçamento de consultas '
+        'ou de tempo da base de referência. Só roda num banco descartável '
+        '(settings.BANCO_DESCARTAVEL ou --permitir-banco).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--escalas', type=int, nargs='+', default=[1000, 100000, 1000000],
+            help='Quantidades de itens de pedido medidas (padrão: 1000 100000 1000000).',
+        )
+        parser.add_argument(
+            '--repeticoes', type=int, default=5,
+            help='Execuções cronometradas de cada view; é usada a mediana (padrão: 5).',
+        )
+        parser.add_argument(
+            '--view', action='append', dest='views', metavar='NOME',
+            help='Mede só esta view (pode ser repetido).',
+        )
+        parser.add_argument(
+            '--saida', default='benchmark_views.json',
+            help='Arquivo do relatório JSON (padrão: benchmark_views.json).',
+        )
+        parser.add_argument(
+            '--base', default=str(BASE_PADRAO),
+            help='Base de referência com os orçamentos (padrão: cadastros/dados/benchmark_views.json).',
+        )
+        parser.add_argument(
+            '--atualizar-base', action='store_true',
+            help='Grava as medições como novos orçamentos na base, em vez de compará-las.',
+        )
+        parser.add_argument(
+            '--tolerancia', type=float, default=2.0,
+            help=f'Com --atualizar-base, orçamento de tempo = mediana medida x tolerância + {FOLGA_MS} ms '
+                 '(padrão: 2.0).',
+        )
+        parser.add_argument(
+            '--semente', type=int, default=2025, help='Semente dos dados gerados (padrão: 2025).',
+        )
+        parser.add_argument(
+            '--permitir-banco', action='store_true',
+            help='Confirma que o banco configurado é descartável (o padrão é settings.BANCO_DESCARTAVEL).',
+        )
+
+    def handle(self, *args, **options):
+        if options['repeticoes'] < 1 or min(options['escalas']) < 1:
+            raise CommandError('--repeticoes e --escalas devem ser maiores que zero.')
+        # Grava milhoes de linhas e remove a conta USUARIO com DELETEs diretos
+        if not (options['permitir_banco'] or getattr(settings, 'BANCO_DESCARTAVEL', False)):
+            raise CommandError(
+                f'O banco "{connection.settings_dict["NAME"]}" não está marcado como descartável. '
+                'Rode num banco de benchmark com BANCO_DESCARTAVEL=1 ou --permitir-banco.'
+            )
+        cenarios = CENARIOS
+        if options['views']:
+            cenarios = [cenario for cenario in CENARIOS if cenario.nome in options['views']]
+            faltando = set(options['views']) - {cenario.nome for cenario in cenarios}
+            if faltando:
+                raise CommandError(f'View(s) desconhecida(s): {", ".join(sorted(faltando))}')
+
+        self.repeticoes = options['repeticoes']
+        self.semente = options['semente']
+        caminho_base = Path(options['base'])
+        base = json.loads(caminho_base.read_text(encoding='utf-8')) if caminho_base.exists() else {}
+        orcamentos = base.get(connection.vendor, {})
+
+        relatorio = {
+            'gerado_em': timezone.now().isoformat(timespec='seconds'),
+            'banco': connection.vendor,
+            'repeticoes': self.repeticoes,
+            'escalas': [],
+        }
+        violacoes = []
+        self.stdout.write(f'Banco: {connection.vendor}')
+
+        # Sem a debug toolbar e sem o log de consultas do DEBUG nas medicoes
+        with override_settings(DEBUG=False):
+            for escala in sorted(options['escalas']):
+                resultado = self.medir_escala(escala, cenarios, orcamentos.get(str(escala), {}))
+                relatorio['escalas'].append(resultado)
+                violacoes += [
+                    f'{escala} itens, {view["nome"]}: {violacao}'
+                    for view in resultado['views'] for violacao in view['violacoes']
+                ]
+
+        Path(options['saida']).write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding='utf-8')
+        self.stdout.write(f'Relatório gravado em {options["saida"]}.')
+
+        if options['atualizar_base']:
+            self.atualizar_base(base, caminho_base, relatorio, options['tolerancia'])
+        elif violacoes:
+            raise CommandError('Orçamento excedido:\n' + '\n'.join(violacoes))
+        else:
+            self.stdout.write(self.style.SUCCESS('Todas as views dentro do orçamento.'))
+
+    def medir_escala(self, escala, cenarios, orcamentos):
+        # Os dados sao gravados de verdade: as requisicoes medidas rodam nas
+        # transacoes proprias, como em producao, e os on_commit (auditoria,
+        # caches) entram no tempo. Sobras de uma execucao interrompida saem antes
+        sobra = User.objects.filter(username=USUARIO).first()
+        if sobra is not None:
+            # A conta criada aqui nao tem senha; outra com o mesmo nome nao e sobra
+            if sobra.has_usable_password():
+                raise CommandError(f'Já existe um usuário "{USUARIO}" que não foi criado pelo benchmark.')
+            geracao.remover_usuarios([sobra])
+        ctx = self.criar_dados(escala)
+        try:
+            cliente = Client()
+            cliente.force_login(ctx.user)
+
+            resultado = {
+                'escala': escala,
+                'itens_pedido': ItemPedido.objects.filter(criado_por=ctx.user).count(),
+                'pedidos': Pedido.objects.filter(criado_por=ctx.user).count(),
+                'views': [],
+            }
+            self.stdout.write(f'\n{resultado["itens_pedido"]} itens de pedido, {resultado["pedidos"]} pedidos')
+            self.stdout.write(
+                f'{"view":<28} {"tempo (ms)":>11} {"consultas":>10} {"linhas":>8} {"memória (KiB)":>14}'
+            )
+            for cenario in cenarios:
+                medicao = self.medir(cliente, ctx, cenario)
+                medicao['orcamento'] = orcamentos.get(cenario.nome)
+                medicao['violacoes'] = _violacoes(medicao)
+                resultado['views'].append(medicao)
+                self.stdout.write(
+                    f'{cenario.nome:<28} {medicao["tempo_ms"]["mediana"]:>11.1f} {medicao["consultas"]:>10} '
+                    f'{medicao["linhas"]:>8} {medicao["memoria_pico_kib"]:>14.0f}'
+                    + (' !' if medicao['violacoes'] else '')
+                )
+        finally:
+            geracao.remover_usuarios([ctx.user])
+        return resultado
+
+    def criar_dados(self, escala):
+        if not Cidade.objects.exists():
+            carregar_municipios(ler_municipios())
+        user = User.objects.create_user(USUARIO)
+        pedidos = max(1, math.ceil(escala / LINHAS_POR_PEDIDO))
+        tarefa = geracao.Tarefa(
+            indice=0, user_id=user.pk, semente=self.semente,
+            escala=geracao.Escala(
+                usuarios=1, pedidos=pedidos, fornecedores=max(20, pedidos // 50), itens=max(50, pedidos // 10),
+                frotas=max(10, pedidos // 200), categorias=16, lote=5000,
+            ),
+            cidades=tuple(Cidade.objects.order_by('pk').values_list('pk', 'estado_id')),
+            ate=geracao.fim_do_dia(date.today() - timedelta(days=1)),
+            usar_copy=connection.vendor == 'postgresql',
+        )
+        geracao.gerar_usuario(tarefa)
+        reconstruir_resumo([user], tamanho_lote=5000)
+        geracao.analisar_tabelas()
+        return Contexto(user)
+
+    def medir(self, cliente, ctx, cenario):
+        execucao = 0
+
+        def requisitar():
+            nonlocal execucao
+            execucao += 1
+            if cenario.preparar:
+                cenario.preparar(ctx)
+            url = cenario.url(ctx, execucao)
+            if cenario.dados is None:
+                return cliente.get(url)
+            return cliente.post(url, cenario.dados(ctx, execucao))
+
+        # Aquecimento: caches, templates compilados e conexao
+        resposta = requisitar()
+        if resposta.status_code != cenario.status:
+            raise CommandError(
+                f'{cenario.nome}: status {resposta.status_code}, esperado {cenario.status}.'
+                + _erros_formulario(resposta)
+            )
+
+        tempos = []
+        for _ in range(self.repeticoes):
+            inicio = time.perf_counter()
+            requisitar()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+
+        # Consultas, linhas e memoria numa execucao a parte: o tracemalloc
+        # deixa a requisicao mais lenta
+        contador = ContadorLinhas()
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as consultas, connection.execute_wrapper(contador):
+                requisitar()
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'nome': cenario.nome,
+            'metodo': 'GET' if cenario.dados is None else 'POST',
+            'status': resposta.status_code,
+            'tempo_ms': {
+                'mediana': round(statistics.median(tempos), 2),
+                'minimo': round(min(tempos), 2),
+                'maximo': round(max(tempos), 2),
+            },
+            'consultas': len(consultas),
+            'linhas': contador.linhas,
+            'memoria_pico_kib': round(pico / 1024, 1),
+        }
+
+    def atualizar_base(self, base, caminho, relatorio, tolerancia):
+        orcamentos = base.setdefault(connection.vendor, {})
+        for resultado in relatorio['escalas']:
+            escala = orcamentos.setdefault(str(resultado['escala']), {})
+            for view in resultado['views']:
+                escala[view['nome']] = {
+                    'consultas': view['consultas'],
+                    'tempo_ms': math.ceil(view['tempo_ms']['mediana'] * tolerancia + FOLGA_MS),
+                }
+        caminho.write_text(json.dumps(base, indent=2, ensure_ascii=False, sort_keys=True) + '\n', encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f'Base de referência atualizada em {caminho}.'))
+
+
+def _violacoes(medicao):
+    orcamento = medicao['orcamento']
+    if not orcamento:
+        return []
+    violacoes = []
+    if medicao['consultas'] > orcamento['consultas']:
+        violacoes.append(f'{medicao["consultas"]} consultas (orçamento: {orcamento["consultas"]})')
+    if medicao['tempo_ms']['mediana'] > orcamento['tempo_ms']:
+        violacoes.append(f'{medicao["tempo_ms"]["mediana"]:.1f} ms (orçamento: {orcamento["tempo_ms"]} ms)')
+    return violacoes
+
+
+def _erros_formulario(resposta):
+    contexto = resposta.context or {}
+    erros = [
+        form.errors.as_text() for nome in ('form', 'pedido_form') if (form := contexto.get(nome)) is not None
+    ]
+    return (' ' + ' '.join(erros)) if any(erros) else ''
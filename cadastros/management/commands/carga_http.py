@@ -0,0 +1,452 @@
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from itertools import accumulate
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from cadastros import geracao
+from cadastros.models import Fornecedor, Frota, Item, ItemPedido, Pedido
+
+
+@dataclass
+class Conta:
+    """Usuario de carga e os registros dele usados nas requisicoes."""
+    username: str
+    fornecedores: list
+    termos_fornecedor: list
+    itens: list
+    frota: int
+    pedido: int
+    itens_pedido: list
+    status_pedido: str
+
+
+@dataclass(frozen=True)
+class Cenario:
+    """Requisicao sorteada pelos usuarios virtuais; ``requisicao`` monta (metodo, caminho, dados)."""
+    nome: str
+    peso: int
+    requisicao: object
+    status: int = 200
+
+
+def _get(nome, consulta=None):
+    def requisicao(conta, rng):
+        caminho = reverse(nome)
+        if consulta:
+            caminho += '?' + urlencode(consulta(conta, rng))
+        return 'GET', caminho, None
+    return requisicao
+
+
+def _filtros_pedido(conta, rng):
+    filtros = {}
+    if rng.random() < 0.6:
+        filtros['status'] = rng.choice(['pendente', 'em_andamento', 'finalizado'])
+    if not filtros or rng.random() < 0.5:
+        filtros['fornecedor__nome'] = rng.choice(conta.termos_fornecedor)
+    return filtros
+
+
+def _criar_pedido(conta, rng):
+    linhas = rng.randint(1, 5)
+    dados = {
+        'fornecedor': rng.choice(conta.fornecedores),
+        'descricao': 'Pedido da carga HTTP',
+        'itens-TOTAL_FORMS': linhas,
+        'itens-INITIAL_FORMS': 0,
+        'itens-MIN_NUM_FORMS': 1,
+        'itens-MAX_NUM_FORMS': 1000,
+    }
+    for i in range(linhas):
+        dados.update({
+            f'itens-{i}-item': rng.choice(conta.itens),
+            f'itens-{i}-frota': conta.frota,
+            f'itens-{i}-quantidade': rng.randint(1, 10),
+            f'itens-{i}-valor_unitario': f'{rng.uniform(5, 500):.2f}',
+        })
+    return 'POST', reverse('cadastrar-pedido'), dados
+
+
+def _editar_pedido(conta, rng):
+    dados = {
+        'fornecedor': conta.fornecedores[0],
+        'descricao': f'Pedido editado pela carga HTTP ({rng.randint(1, 10 ** 6)})',
+        'status': conta.status_pedido,
+        'itens-TOTAL_FORMS': len(conta.itens_pedido),
+        'itens-INITIAL_FORMS': len(conta.itens_pedido),
+        'itens-MIN_NUM_FORMS': 1,
+        'itens-MAX_NUM_FORMS': 1000,
+    }
+    for i, (pk, item) in enumerate(conta.itens_pedido):
+        dados.update({
+            f'itens-{i}-id': pk,
+            f'itens-{i}-item': item,
+            f'itens-{i}-frota': conta.frota,
+            f'itens-{i}-quantidade': rng.randint(1, 10),
+            f'itens-{i}-valor_unitario': '10.00',
+        })
+    return 'POST', reverse('pedido-update', args=[conta.pedido]), dados
+
+
+CENARIOS = [
+    Cenario('index', 15, _get('index')),
+    Cenario('pedido-list', 20, _get('pedido-list')),
+    Cenario('pedido-list (filtros)', 20, _get('pedido-list', _filtros_pedido)),
+    Cenario('itempedido-list', 10, _get('itempedido-list')),
+    Cenario('fornecedor-list', 8, _get('fornecedor-list')),
+    Cenario('item-list', 8, _get('item-list')),
+    Cenario('frota-list', 5, _get('frota-list')),
+    Cenario('categoriaitem-list', 4, _get('categoriaitem-list')),
+    Cenario('cadastrar-pedido', 5, _criar_pedido, 302),
+    Cenario('pedido-update', 5, _editar_pedido, 302),
+]
+
+
+class ErroHttp(Exception):
+    pass
+
+
+class ClienteHttp:
+    """
+    Cliente HTTP/1.1 minimo sobre asyncio, com keep-alive e cookies: so a
+    biblioteca padrao, para rodar sem rede e sem dependencias extras.
+    """
+
+    def __init__(self, host, porta):
+        self.host = host
+        self.porta = porta
+        self.cookies = {}
+        self.leitor = self.escritor = None
+
+    async def requisitar(self, metodo, caminho, dados=None):
+        """Envia a requisicao e retorna (status, corpo)."""
+        for tentativa in (1, 2):
+            reaproveitada = self.escritor is not None
+            if not reaproveitada:
+                self.leitor, self.escritor = await asyncio.open_connection(self.host, self.porta)
+            try:
+                return await self._enviar(metodo, caminho, dados)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.fechar()
+                # O servidor pode ter fechado uma conexao ociosa: tenta uma vez numa nova
+                if not reaproveitada or tentativa == 2:
+                    raise
+
+    async def _enviar(self, metodo, caminho, dados):
+        corpo = urlencode(dados or {}, doseq=True).encode() if metodo == 'POST' else b''
+        cabecalhos = [
+            f'{metodo} {caminho} HTTP/1.1',
+            f'Host: {self.host}:{self.porta}',
+            'User-Agent: carga_http',
+            'Connection: keep-alive',
+        ]
+        if self.cookies:
+            cabecalhos.append('Cookie: ' + '; '.join(f'{nome}={valor}' for nome, valor in self.cookies.items()))
+        if metodo == 'POST':
+            cabecalhos += ['Content-Type: application/x-www-form-urlencoded', f'Content-Length: {len(corpo)}']
+        self.escritor.write(('\r\n'.join(cabecalhos) + '\r\n\r\n').encode('latin-1') + corpo)
+        await self.escritor.drain()
+
+        linha_status = await self.leitor.readuntil(b'\r\n')
+        status = int(linha_status.split()[1])
+        resposta = {}
+        while (linha := await self.leitor.readuntil(b'\r\n')) != b'\r\n':
+            nome, _, valor = linha.decode('latin-1').partition(':')
+            nome, valor = nome.strip().lower(), valor.strip()
+            if nome == 'set-cookie':
+                cookie, _, _ = valor.partition(';')
+                chave, _, conteudo = cookie.partition('=')
+                self.cookies[chave.strip()] = conteudo.strip()
+            resposta[nome] = valor
+
+        if 'content-length' in resposta:
+            corpo = await self.leitor.readexactly(int(resposta['content-length']))
+        elif resposta.get('transfer-encoding', '').lower() == 'chunked':
+            corpo = await self._ler_chunks()
+        else:
+            corpo = await self.leitor.read()
+            resposta['connection'] = 'close'
+        if resposta.get('connection', '').lower() == 'close':
+            self.fechar()
+        return status, corpo
+
+    async def _ler_chunks(self):
+        partes = []
+        while tamanho := int((await self.leitor.readuntil(b'\r\n')).split(b';')[0], 16):
+            partes.append(await self.leitor.readexactly(tamanho))
+            await self.leitor.readuntil(b'\r\n')
+        while await self.leitor.readuntil(b'\r\n') != b'\r\n':
+            pass
+        return b''.join(partes)
+
+    async def login(self, username, senha):
+        caminho = settings.LOGIN_URL
+        await self.requisitar('GET', caminho)
+        status, _ = await self.requisitar('POST', caminho, {
+            'username': username, 'password': senha, 'csrfmiddlewaretoken': self.cookies.get('csrftoken', ''),
+        })
+        if status != 302:
+            raise ErroHttp(f'Login de {username} falhou (status {status}).')
+
+    def fechar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+        self.leitor = self.escritor = None
+
+    async def post(self, caminho, dados):
+        # Sem HTTPS o CSRF so confere o token contra o cookie
+        return await self.requisitar('POST', caminho, {**dados, 'csrfmiddlewaretoken': self.cookies['csrftoken']})
+
+
+@dataclass
+class Resultados:
+    latencias: dict = field(default_factory=lambda: defaultdict(list))
+    erros: dict = field(default_factory=lambda: defaultdict(int))
+
+    def registrar(self, nome, latencia, ok):
+        self.latencias[nome].append(latencia)
+        if not ok:
+            self.erros[nome] += 1
+
+
+def percentil(ordenados, p):
+    """Percentil ``p`` (0-100) pelo posto mais proximo; ``ordenados`` em ordem crescente."""
+    if not ordenados:
+        return 0.0
+    posto = max(1, -(-p * len(ordenados) // 100))
+    return ordenados[min(posto, len(ordenados)) - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga HTTP: N usuários virtuais (asyncio) fazem login e repetem uma mistura '
+        'ponderada de dashboard, listas, filtros, cadastro e edição de pedidos contra um servidor '
+        'local (gunicorn, como no app.yaml, ou runserver) ou já em execução (--url). Usa os usuários '
+        'gerados pelo popular_dados e mostra vazão e latências p50/p95/p99 por URL. Os pedidos '
+        'cadastrados e editados pela carga ficam no banco.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=20,
+                            help='Usuários virtuais simultâneos (padrão: 20).')
+        parser.add_argument('--duracao', type=float, default=30,
+                            help='Duração da medição em segundos (padrão: 30).')
+        parser.add_argument('--aquecimento', type=float, default=5,
+                            help='Segundos iniciais descartados da medição (padrão: 5).')
+        parser.add_argument('--pausa', type=float, default=0,
+                            help='Pausa média entre requisições de um usuário, em segundos (padrão: 0).')
+        parser.add_argument('--mix', action='append', default=[], metavar='NOME=PESO',
+                            help='Altera o peso de um cenário, ex.: --mix pedido-update=20 (pode ser repetido).')
+        parser.add_argument('--prefixo', default='carga',
+                            help='Prefixo dos usuários do popular_dados usados no login (padrão: carga).')
+        parser.add_argument('--senha', default='senha12345',
+                            help='Senha desses usuários (padrão: senha12345).')
+        parser.add_argument('--url',
+                            help='Servidor já em execução (ex.: http://127.0.0.1:8000); sem ela, um é iniciado.')
+        parser.add_argument('--servidor', choices=['gunicorn', 'runserver'],
+                            help='Servidor iniciado sem --url (padrão: gunicorn, se instalado).')
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Workers do gunicorn iniciado (padrão: 2).')
+        parser.add_argument('--semente', type=int, default=2025,
+                            help='Semente da sequência de requisições (padrão: 2025).')
+        parser.add_argument('--saida', help='Grava também o relatório em JSON neste arquivo.')
+
+    def handle(self, *args, **options):
+        if options['usuarios'] < 1 or options['duracao'] <= 0 or options['aquecimento'] < 0:
+            raise CommandError('--usuarios e --duracao devem ser positivos e --aquecimento não negativo.')
+        cenarios = self.cenarios(options['mix'])
+        contas = self.contas(options['prefixo'])
+
+        processo = None
+        if options['url']:
+            partes = urlsplit(options['url'])
+            host, porta = partes.hostname, partes.port or 80
+        else:
+            host, porta = '127.0.0.1', _porta_livre()
+            processo = self.iniciar_servidor(options['servidor'], host, porta, options['workers'])
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING('DEBUG ligado: as latências incluem o modo de depuração.'))
+
+        try:
+            resultados, duracao = asyncio.run(self.executar(host, porta, contas, cenarios, options))
+        finally:
+            if processo is not None:
+                processo.terminate()
+                processo.wait(timeout=30)
+
+        relatorio = self.relatorio(resultados, duracao, options['usuarios'])
+        self.exibir(relatorio)
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+
+    def cenarios(self, mix):
+        pesos = {cenario.nome: cenario.peso for cenario in CENARIOS}
+        for ajuste in mix:
+            nome, _, peso = ajuste.rpartition('=')
+            if nome not in pesos or not peso.isdigit():
+                raise CommandError(f'--mix inválido: {ajuste}. Cenários: {", ".join(pesos)}.')
+            pesos[nome] = int(peso)
+        cenarios = [
+            Cenario(cenario.nome, pesos[cenario.nome], cenario.requisicao, cenario.status)
+            for cenario in CENARIOS if pesos[cenario.nome] > 0
+        ]
+        if not cenarios:
+            raise CommandError('Todos os cenários estão com peso zero.')
+        return cenarios
+
+    def contas(self, prefixo):
+        contas = []
+        for user in geracao.usuarios_gerados(prefixo):
+            fornecedores = list(Fornecedor.objects.filter(criado_por=user).order_by('pk').values_list('pk', 'nome')[:50])
+            itens = list(Item.objects.filter(criado_por=user).order_by('pk').values_list('pk', flat=True)[:200])
+            frota = Frota.objects.filter(criado_por=user).order_by('pk').values_list('pk', flat=True).first()
+            pedido = Pedido.objects.filter(criado_por=user).order_by('-data_pedido', '-pk').first()
+            if not (fornecedores and itens and frota and pedido):
+                continue
+            contas.append(Conta(
+                username=user.username,
+                fornecedores=[pk for pk, _ in fornecedores],
+                termos_fornecedor=sorted({nome.split()[0] for _, nome in fornecedores}),
+                itens=itens,
+                frota=frota,
+                pedido=pedido.pk,
+                itens_pedido=list(ItemPedido.objects.filter(pedido=pedido).order_by('pk').values_list('pk', 'item_id')),
+                status_pedido=pedido.status,
+            ))
+        if not contas:
+            raise CommandError(
+                f'Nenhum usuário "{prefixo}0000"... com cadastros e pedidos. Gere os dados com o popular_dados.'
+            )
+        return contas
+
+    def iniciar_servidor(self, servidor, host, porta, workers):
+        if servidor is None:
+            servidor = 'gunicorn' if importlib.util.find_spec('gunicorn') else 'runserver'
+        if servidor == 'gunicorn':
+            comando = [
+                sys.executable, '-m', 'gunicorn', 'naes2025.wsgi', '-b', f'{host}:{porta}', '-w', str(workers),
+            ]
+        else:
+            comando = [
+                sys.executable, str(settings.BASE_DIR / 'manage.py'), 'runserver', f'{host}:{porta}', '--noreload',
+            ]
+        self.stdout.write(f'Iniciando {servidor} em {host}:{porta}...')
+
+        log = tempfile.TemporaryFile()
+        processo = subprocess.Popen(
+            comando, cwd=settings.BASE_DIR, stdout=log, stderr=subprocess.STDOUT,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE},
+        )
+        limite = time.monotonic() + 30
+        while time.monotonic() < limite:
+            if processo.poll() is not None:
+                log.seek(0)
+                raise CommandError(f'O {servidor} terminou ao iniciar:\n{log.read().decode(errors="replace")[-2000:]}')
+            try:
+                socket.create_connection((host, porta), timeout=1).close()
+                return processo
+            except OSError:
+                time.sleep(0.2)
+        processo.kill()
+        raise CommandError(f'O {servidor} não respondeu em {host}:{porta} em 30 segundos.')
+
+    async def executar(self, host, porta, contas, cenarios, options):
+        resultados = Resultados()
+        pesos = list(accumulate(cenario.peso for cenario in cenarios))
+        loop = asyncio.get_running_loop()
+
+        # Login de todos antes de cronometrar
+        clientes = []
+        for indice in range(options['usuarios']):
+            cliente = ClienteHttp(host, porta)
+            try:
+                await cliente.login(contas[indice % len(contas)].username, options['senha'])
+            except (OSError, ErroHttp, asyncio.IncompleteReadError) as erro:
+                raise CommandError(f'Falha no login dos usuários virtuais: {erro}')
+            clientes.append(cliente)
+        self.stdout.write(f'{len(clientes)} usuário(s) virtual(is) conectado(s) com {len(contas)} conta(s).')
+
+        inicio_medicao = loop.time() + options['aquecimento']
+        fim = inicio_medicao + options['duracao']
+
+        async def usuario_virtual(indice, cliente):
+            conta = contas[indice % len(contas)]
+            rng = random.Random(f'{options["semente"]}:{indice}')
+            while loop.time() < fim:
+                cenario = rng.choices(cenarios, cum_weights=pesos)[0]
+                metodo, caminho, dados = cenario.requisicao(conta, rng)
+                inicio = loop.time()
+                try:
+                    if metodo == 'POST':
+                        status, _ = await cliente.post(caminho, dados)
+                    else:
+                        status, _ = await cliente.requisitar(metodo, caminho)
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    status = None
+                if inicio >= inicio_medicao:
+                    resultados.registrar(cenario.nome, (loop.time() - inicio) * 1000, status == cenario.status)
+                if options['pausa']:
+                    await asyncio.sleep(rng.expovariate(1 / options['pausa']))
+            cliente.fechar()
+
+        await asyncio.gather(*(usuario_virtual(indice, cliente) for indice, cliente in enumerate(clientes)))
+        return resultados, options['duracao']
+
+    def relatorio(self, resultados, duracao, usuarios):
+        urls = {}
+        for nome in sorted(resultados.latencias):
+            ordenadas = sorted(resultados.latencias[nome])
+            urls[nome] = {
+                'requisicoes': len(ordenadas),
+                'erros': resultados.erros[nome],
+                'vazao_rps': round(len(ordenadas) / duracao, 2),
+                **{f'p{p}_ms': round(percentil(ordenadas, p), 1) for p in (50, 95, 99)},
+                'max_ms': round(ordenadas[-1], 1),
+            }
+        todas = sorted(latencia for lista in resultados.latencias.values() for latencia in lista)
+        return {
+            'usuarios': usuarios,
+            'duracao_s': duracao,
+            'requisicoes': len(todas),
+            'erros': sum(resultados.erros.values()),
+            'vazao_rps': round(len(todas) / duracao, 2),
+            **{f'p{p}_ms': round(percentil(todas, p), 1) for p in (50, 95, 99)},
+            'urls': urls,
+        }
+
+    def exibir(self, relatorio):
+        self.stdout.write(
+            f'{"url":<24} {"req":>7} {"erros":>6} {"req/s":>8} {"p50 (ms)":>9} {"p95 (ms)":>9} {"p99 (ms)":>9}'
+        )
+        linhas = list(relatorio['urls'].items()) + [('total', relatorio)]
+        for nome, dados in linhas:
+            self.stdout.write(
+                f'{nome:<24} {dados["requisicoes"]:>7} {dados["erros"]:>6} {dados["vazao_rps"]:>8.1f} '
+                f'{dados["p50_ms"]:>9.1f} {dados["p95_ms"]:>9.1f} {dados["p99_ms"]:>9.1f}'
+            )
+        estilo = self.style.WARNING if relatorio['erros'] else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f'{relatorio["requisicoes"]} requisição(ões) em {relatorio["duracao_s"]:.0f}s, '
+            f'{relatorio["erros"]} erro(s).'
+        ))
+
+
+def _porta_livre():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cadastros.municipios import ARQUIVO_PADRAO, ArquivoInvalido, carregar_municipios, ler_municipios
+
+
+class Command(BaseCommand):
+    help = (
+        'Carrega estados e cidades a partir do arquivo de municípios do IBGE. '
+        'Pode ser executado de novo: só grava o que mudou no arquivo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--arquivo', default=str(ARQUIVO_PADRAO),
+            help='CSV no formato de cadastros/dados/municipios_ibge.csv ou JSON da API de '
+                 'localidades do IBGE (padrão: arquivo incluído no projeto).',
+        )
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Registros gravados por comando INSERT/UPDATE (padrão: 1000).',
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser maior que zero.')
+
+        inicio = time.perf_counter()
+        try:
+            municipios = ler_municipios(options['arquivo'])
+        except OSError as erro:
+            raise CommandError(f'Não foi possível ler {options["arquivo"]}: {erro.strerror}')
+        except ArquivoInvalido as erro:
+            raise CommandError(str(erro))
+
+        estados, cidades = carregar_municipios(municipios, options['lote'])
+
+        self.stdout.write(f'Estados: {estados}')
+        self.stdout.write(f'Cidades: {cidades}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(municipios)} município(s) processado(s) em {time.perf_counter() - inicio:.1f}s.'
+        ))
@@ -0,0 +1,93 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from naes2025.consultas_lentas import diretorio, ler_registros
+
+
+class Command(BaseCommand):
+    help = (
+        'Resume as consultas lentas gravadas pelo ConsultasLentasMiddleware: as impressões '
+        'digitais de SQL com maior tempo total, com as URLs de origem e o plano mais recente.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=10,
+            help='Quantas impressões digitais mostrar (padrão: 10).',
+        )
+        parser.add_argument(
+            '--horas', type=float,
+            help='Considera só as ocorrências das últimas N horas (padrão: todo o buffer).',
+        )
+        parser.add_argument(
+            '--url',
+            help='Considera só as ocorrências com este nome de URL.',
+        )
+        parser.add_argument(
+            '--planos', action='store_true',
+            help='Mostra o plano de execução mais recente de cada impressão digital.',
+        )
+        parser.add_argument(
+            '--diretorio',
+            help='Diretório do buffer (padrão: settings.CONSULTAS_LENTAS_DIR).',
+        )
+        parser.add_argument(
+            '--limpar', action='store_true',
+            help='Apaga o buffer depois de mostrar o resumo.',
+        )
+
+    def handle(self, *args, **options):
+        if options['top'] < 1:
+            raise CommandError('--top deve ser positivo.')
+
+        pasta = Path(options['diretorio'] or diretorio())
+        desde = timezone.now() - timedelta(hours=options['horas']) if options['horas'] else None
+
+        grupos = {}
+        for registro in ler_registros(pasta):
+            if options['url'] and registro['url'] != options['url']:
+                continue
+            if desde and datetime.fromisoformat(registro['momento']) < desde:
+                continue
+            grupo = grupos.setdefault(registro['impressao'], {
+                'sql': registro['sql'], 'ocorrencias': 0, 'total_ms': 0.0, 'maximo_ms': 0.0,
+                'urls': Counter(), 'plano': None,
+            })
+            grupo['ocorrencias'] += 1
+            grupo['total_ms'] += registro['duracao_ms']
+            grupo['maximo_ms'] = max(grupo['maximo_ms'], registro['duracao_ms'])
+            grupo['urls'][registro['url'] or '-'] += 1
+            if registro.get('plano'):
+                # Os registros vêm em ordem cronológica: fica o plano mais recente
+                grupo['plano'] = registro['plano']
+
+        if not grupos:
+            self.stdout.write(self.style.SUCCESS(f'Nenhuma consulta lenta registrada em {pasta}.'))
+        else:
+            mais_lentas = sorted(grupos.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+            self.stdout.write(
+                f'{len(grupos)} impressão(ões) digital(is), '
+                f'{sum(grupo["ocorrencias"] for grupo in grupos.values())} ocorrência(s).'
+            )
+            self.stdout.write(
+                f'{"impressao":<12} {"total_ms":>11} {"vezes":>6} {"media_ms":>9} {"max_ms":>9}  urls'
+            )
+            for impressao, grupo in mais_lentas[:options['top']]:
+                urls = ', '.join(f'{url} ({vezes})' for url, vezes in grupo['urls'].most_common(3))
+                self.stdout.write(
+                    f'{impressao:<12} {grupo["total_ms"]:>11.1f} {grupo["ocorrencias"]:>6} '
+                    f'{grupo["total_ms"] / grupo["ocorrencias"]:>9.1f} {grupo["maximo_ms"]:>9.1f}  {urls}'
+                )
+                self.stdout.write(f'    {grupo["sql"][:300]}')
+                if options['planos'] and grupo['plano']:
+                    for linha in grupo['plano']:
+                        self.stdout.write(f'      {linha}')
+
+        if options['limpar']:
+            for caminho in pasta.glob('*.jsonl'):
+                caminho.unlink(missing_ok=True)
+            self.stdout.write('Buffer de consultas lentas apagado.')
@@ -0,0 +1,148 @@
+import argparse
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+
+from cadastros import geracao
+from cadastros.arquivamento import garantir_particoes
+from cadastros.contadores import invalidar_total_pedidos
+from cadastros.models import Cidade, Pedido
+from cadastros.municipios import carregar_municipios, ler_municipios
+from cadastros.resumo import reconstruir_resumo
+from paginasweb.cache_dashboard import invalidar_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera dados sintéticos em escala de produção para testes de desempenho. '
+        'A mesma --semente gera sempre os mesmos dados, com qualquer número de processos.'
+    )
+
+    def add_arguments(self, parser):
+        padrao = geracao.Escala()
+        parser.add_argument('--usuarios', type=int, default=padrao.usuarios,
+                            help=f'Usuários gerados (padrão: {padrao.usuarios}).')
+        parser.add_argument('--fornecedores', type=int, default=padrao.fornecedores,
+                            help=f'Fornecedores por usuário (padrão: {padrao.fornecedores}).')
+        parser.add_argument('--categorias', type=int, default=padrao.categorias,
+                            help=f'Categorias de item por usuário (padrão: {padrao.categorias}).')
+        parser.add_argument('--itens', type=int, default=padrao.itens,
+                            help=f'Itens do catálogo por usuário (padrão: {padrao.itens}).')
+        parser.add_argument('--frotas', type=int, default=padrao.frotas,
+                            help=f'Frotas por usuário (padrão: {padrao.frotas}).')
+        parser.add_argument('--pedidos', type=int, default=padrao.pedidos,
+                            help=f'Pedidos por usuário (padrão: {padrao.pedidos}).')
+        parser.add_argument('--itens-por-pedido', type=float, default=padrao.itens_por_pedido,
+                            help=f'Média de itens por pedido (padrão: {padrao.itens_por_pedido}).')
+        parser.add_argument('--dias', type=int, default=padrao.dias,
+                            help=f'Período coberto pelos pedidos, em dias (padrão: {padrao.dias}).')
+        parser.add_argument('--escala', type=float, default=1.0,
+                            help='Multiplica as quantidades por usuário (ex.: 10 para 50 mil pedidos por usuário).')
+        parser.add_argument('--semente', type=int, default=2025, help='Semente dos dados (padrão: 2025).')
+        parser.add_argument('--ate', type=_data,
+                            help='Data (AAAA-MM-DD) do pedido mais recente (padrão: hoje). '
+                                 'Fixe junto com a semente para repetir a mesma base.')
+        parser.add_argument('--lote', type=int, default=padrao.lote,
+                            help=f'Pedidos gravados por transação (padrão: {padrao.lote}).')
+        parser.add_argument('--processos', type=int, default=1,
+                            help='Processos gerando usuários em paralelo (padrão: 1; só PostgreSQL).')
+        parser.add_argument('--prefixo', default='carga',
+                            help='Prefixo do username dos usuários gerados (padrão: carga).')
+        parser.add_argument('--senha', default='senha12345',
+                            help='Senha dos usuários gerados (padrão: senha12345).')
+        parser.add_argument('--limpar', action='store_true',
+                            help='Remove antes os usuários gerados com o prefixo e tudo que eles cadastraram.')
+        parser.add_argument('--sem-copy', action='store_true',
+                            help='No PostgreSQL, grava com bulk_create em vez de COPY.')
+
+    def handle(self, *args, **options):
+        quantidades = {
+            campo: options[campo] for campo in ('fornecedores', 'categorias', 'itens', 'frotas', 'pedidos')
+        }
+        if min(options['usuarios'], options['lote'], options['processos'], options['dias']) < 1:
+            raise CommandError('--usuarios, --lote, --processos e --dias devem ser maiores que zero.')
+        if min(quantidades.values()) < 1 or options['escala'] <= 0 or options['itens_por_pedido'] < 1:
+            raise CommandError('As quantidades devem ser positivas e --itens-por-pedido pelo menos 1.')
+
+        escala = geracao.Escala(
+            usuarios=options['usuarios'],
+            itens_por_pedido=options['itens_por_pedido'],
+            dias=options['dias'],
+            lote=options['lote'],
+            **{campo: max(1, round(valor * options['escala'])) for campo, valor in quantidades.items()},
+        )
+        prefixo = options['prefixo']
+        processos = options['processos']
+        if processos > 1 and connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(f'{connection.vendor} grava um lote por vez: usando 1 processo.'))
+            processos = 1
+
+        existentes = geracao.usuarios_gerados(prefixo)
+        if existentes.exists():
+            if not options['limpar']:
+                raise CommandError(f'Já existem usuários "{prefixo}0000"... Use --limpar para gerar de novo.')
+            geracao.remover_usuarios(list(existentes))
+            self.stdout.write(f'Usuários "{prefixo}0000"... anteriores removidos.')
+
+        if not Cidade.objects.exists():
+            _, cidades = carregar_municipios(ler_municipios())
+            self.stdout.write(f'Cidades carregadas do arquivo de municípios: {cidades}')
+
+        ate = geracao.fim_do_dia(options['ate'] or timezone.localdate())
+        garantir_particoes(desde=ate - timedelta(days=escala.dias))
+
+        inicio = time.perf_counter()
+        usuarios = geracao.criar_usuarios(prefixo, escala.usuarios, options['senha'])
+        cidades = tuple(Cidade.objects.order_by('pk').values_list('pk', 'estado_id'))
+        tarefa = geracao.Tarefa(
+            indice=0, user_id=0, semente=options['semente'], escala=escala, cidades=cidades, ate=ate,
+            usar_copy=connection.vendor == 'postgresql' and not options['sem_copy'],
+        )
+        tarefas = [replace(tarefa, indice=indice, user_id=usuario.pk) for indice, usuario in enumerate(usuarios)]
+
+        contagem = Counter()
+        for usuario, parcial in zip(usuarios, self.executar(tarefas, processos)):
+            contagem.update(parcial)
+            self.stdout.write(f'  {usuario.username}: {parcial[Pedido._meta.verbose_name_plural]} pedido(s)')
+
+        # Os inserts em massa nao passam pelos sinais que mantem o resumo e os caches
+        reconstruir_resumo(usuarios, tamanho_lote=escala.lote)
+        for usuario in usuarios:
+            invalidar_snapshot(usuario.pk)
+            invalidar_total_pedidos(usuario.pk)
+        if connection.vendor in ('postgresql', 'sqlite'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        duracao = time.perf_counter() - inicio
+        for nome, total in contagem.items():
+            self.stdout.write(f'{nome}: {total}')
+        linhas = sum(contagem.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'{linhas} linha(s) geradas em {duracao:.1f}s ({linhas / max(duracao, 1e-9):,.0f} linhas/s).'
+        ))
+
+    def executar(self, tarefas, processos):
+        if processos == 1:
+            yield from map(geracao.gerar_usuario, tarefas)
+            return
+        # Os filhos herdariam o socket da conexao do pai: fecha antes do fork
+        # para cada processo abrir a sua
+        connections.close_all()
+        contexto = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as executor:
+            yield from executor.map(geracao.gerar_usuario, tarefas)
+
+
+def _data(valor):
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'data inválida: {valor} (use AAAA-MM-DD)')
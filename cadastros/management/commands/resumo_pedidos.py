@@ -0,0 +1,57 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from cadastros.resumo import calcular_resumo, reconstruir_resumo, resumo_gravado
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói ou verifica o resumo diário de pedidos (ResumoDiarioPedido).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help='Apenas compara o resumo gravado com os pedidos, sem alterar nada.',
+        )
+        parser.add_argument(
+            '--usuario', action='append', dest='usuarios', metavar='USERNAME',
+            help='Limita a operação aos pedidos deste usuário (pode ser repetido).',
+        )
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Tamanho do lote do bulk_create na reconstrução (padrão: 1000).',
+        )
+
+    def handle(self, *args, **options):
+        usuarios = None
+        if options['usuarios']:
+            usuarios = list(User.objects.filter(username__in=options['usuarios']))
+            encontrados = {u.username for u in usuarios}
+            faltando = set(options['usuarios']) - encontrados
+            if faltando:
+                raise CommandError(f'Usuário(s) não encontrado(s): {", ".join(sorted(faltando))}')
+
+        if options['verificar']:
+            self.verificar(usuarios)
+        else:
+            total = reconstruir_resumo(usuarios, tamanho_lote=options['lote'])
+            self.stdout.write(self.style.SUCCESS(f'Resumo reconstruído: {total} linha(s).'))
+
+    def verificar(self, usuarios):
+        esperado = calcular_resumo(usuarios)
+        gravado = resumo_gravado(usuarios)
+
+        divergencias = 0
+        for chave in sorted(set(esperado) | set(gravado), key=str):
+            valores_esperados = esperado.get(chave, [0, 0, 0])
+            valores_gravados = gravado.get(chave, [0, 0, 0])
+            if valores_esperados != valores_gravados:
+                divergencias += 1
+                self.stdout.write(
+                    f'{chave}: esperado {valores_esperados}, gravado {valores_gravados}'
+                )
+
+        if divergencias:
+            raise CommandError(
+                f'{divergencias} divergência(s) encontrada(s). Execute sem --verificar para reconstruir.'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Resumo consistente: {len(esperado)} linha(s).'))
@@ -0,0 +1,48 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from cadastros.models import Pedido
+from cadastros.totais import verificar_valor_total
+
+
+class Command(BaseCommand):
+    help = 'Verifica e corrige o valor_total dos pedidos comparando-o com a soma dos itens.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help='Apenas lista os pedidos divergentes, sem alterar nada.',
+        )
+        parser.add_argument(
+            '--usuario', action='append', dest='usuarios', metavar='USERNAME',
+            help='Limita a operação aos pedidos deste usuário (pode ser repetido).',
+        )
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Pedidos verificados (e corrigidos) por vez (padrão: 1000).',
+        )
+
+    def handle(self, *args, **options):
+        pedidos = Pedido.objects.all()
+        if options['usuarios']:
+            usuarios = list(User.objects.filter(username__in=options['usuarios']))
+            encontrados = {u.username for u in usuarios}
+            faltando = set(options['usuarios']) - encontrados
+            if faltando:
+                raise CommandError(f'Usuário(s) não encontrado(s): {", ".join(sorted(faltando))}')
+            pedidos = pedidos.filter(criado_por__in=usuarios)
+
+        corrigir = not options['verificar']
+        divergencias = 0
+        for pedido_id, gravado, calculado in verificar_valor_total(pedidos, options['lote'], corrigir):
+            divergencias += 1
+            self.stdout.write(f'Pedido #{pedido_id}: gravado {gravado}, calculado {calculado}')
+
+        if not divergencias:
+            self.stdout.write(self.style.SUCCESS('Valores totais consistentes.'))
+        elif corrigir:
+            self.stdout.write(self.style.SUCCESS(f'{divergencias} pedido(s) corrigido(s).'))
+        else:
+            raise CommandError(
+                f'{divergencias} divergência(s) encontrada(s). Execute sem --verificar para corrigir.'
+            )
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.20 on 2026-10-18 10:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def popular_resumo(apps, schema_editor):
+    """Preenche o resumo com os pedidos ja existentes."""
+    Pedido = apps.get_model('cadastros', 'Pedido')
+    ItemPedido = apps.get_model('cadastros', 'ItemPedido')
+    ResumoDiarioPedido = apps.get_model('cadastros', 'ResumoDiarioPedido')
+
+    resumo = {}
+    linhas_pedidos = Pedido.objects.annotate(dia=TruncDate('data_pedido')).order_by().values_list(
+        'criado_por_id', 'dia', 'status', 'fornecedor_id'
+    ).annotate(total=Count('id'))
+    for criado_por_id, dia, status, fornecedor_id, total in linhas_pedidos:
+        resumo[(criado_por_id, dia, status, fornecedor_id)] = ResumoDiarioPedido(
+            criado_por_id=criado_por_id, dia=dia, status=status, fornecedor_id=fornecedor_id,
+            num_pedidos=total,
+        )
+
+    linhas_itens = ItemPedido.objects.annotate(dia=TruncDate('pedido__data_pedido')).order_by().values_list(
+        'pedido__criado_por_id', 'dia', 'pedido__status', 'pedido__fornecedor_id'
+    ).annotate(soma_quantidade=Sum('quantidade'), soma_valor=Sum(F('quantidade') * F('valor_unitario')))
+    for criado_por_id, dia, status, fornecedor_id, quantidade, valor in linhas_itens:
+        linha = resumo[(criado_por_id, dia, status, fornecedor_id)]
+        linha.quantidade_itens = quantidade or 0
+        linha.valor_total = valor or 0
+
+    ResumoDiarioPedido.objects.bulk_create(resumo.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cadastros', '0002_movimentacaopedido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoDiarioPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('em_andamento', 'Em Andamento'), ('finalizado', 'Finalizado')], max_length=20)),
+                ('num_pedidos', models.IntegerField(default=0)),
+                ('quantidade_itens', models.BigIntegerField(default=0)),
+                ('valor_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('criado_por', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('fornecedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cadastros.fornecedor')),
+            ],
+            options={
+                'verbose_name': 'Resumo Diário de Pedidos',
+                'verbose_name_plural': 'Resumos Diários de Pedidos',
+                'ordering': ['-dia'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumodiariopedido',
+            constraint=models.UniqueConstraint(fields=('criado_por', 'dia', 'status', 'fornecedor'), name='resumo_diario_pedido_unico'),
+        ),
+        migrations.RunPython(popular_resumo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# Campos com indice de busca (tabela, coluna); ver cadastros/busca.py
+CAMPOS_BUSCA = [
+    ('cadastros_fornecedor', 'nome'),
+    ('cadastros_frota', 'prefixo'),
+]
+
+
+def _fts5_com_trigramas(schema_editor):
+    """O tokenizador trigram do FTS5 existe a partir do SQLite 3.34."""
+    try:
+        schema_editor.execute("CREATE VIRTUAL TABLE temp.teste_fts5 USING fts5(texto, tokenize='trigram')")
+    except OperationalError:
+        return False
+    schema_editor.execute('DROP TABLE temp.teste_fts5')
+    return True
+
+
+def criar_indices(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        # Exige permissao para criar extensoes no banco
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for tabela, coluna in CAMPOS_BUSCA:
+            # Mesma expressao gerada pelo icontains: UPPER(coluna::text) LIKE UPPER(...)
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {tabela}_{coluna}_trgm '
+                f'ON {tabela} USING gin ((UPPER({coluna}::text)) gin_trgm_ops)'
+            )
+
+    elif vendor == 'sqlite' and _fts5_com_trigramas(schema_editor):
+        # Os triggers sao apagados quando o SQLite recria a tabela (alteracao
+        # de coluna); migracoes que fizerem isso devem recria-los
+        for tabela, coluna in CAMPOS_BUSCA:
+            fts = f'{tabela}_{coluna}_fts'
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5("
+                f"{coluna}, content='{tabela}', content_rowid='id', tokenize='trigram')"
+            )
+            schema_editor.execute(
+                f'CREATE TRIGGER {fts}_insert AFTER INSERT ON {tabela} BEGIN '
+                f'INSERT INTO {fts}(rowid, {coluna}) VALUES (new.id, new.{coluna}); END'
+            )
+            schema_editor.execute(
+                f'CREATE TRIGGER {fts}_delete AFTER DELETE ON {tabela} BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, {coluna}) VALUES ('delete', old.id, old.{coluna}); END"
+            )
+            schema_editor.execute(
+                f'CREATE TRIGGER {fts}_update AFTER UPDATE OF {coluna} ON {tabela} BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, {coluna}) VALUES ('delete', old.id, old.{coluna}); "
+                f'INSERT INTO {fts}(rowid, {coluna}) VALUES (new.id, new.{coluna}); END'
+            )
+            # Indexa os registros ja existentes
+            schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def remover_indices(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    for tabela, coluna in CAMPOS_BUSCA:
+        if vendor == 'postgresql':
+            schema_editor.execute(f'DROP INDEX IF EXISTS {tabela}_{coluna}_trgm')
+        elif vendor == 'sqlite':
+            fts = f'{tabela}_{coluna}_fts'
+            for acao in ('insert', 'delete', 'update'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts}_{acao}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastros', '0003_resumodiariopedido'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indices, remover_indices),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# Campos buscados por prefixo nos autocompletes (tabela, coluna, do usuario);
+# ver AutocompleteMixin em cadastros/views.py
+CAMPOS_PREFIXO = [
+    ('cadastros_fornecedor', 'nome', True),
+    ('cadastros_item', 'nome', True),
+    ('cadastros_frota', 'prefixo', True),
+    ('cadastros_cidade', 'nome', False),
+]
+
+
+def criar_indices(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    for tabela, coluna, do_usuario in CAMPOS_PREFIXO:
+        if vendor == 'postgresql':
+            # Mesma expressao gerada pelo istartswith: UPPER(coluna::text) LIKE UPPER('abc%');
+            # text_pattern_ops permite o LIKE por prefixo independente da collation
+            expressao = f'(UPPER({coluna}::text)) text_pattern_ops'
+        elif vendor == 'sqlite':
+            # O LIKE do SQLite ignora maiusculas: o indice precisa da collation NOCASE
+            expressao = f'{coluna} COLLATE NOCASE'
+        else:
+            return
+        if do_usuario:
+            # Os autocompletes filtram primeiro pelo dono do cadastro
+            expressao = f'criado_por_id, {expressao}'
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {tabela}_{coluna}_prefixo ON {tabela} ({expressao})'
+        )
+
+
+def remover_indices(apps, schema_editor):
+    if schema_editor.connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    for tabela, coluna, _ in CAMPOS_PREFIXO:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {tabela}_{coluna}_prefixo')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastros', '0004_indices_busca'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indices, remover_indices),
+    ]
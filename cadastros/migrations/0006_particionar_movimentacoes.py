@@ -0,0 +1,134 @@
+import datetime
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+# Nomes e colunas fixados como estavam quando a migracao foi escrita: ela nao
+# deve mudar de comportamento se cadastros/arquivamento.py mudar
+TABELA = 'cadastros_movimentacaopedido'
+TABELA_PADRAO = f'{TABELA}_padrao'
+TABELA_ARQUIVO = f'{TABELA}_arquivo'
+COLUNAS = [
+    'id', 'pedido_id', 'tipo', 'status_anterior', 'status_novo',
+    'observacao', 'data_movimentacao', 'usuario_id',
+]
+MESES_A_FRENTE = 3
+
+
+def _mes(momento):
+    """Primeiro dia do mes de ``momento``, em UTC."""
+    if timezone.is_aware(momento):
+        momento = momento.astimezone(datetime.timezone.utc)
+    return datetime.date(momento.year, momento.month, 1)
+
+
+def _proximo_mes(mes):
+    return datetime.date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+
+def _criar_particoes(executar, primeira):
+    """Particoes mensais do mes de ``primeira`` (ou do atual) ate MESES_A_FRENTE meses adiante."""
+    atual = _mes(timezone.now())
+    ultimo = atual
+    for _ in range(MESES_A_FRENTE):
+        ultimo = _proximo_mes(ultimo)
+
+    mes = _mes(primeira) if primeira else atual
+    while mes <= ultimo:
+        proximo = _proximo_mes(mes)
+        executar(
+            f'CREATE TABLE {TABELA}_p{mes:%Y%m} PARTITION OF {TABELA} '
+            f"FOR VALUES FROM ('{mes.isoformat()} 00:00:00+00') TO ('{proximo.isoformat()} 00:00:00+00')"
+        )
+        mes = proximo
+
+
+def _chaves_estrangeiras(apps):
+    pedido = apps.get_model('cadastros', 'Pedido')._meta.db_table
+    usuario = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    return (
+        f'FOREIGN KEY (pedido_id) REFERENCES {pedido} (id) DEFERRABLE INITIALLY DEFERRED, '
+        f'FOREIGN KEY (usuario_id) REFERENCES {usuario} (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+
+
+def particionar(apps, schema_editor):
+    connection = schema_editor.connection
+    executar = schema_editor.execute
+
+    if connection.vendor == 'postgresql':
+        # A chave primaria de uma tabela particionada precisa conter a coluna
+        # de particionamento; para o Django o id continua sendo a chave
+        executar(f'ALTER TABLE {TABELA} RENAME TO {TABELA}_antiga')
+        executar(
+            f'CREATE TABLE {TABELA} (LIKE {TABELA}_antiga, '
+            f'PRIMARY KEY (id, data_movimentacao), {_chaves_estrangeiras(apps)}) '
+            f'PARTITION BY RANGE (data_movimentacao)'
+        )
+        executar(f'CREATE TABLE {TABELA_PADRAO} PARTITION OF {TABELA} DEFAULT')
+        executar(f'CREATE INDEX {TABELA}_pedido_id_part ON {TABELA} (pedido_id)')
+        executar(f'CREATE INDEX {TABELA}_usuario_id_part ON {TABELA} (usuario_id)')
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT MIN(data_movimentacao) FROM {TABELA}_antiga')
+            primeira = cursor.fetchone()[0]
+        _criar_particoes(executar, primeira)
+
+        executar(f'INSERT INTO {TABELA} SELECT * FROM {TABELA}_antiga')
+        executar(f'DROP TABLE {TABELA}_antiga')
+        # Colunas identity so sao aceitas em tabelas particionadas a partir
+        # do PostgreSQL 17: o id passa a vir de uma sequencia comum
+        executar(f'CREATE SEQUENCE {TABELA}_id_seq OWNED BY {TABELA}.id')
+        executar(f"SELECT setval('{TABELA}_id_seq', COALESCE((SELECT MAX(id) FROM {TABELA}), 0) + 1, false)")
+        executar(f"ALTER TABLE {TABELA} ALTER COLUMN id SET DEFAULT nextval('{TABELA}_id_seq')")
+
+    elif connection.vendor == 'sqlite':
+        executar(
+            f'CREATE TABLE {TABELA_ARQUIVO} ('
+            f'id integer NOT NULL PRIMARY KEY, '
+            f'pedido_id bigint NOT NULL, '
+            f'tipo varchar(20) NOT NULL, '
+            f'status_anterior varchar(20) NULL, '
+            f'status_novo varchar(20) NULL, '
+            f'observacao text NOT NULL, '
+            f'data_movimentacao datetime NOT NULL, '
+            f'usuario_id integer NULL)'
+        )
+        executar(f'CREATE INDEX {TABELA_ARQUIVO}_pedido ON {TABELA_ARQUIVO} (pedido_id, data_movimentacao)')
+        executar(f'CREATE INDEX {TABELA_ARQUIVO}_data ON {TABELA_ARQUIVO} (data_movimentacao)')
+
+
+def desfazer(apps, schema_editor):
+    connection = schema_editor.connection
+    executar = schema_editor.execute
+
+    if connection.vendor == 'postgresql':
+        executar(f'ALTER TABLE {TABELA} RENAME TO {TABELA}_particionada')
+        executar(
+            f'CREATE TABLE {TABELA} (LIKE {TABELA}_particionada INCLUDING DEFAULTS, '
+            f'PRIMARY KEY (id), {_chaves_estrangeiras(apps)})'
+        )
+        executar(f'INSERT INTO {TABELA} SELECT * FROM {TABELA}_particionada')
+        executar(f'ALTER SEQUENCE {TABELA}_id_seq OWNED BY {TABELA}.id')
+        # Remove tambem as particoes
+        executar(f'DROP TABLE {TABELA}_particionada')
+        executar(f'CREATE INDEX {TABELA}_pedido_id_part ON {TABELA} (pedido_id)')
+        executar(f'CREATE INDEX {TABELA}_usuario_id_part ON {TABELA} (usuario_id)')
+
+    elif connection.vendor == 'sqlite':
+        colunas = ', '.join(COLUNAS)
+        executar(f'INSERT INTO {TABELA} ({colunas}) SELECT {colunas} FROM {TABELA_ARQUIVO}')
+        executar(f'DROP TABLE {TABELA_ARQUIVO}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cadastros', '0005_indices_prefixo'),
+    ]
+
+    operations = [
+        migrations.RunPython(particionar, desfazer),
+    ]
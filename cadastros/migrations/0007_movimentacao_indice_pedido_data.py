@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastros', '0006_particionar_movimentacoes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimentacaopedido',
+            index=models.Index(fields=['pedido', '-data_movimentacao', '-id'], name='movimentacao_pedido_data'),
+        ),
+    ]
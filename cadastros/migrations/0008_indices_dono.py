@@ -0,0 +1,45 @@
+# Generated by Django 4.2.20 on 2026-10-18 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastros', '0007_movimentacao_indice_pedido_data'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='categoriaitem',
+            index=models.Index(fields=['criado_por', 'nome'], name='categoriaitem_dono_nome'),
+        ),
+        migrations.AddIndex(
+            model_name='fornecedor',
+            index=models.Index(fields=['criado_por', 'nome'], name='fornecedor_dono_nome'),
+        ),
+        migrations.AddIndex(
+            model_name='frota',
+            index=models.Index(fields=['criado_por', 'prefixo'], name='frota_dono_prefixo'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['criado_por', 'nome'], name='item_dono_nome'),
+        ),
+        migrations.AddIndex(
+            model_name='itempedido',
+            index=models.Index(fields=['criado_por', 'pedido', 'item', 'id'], name='itempedido_dono_pedido'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['criado_por', '-data_pedido', '-id'], name='pedido_dono_data'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['criado_por', 'status', '-data_pedido', '-id'], name='pedido_dono_status_data'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['criado_por', 'previsao_entrega'], name='pedido_dono_previsao'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.20 on 2026-10-18 11:10
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# No SQLite o AddField de uma coluna unique recria a tabela, perdendo os
+# indices criados por SQL na 0005; eles sao recriados (IF NOT EXISTS) depois
+# das alteracoes, nos dois sentidos
+indices_prefixo = import_module('cadastros.migrations.0005_indices_prefixo')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastros', '0008_indices_dono'),
+    ]
+
+    operations = [
+        # Ao desfazer, roda depois das remocoes das colunas
+        migrations.RunPython(migrations.RunPython.noop, indices_prefixo.criar_indices),
+        migrations.AddField(
+            model_name='cidade',
+            name='codigo_ibge',
+            field=models.PositiveIntegerField(blank=True, null=True, unique=True, verbose_name='Código IBGE'),
+        ),
+        migrations.AddField(
+            model_name='estado',
+            name='codigo_ibge',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, unique=True, verbose_name='Código IBGE'),
+        ),
+        migrations.RunPython(indices_prefixo.criar_indices, migrations.RunPython.noop),
+    ]
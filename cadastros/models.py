@@ -17,6 +17,8 @@ ESTADOS = [
 class Estado(models.Model):
     nome = models.CharField(max_length=100, choices=[(e, e) for e in ESTADOS])
     sigla = models.CharField(max_length=2, choices=[(s, s) for s in SIGLAS])
+    # Codigo da UF no IBGE, chave da carga de municipios (ver municipios.py)
+    codigo_ibge = models.PositiveSmallIntegerField('Código IBGE', unique=True, null=True, blank=True)
 
     def __str__(self):
         return f"{self.nome} - {self.sigla}"
@@ -30,9 +32,16 @@ class Estado(models.Model):
 class Cidade(models.Model):
     nome = models.CharField(max_length=100)
     estado = models.ForeignKey(Estado, on_delete=models.CASCADE)
+    codigo_ibge = models.PositiveIntegerField('Código IBGE', unique=True, null=True, blank=True)
 
     def __str__(self):
-        return f"{self.nome} - {self.estado.sigla}"
+        if Cidade.estado.is_cached(self):
+            estado = self.estado
+        else:
+            # Sem consultar o estado: vem do cache de referencia (ver referencia.py)
+            from .referencia import estado as estado_em_cache
+            estado = estado_em_cache(self.estado_id) or self.estado
+        return f"{self.nome} - {estado.sigla}"
 
     class Meta:
         verbose_name = "Cidade"
@@ -56,6 +65,9 @@ class Fornecedor(models.Model):
         verbose_name = "Fornecedor"
         verbose_name_plural = "Fornecedores"
         ordering = ['nome']
+        indexes = [
+            models.Index(fields=['criado_por', 'nome'], name='fornecedor_dono_nome'),
+        ]
 
 
 class Frota(models.Model):
@@ -71,6 +83,9 @@ class Frota(models.Model):
         verbose_name = "Frota"
         verbose_name_plural = "Frotas"
         ordering = ['prefixo']
+        indexes = [
+            models.Index(fields=['criado_por', 'prefixo'], name='frota_dono_prefixo'),
+        ]
 
 
 class CategoriaItem(models.Model):
@@ -84,6 +99,9 @@ class CategoriaItem(models.Model):
         verbose_name = "Categoria de Item"
         verbose_name_plural = "Categorias de Itens"
         ordering = ['nome']
+        indexes = [
+            models.Index(fields=['criado_por', 'nome'], name='categoriaitem_dono_nome'),
+        ]
 
 
 class Item(models.Model):
@@ -98,6 +116,9 @@ class Item(models.Model):
         verbose_name = "Item"
         verbose_name_plural = "Itens"
         ordering = ['nome']
+        indexes = [
+            models.Index(fields=['criado_por', 'nome'], name='item_dono_nome'),
+        ]
 
 
 class Pedido(models.Model):
@@ -118,10 +139,29 @@ class Pedido(models.Model):
     def __str__(self):
         return f"Pedido #{self.id} - {self.fornecedor}"
 
+    def save(self, *args, **kwargs):
+        # O valor_total de um pedido existente e mantido no banco pelos deltas
+        # dos itens (ver totais.py): save() so o grava quando pedido
+        # explicitamente em update_fields, para que uma instancia carregada
+        # antes dos deltas nao os desfaca
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                campo.attname for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name != 'valor_total'
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Pedido"
         verbose_name_plural = "Pedidos"
         ordering = ['-data_pedido']
+        # Consultas de pedidos sempre filtram pelo dono primeiro (listas,
+        # filtros e dashboard); ver PlanoConsultasTest em tests.py
+        indexes = [
+            models.Index(fields=['criado_por', '-data_pedido', '-id'], name='pedido_dono_data'),
+            models.Index(fields=['criado_por', 'status', '-data_pedido', '-id'], name='pedido_dono_status_data'),
+            models.Index(fields=['criado_por', 'previsao_entrega'], name='pedido_dono_previsao'),
+        ]
 
 
 class ItemPedido(models.Model):
@@ -147,6 +187,17 @@ class ItemPedido(models.Model):
         verbose_name = "Item de Pedido"
         verbose_name_plural = "Itens de Pedido"
         ordering = ['pedido', 'item']
+        indexes = [
+            models.Index(fields=['criado_por', 'pedido', 'item', 'id'], name='itempedido_dono_pedido'),
+        ]
+
+
+# Valor total de uma linha do pedido calculado no banco, para uso em
+# annotate()/aggregate() sem precisar percorrer os itens em Python
+TOTAL_LINHA = models.ExpressionWrapper(
+    models.F('quantidade') * models.F('valor_unitario'),
+    output_field=models.DecimalField(max_digits=20, decimal_places=2),
+)
 
 
 class MovimentacaoPedido(models.Model):
@@ -177,3 +228,37 @@ class MovimentacaoPedido(models.Model):
         verbose_name = "Movimentação de Pedido"
         verbose_name_plural = "Movimentações de Pedidos"
         ordering = ['-data_movimentacao']
+        indexes = [
+            # Historico de um pedido, do mais recente para o mais antigo (ver PedidoHistorico)
+            models.Index(fields=['pedido', '-data_movimentacao', '-id'], name='movimentacao_pedido_data'),
+        ]
+
+
+class ResumoDiarioPedido(models.Model):
+    """
+    Resumo diario dos pedidos de cada usuario, agrupado por status e
+    fornecedor. E mantido de forma incremental a cada escrita em Pedido e
+    ItemPedido (ver resumo.py) e pode ser reconstruido pelo comando
+    ``resumo_pedidos``.
+    """
+    criado_por = models.ForeignKey(User, on_delete=models.CASCADE)
+    dia = models.DateField()
+    status = models.CharField(max_length=20, choices=Pedido.STATUS_CHOICES)
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.CASCADE)
+    num_pedidos = models.IntegerField(default=0)
+    quantidade_itens = models.BigIntegerField(default=0)
+    valor_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.dia} - {self.fornecedor} - {self.get_status_display()}"
+
+    class Meta:
+        verbose_name = "Resumo Diário de Pedidos"
+        verbose_name_plural = "Resumos Diários de Pedidos"
+        ordering = ['-dia']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['criado_por', 'dia', 'status', 'fornecedor'],
+                name='resumo_diario_pedido_unico',
+            ),
+        ]
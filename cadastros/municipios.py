@@ -0,0 +1,187 @@
+"""
+Carga dos municipios do IBGE em Estado e Cidade.
+
+Le o arquivo de municipios (CSV no formato de ``dados/municipios_ibge.csv``
+ou o JSON de https://servicodados.ibge.gov.br/api/v1/localidades/municipios)
+e grava estados e cidades pelo codigo IBGE, com
+``bulk_create(update_conflicts=True)`` em lotes: rodar de novo so altera o
+que mudou no arquivo.
+
+Cadastros feitos a mao, ainda sem codigo, sao aproveitados: o estado pela
+sigla e a cidade pelo nome (sem diferenciar maiusculas) dentro do estado.
+"""
+import csv
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.db import transaction
+
+from . import referencia
+from .models import Cidade, Estado
+
+ARQUIVO_PADRAO = Path(__file__).resolve().parent / 'dados' / 'municipios_ibge.csv'
+
+COLUNAS_CSV = ('codigo_uf', 'sigla_uf', 'nome_uf', 'codigo_municipio', 'nome_municipio')
+
+
+class ArquivoInvalido(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Municipio:
+    codigo: int
+    nome: str
+    codigo_uf: int
+    sigla_uf: str
+    nome_uf: str
+
+
+@dataclass
+class Contagem:
+    inseridos: int = 0
+    atualizados: int = 0
+    inalterados: int = 0
+
+    def __str__(self):
+        return (
+            f'{self.inseridos} inserido(s), {self.atualizados} atualizado(s), '
+            f'{self.inalterados} inalterado(s)'
+        )
+
+
+def ler_municipios(caminho=ARQUIVO_PADRAO):
+    """Municipios do arquivo ``caminho`` (.csv ou .json)."""
+    caminho = Path(caminho)
+    try:
+        if caminho.suffix.lower() == '.json':
+            with caminho.open(encoding='utf-8') as arquivo:
+                return [_municipio_da_api(registro) for registro in json.load(arquivo)]
+        with caminho.open(encoding='utf-8-sig', newline='') as arquivo:
+            leitor = csv.DictReader(arquivo)
+            faltando = set(COLUNAS_CSV) - set(leitor.fieldnames or ())
+            if faltando:
+                raise ArquivoInvalido(f'Colunas ausentes no CSV: {", ".join(sorted(faltando))}')
+            return [
+                Municipio(
+                    codigo=int(linha['codigo_municipio']),
+                    nome=linha['nome_municipio'].strip(),
+                    codigo_uf=int(linha['codigo_uf']),
+                    sigla_uf=linha['sigla_uf'].strip().upper(),
+                    nome_uf=linha['nome_uf'].strip(),
+                )
+                for linha in leitor
+            ]
+    except ArquivoInvalido:
+        raise
+    except (KeyError, TypeError, ValueError) as erro:
+        raise ArquivoInvalido(f'Arquivo de municípios inválido ({caminho.name}): {erro!r}') from erro
+
+
+def _municipio_da_api(registro):
+    # Alguns municipios recentes vem sem microrregiao; a UF tambem esta na
+    # regiao imediata
+    if registro.get('microrregiao'):
+        uf = registro['microrregiao']['mesorregiao']['UF']
+    else:
+        uf = registro['regiao-imediata']['regiao-intermediaria']['UF']
+    return Municipio(
+        codigo=int(registro['id']),
+        nome=registro['nome'].strip(),
+        codigo_uf=int(uf['id']),
+        sigla_uf=uf['sigla'].upper(),
+        nome_uf=uf['nome'].strip(),
+    )
+
+
+def carregar_municipios(municipios, lote=1000):
+    """Grava ``municipios`` e retorna a Contagem de estados e a de cidades."""
+    # Um codigo repetido no arquivo vale pela ultima linha
+    municipios = list({m.codigo: m for m in municipios}.values())
+    ufs = {m.codigo_uf: m for m in municipios}
+
+    with transaction.atomic():
+        contagem_estados = _gravar_estados(ufs.values(), lote)
+        estado_por_codigo = dict(
+            Estado.objects.filter(codigo_ibge__in=ufs).values_list('codigo_ibge', 'pk')
+        )
+        contagem_cidades = _gravar_cidades(municipios, estado_por_codigo, lote)
+
+    # bulk_create e bulk_update nao disparam os sinais que invalidam o cache
+    referencia.invalidar()
+    transaction.on_commit(referencia.invalidar)
+    return contagem_estados, contagem_cidades
+
+
+def _gravar_estados(ufs, lote):
+    contagem = Contagem()
+    existentes = {e.codigo_ibge: e for e in Estado.objects.exclude(codigo_ibge=None)}
+    sem_codigo = {e.sigla: e for e in Estado.objects.filter(codigo_ibge=None)}
+
+    novos, aproveitados = [], []
+    for uf in ufs:
+        estado = existentes.get(uf.codigo_uf)
+        if estado is not None and (estado.nome, estado.sigla) == (uf.nome_uf, uf.sigla_uf):
+            contagem.inalterados += 1
+            continue
+        if estado is None and uf.sigla_uf in sem_codigo:
+            estado = sem_codigo.pop(uf.sigla_uf)
+            estado.codigo_ibge, estado.nome = uf.codigo_uf, uf.nome_uf
+            aproveitados.append(estado)
+            contagem.atualizados += 1
+            continue
+        novos.append(Estado(codigo_ibge=uf.codigo_uf, nome=uf.nome_uf, sigla=uf.sigla_uf))
+        if estado is None:
+            contagem.inseridos += 1
+        else:
+            contagem.atualizados += 1
+
+    Estado.objects.bulk_update(aproveitados, ['codigo_ibge', 'nome'], batch_size=lote)
+    Estado.objects.bulk_create(
+        novos, batch_size=lote,
+        update_conflicts=True, unique_fields=['codigo_ibge'], update_fields=['nome', 'sigla'],
+    )
+    return contagem
+
+
+def _gravar_cidades(municipios, estado_por_codigo, lote):
+    contagem = Contagem()
+    existentes = {
+        codigo: (nome, estado_id)
+        for codigo, nome, estado_id in Cidade.objects.exclude(codigo_ibge=None).values_list(
+            'codigo_ibge', 'nome', 'estado_id'
+        )
+    }
+    sem_codigo = {
+        (estado_id, nome.casefold()): pk
+        for pk, nome, estado_id in Cidade.objects.filter(codigo_ibge=None).values_list('pk', 'nome', 'estado_id')
+    }
+
+    novas, aproveitadas = [], []
+    for municipio in municipios:
+        estado_id = estado_por_codigo[municipio.codigo_uf]
+        anterior = existentes.get(municipio.codigo)
+        if anterior == (municipio.nome, estado_id):
+            contagem.inalterados += 1
+            continue
+
+        chave = (estado_id, municipio.nome.casefold())
+        if anterior is None and chave in sem_codigo:
+            aproveitadas.append(Cidade(
+                pk=sem_codigo.pop(chave), codigo_ibge=municipio.codigo, nome=municipio.nome, estado_id=estado_id,
+            ))
+            contagem.atualizados += 1
+            continue
+        novas.append(Cidade(codigo_ibge=municipio.codigo, nome=municipio.nome, estado_id=estado_id))
+        if anterior is None:
+            contagem.inseridos += 1
+        else:
+            contagem.atualizados += 1
+
+    Cidade.objects.bulk_update(aproveitadas, ['codigo_ibge', 'nome'], batch_size=lote)
+    Cidade.objects.bulk_create(
+        novas, batch_size=lote,
+        update_conflicts=True, unique_fields=['codigo_ibge'], update_fields=['nome', 'estado'],
+    )
+    return contagem
@@ -0,0 +1,165 @@
+"""
+Opcoes de campos de escolha avaliadas uma unica vez por requisicao.
+
+Cada form de um formset recebe copias proprias dos campos, e um
+ModelChoiceField consulta o banco ao renderizar o <select> e de novo ao
+validar o valor enviado. Com OpcoesCompartilhadas os registros sao buscados
+uma vez e todos os campos que as usam compartilham a mesma lista de choices
+e o mesmo indice por pk.
+
+Como os selects usam autocomplete (ver AutocompleteMixin em views.py), so
+os registros escolhidos nos forms precisam ser carregados: cada campo
+registra o seu valor com ``incluir`` e a primeira utilizacao busca todos os
+pks registrados em uma unica consulta.
+"""
+from django import forms
+from django.core.exceptions import ValidationError
+from django.utils.functional import cached_property
+
+from .models import Fornecedor, Frota, Item
+
+
+class OpcoesCompartilhadas:
+    """Registros escolhidos em um campo de escolha, buscados na primeira utilizacao."""
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self.pks = set()
+        self._choices = {}
+
+    def incluir(self, valor):
+        """Registra o pk escolhido em um dos forms."""
+        if valor in forms.Field.empty_values or str(valor) in self.pks:
+            return
+        self.pks.add(str(valor))
+        # Um form criado depois da primeira utilizacao refaz a busca
+        for atributo in ('registros', 'por_pk'):
+            self.__dict__.pop(atributo, None)
+        self._choices.clear()
+
+    @cached_property
+    def registros(self):
+        campo_pk = self.queryset.model._meta.pk
+        pks = []
+        for pk in self.pks:
+            try:
+                pks.append(campo_pk.to_python(pk))
+            except ValidationError:
+                # Valor invalido enviado no POST: o campo rejeita na validacao
+                pass
+        if not pks:
+            return []
+        return list(self.queryset.filter(pk__in=pks))
+
+    @cached_property
+    def por_pk(self):
+        return {str(registro.pk): registro for registro in self.registros}
+
+    def __iter__(self):
+        return iter(self.registros)
+
+    def choices(self, campo):
+        """Choices do ``campo``, montadas uma vez para cada empty_label."""
+        return EscolhasCompartilhadas(self, campo)
+
+    def _lista_choices(self, campo):
+        if campo.empty_label not in self._choices:
+            choices = [] if campo.empty_label is None else [('', campo.empty_label)]
+            choices += [(registro.pk, campo.label_from_instance(registro)) for registro in self.registros]
+            self._choices[campo.empty_label] = choices
+        return self._choices[campo.empty_label]
+
+
+class EscolhasCompartilhadas:
+    """
+    Choices de um campo que so buscam os registros quando o <select> e
+    renderizado, depois que todos os forms registraram seus valores.
+    """
+
+    def __init__(self, opcoes, campo):
+        self.opcoes = opcoes
+        self.campo = campo
+
+    def __iter__(self):
+        return iter(self.opcoes._lista_choices(self.campo))
+
+    def __len__(self):
+        return len(self.opcoes._lista_choices(self.campo))
+
+    def __bool__(self):
+        return True
+
+
+class CampoEscolhaCompartilhada(forms.ModelChoiceField):
+    """
+    ModelChoiceField que, depois de ``usar_opcoes``, renderiza e valida a
+    partir de OpcoesCompartilhadas, sem consultar o banco. Sem opcoes,
+    funciona como um ModelChoiceField comum.
+    """
+    opcoes = None
+
+    def usar_opcoes(self, opcoes):
+        self.opcoes = opcoes
+        # O setter do queryset tambem atualiza as choices do widget
+        self.queryset = opcoes.queryset
+
+    def _get_choices(self):
+        if self.opcoes is not None:
+            return self.opcoes.choices(self)
+        return super()._get_choices()
+
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
+
+    def to_python(self, value):
+        if self.opcoes is None or value in self.empty_values:
+            return super().to_python(value)
+        if isinstance(value, self.queryset.model):
+            value = value.pk
+        try:
+            return self.opcoes.por_pk[str(value)]
+        except KeyError:
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+
+
+class OpcoesCompartilhadasFormMixin:
+    """
+    ModelForm com campos CampoEscolhaCompartilhada. Recebe ``opcoes``, um
+    dicionario {campo: OpcoesCompartilhadas}, e registra nelas o valor atual
+    de cada campo. A validacao do modelo nao repete, para cada form, a
+    consulta de existencia das chaves estrangeiras que o campo ja encontrou
+    entre as opcoes.
+    """
+
+    def __init__(self, *args, opcoes=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        for nome, opcoes_campo in (opcoes or {}).items():
+            campo = self.fields.get(nome)
+            if isinstance(campo, CampoEscolhaCompartilhada):
+                opcoes_campo.incluir(self[nome].value())
+                campo.usar_opcoes(opcoes_campo)
+
+    def _get_validation_exclusions(self):
+        exclusoes = super()._get_validation_exclusions()
+        for nome, campo in self.fields.items():
+            if isinstance(campo, CampoEscolhaCompartilhada) and campo.opcoes is not None:
+                exclusoes.add(nome)
+        return exclusoes
+
+
+def opcoes_pedido(user):
+    """Opcoes de fornecedor, item e frota do formulario de pedido de ``user``."""
+    return {
+        'fornecedor': OpcoesCompartilhadas(
+            Fornecedor.objects.select_related('cidade', 'estado').filter(criado_por=user)
+        ),
+        'item': OpcoesCompartilhadas(
+            Item.objects.select_related('categoria').filter(criado_por=user)
+        ),
+        'frota': OpcoesCompartilhadas(
+            Frota.objects.filter(criado_por=user)
+        ),
+    }
@@ -0,0 +1,190 @@
+"""
+Paginacao por cursor (keyset) para listas que crescem com o historico.
+
+Em vez de OFFSET + COUNT(*), cada pagina e buscada a partir dos valores de
+ordenacao da ultima linha exibida, entao o custo de uma pagina nao depende
+de quantas paginas vem antes dela. O cursor enviado ao navegador e opaco
+(JSON em base64) e guarda a direcao e esses valores.
+"""
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+
+# Intervalo de um inteiro de 64 bits, o maior que os bancos aceitam
+INTEIRO_MINIMO = -2 ** 63
+INTEIRO_MAXIMO = 2 ** 63 - 1
+
+
+def _serializar(valor):
+    # isoformat preserva os microssegundos, necessarios para comparar datas
+    if isinstance(valor, (datetime.datetime, datetime.date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def codificar_cursor(direcao, valores):
+    dados = json.dumps([direcao, [_serializar(v) for v in valores]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    try:
+        preenchimento = '=' * (-len(cursor) % 4)
+        direcao, valores = json.loads(base64.urlsafe_b64decode(cursor + preenchimento))
+    except (ValueError, TypeError, binascii.Error):
+        raise Http404('Cursor de paginação inválido.')
+    if direcao not in ('proxima', 'anterior') or not isinstance(valores, list):
+        raise Http404('Cursor de paginação inválido.')
+    return direcao, valores
+
+
+class PaginaCursor:
+    """Pagina de resultados compativel com o uso de ``page_obj`` nos templates."""
+
+    paginacao_cursor = True
+
+    def __init__(self, object_list, cursor_proximo=None, cursor_anterior=None):
+        self.object_list = object_list
+        self.next_cursor = cursor_proximo
+        self.previous_cursor = cursor_anterior
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class PaginadorCursor:
+    """
+    Pagina ``queryset`` pela ordenacao ``ordenacao`` (ex.: ('-data_pedido', '-id')).
+    O ultimo campo deve ser unico para que a ordem seja total.
+    """
+
+    def __init__(self, queryset, per_page, ordenacao):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.campos = [(campo.lstrip('-'), campo.startswith('-')) for campo in ordenacao]
+
+    def _ordenar(self, reverso):
+        return self.queryset.order_by(*[
+            f'-{campo}' if decrescente != reverso else campo
+            for campo, decrescente in self.campos
+        ])
+
+    def _converter(self, valores):
+        """Valores do cursor convertidos pelos campos do model; o cursor vem do navegador."""
+        if len(valores) != len(self.campos):
+            raise Http404('Cursor de paginação inválido.')
+        opcoes = self.queryset.model._meta
+        convertidos = []
+        for (campo, _), valor in zip(self.campos, valores):
+            field = opcoes.get_field(campo)
+            try:
+                convertido = field.to_python(valor)
+            except (ValidationError, TypeError, ValueError):
+                raise Http404('Cursor de paginação inválido.')
+            # Os campos de ordenacao nao sao nulos; None nao tem posicao na ordem
+            if convertido is None or not self._no_intervalo(field, convertido):
+                raise Http404('Cursor de paginação inválido.')
+            convertidos.append(convertido)
+        return convertidos
+
+    def _no_intervalo(self, field, valor):
+        """Inteiros fora do intervalo da coluna estouram no driver do banco."""
+        if not isinstance(valor, int):
+            return True
+        alvo = field.target_field if field.is_relation else field
+        try:
+            minimo, maximo = connections[self.queryset.db].ops.integer_field_range(alvo.get_internal_type())
+        except KeyError:
+            minimo, maximo = None, None
+        # Sem limite declarado (SQLite), vale o do inteiro de 64 bits do driver
+        minimo = INTEIRO_MINIMO if minimo is None else minimo
+        maximo = INTEIRO_MAXIMO if maximo is None else maximo
+        return minimo <= valor <= maximo
+
+    def _filtro_apos(self, valores, reverso):
+        """Linhas que vem depois de ``valores`` na ordenacao (ou antes, se reverso)."""
+        # (a, b) > (x, y)  =>  a > x OR (a = x AND b > y)
+        condicoes = Q()
+        iguais = {}
+        for (campo, decrescente), valor in zip(self.campos, valores):
+            operador = 'lt' if decrescente != reverso else 'gt'
+            condicoes |= Q(**iguais, **{f'{campo}__{operador}': valor})
+            iguais[campo] = valor
+
+        # Limite redundante no primeiro campo ajuda o banco a usar o indice
+        primeiro_campo, decrescente = self.campos[0]
+        limite = 'lte' if decrescente != reverso else 'gte'
+        return Q(**{f'{primeiro_campo}__{limite}': valores[0]}) & condicoes
+
+    def _valores(self, objeto):
+        return [getattr(objeto, campo) for campo, _ in self.campos]
+
+    def pagina(self, cursor=None):
+        direcao, valores = decodificar_cursor(cursor) if cursor else ('proxima', None)
+        reverso = direcao == 'anterior'
+
+        queryset = self._ordenar(reverso)
+        if valores is not None:
+            queryset = queryset.filter(self._filtro_apos(self._converter(valores), reverso))
+
+        # Uma linha a mais indica se existe outra pagina nessa direcao
+        linhas = list(queryset[:self.per_page + 1])
+        tem_mais = len(linhas) > self.per_page
+        linhas = linhas[:self.per_page]
+        if reverso:
+            linhas.reverse()
+
+        if not linhas:
+            return PaginaCursor(linhas)
+
+        cursor_proximo = codificar_cursor('proxima', self._valores(linhas[-1]))
+        cursor_anterior = codificar_cursor('anterior', self._valores(linhas[0]))
+        if reverso:
+            tem_proxima, tem_anterior = True, tem_mais
+        else:
+            tem_proxima, tem_anterior = tem_mais, valores is not None
+
+        return PaginaCursor(
+            linhas,
+            cursor_proximo=cursor_proximo if tem_proxima else None,
+            cursor_anterior=cursor_anterior if tem_anterior else None,
+        )
+
+
+class PaginacaoCursorMixin:
+    """
+    Troca a paginacao por OFFSET de uma ListView pela paginacao por cursor
+    quando ``ordenacao_cursor`` e definida. Sem ela (tabelas pequenas), a view
+    continua usando o Paginator padrao do Django.
+    """
+    ordenacao_cursor = None
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.ordenacao_cursor:
+            return super().paginate_queryset(queryset, page_size)
+
+        paginador = PaginadorCursor(queryset, page_size, self.ordenacao_cursor)
+        pagina = paginador.pagina(self.request.GET.get(self.cursor_kwarg))
+        return (paginador, pagina, pagina.object_list, pagina.has_other_pages())
@@ -0,0 +1,251 @@
+"""
+Cache local do processo para os dados de referencia (Estado e Cidade).
+
+Estados sao fixos e cidades quase nunca mudam, mas aparecem em todo
+formulario, lista e painel de fornecedores. Cada processo carrega as duas
+tabelas uma vez e passa a responder consultas, choices e ``Cidade.__str__``
+sem ir ao banco.
+
+A copia local e marcada com a versao gravada no cache compartilhado
+(``CHAVE_VERSAO``). Uma escrita em Estado ou Cidade avanca essa versao (ver
+signals.py); os demais processos conferem a versao no maximo a cada
+``REFERENCIA_CACHE_INTERVALO`` segundos e recarregam quando ela mudou.
+Escritas em massa, que nao disparam sinais, devem chamar ``invalidar()``.
+
+Com um cache local (LocMemCache) a versao nao e compartilhada e os outros
+processos nao percebem a escrita. Por isso os formularios (OpcoesReferencia)
+conferem no banco um pk escolhido que falta na copia local e, se ele existe,
+recarregam a copia antes de validar.
+
+As instancias sao compartilhadas entre requisicoes e nao devem ser alteradas.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Cidade, Estado
+
+CHAVE_VERSAO = 'referencia:versao'
+
+_dados = None
+_verificado_em = 0.0
+_lock = threading.Lock()
+
+
+def _chave_busca(texto):
+    return texto.casefold()
+
+
+class DadosReferencia:
+    """Estados e cidades carregados do banco, com indices para as consultas."""
+
+    def __init__(self, versao):
+        self.versao = versao
+        self.estados = {estado.pk: estado for estado in Estado.objects.order_by('nome', 'pk')}
+        self.cidades = {}
+        self.cidades_por_estado = {pk: [] for pk in self.estados}
+        for cidade in Cidade.objects.order_by('nome', 'pk'):
+            # Preenche o cache da FK: cidade.estado nao consulta o banco
+            cidade.estado = self.estados[cidade.estado_id]
+            self.cidades[cidade.pk] = cidade
+            self.cidades_por_estado[cidade.estado_id].append(cidade)
+
+        # Listas ordenadas pelo nome normalizado para a busca por prefixo
+        self.busca = self._indice(self.cidades.values())
+        self.busca_por_estado = {pk: self._indice(cidades) for pk, cidades in self.cidades_por_estado.items()}
+        self._choices = {}
+
+    @staticmethod
+    def _indice(cidades):
+        ordenadas = sorted(cidades, key=lambda cidade: (_chave_busca(cidade.nome), cidade.pk))
+        return [_chave_busca(cidade.nome) for cidade in ordenadas], ordenadas
+
+    def choices(self, model, campo):
+        """Choices de ``campo`` para todos os registros de ``model``, montadas uma vez."""
+        chave = (model, campo.empty_label)
+        if chave not in self._choices:
+            registros = self.estados if model is Estado else self.cidades
+            choices = [] if campo.empty_label is None else [('', campo.empty_label)]
+            choices += [(registro.pk, str(registro)) for registro in registros.values()]
+            self._choices[chave] = choices
+        return self._choices[chave]
+
+
+def _intervalo():
+    return getattr(settings, 'REFERENCIA_CACHE_INTERVALO', 5)
+
+
+def _versao():
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        # A versao nao expira; se for descartada pelo cache, recomeca em 0
+        cache.add(CHAVE_VERSAO, 0, timeout=None)
+        versao = cache.get(CHAVE_VERSAO, 0)
+    return versao
+
+
+def dados():
+    """Dados de referencia do processo, recarregados quando a versao muda."""
+    global _dados, _verificado_em
+
+    atual = _dados
+    agora = time.monotonic()
+    if atual is not None and agora - _verificado_em < _intervalo():
+        return atual
+
+    versao = _versao()
+    if atual is None or atual.versao != versao:
+        with _lock:
+            if _dados is None or _dados.versao != versao:
+                _dados = DadosReferencia(versao)
+            atual = _dados
+    _verificado_em = agora
+    return atual
+
+
+def recarregar():
+    """Recarrega a copia local agora, sem avancar a versao dos outros processos."""
+    global _dados, _verificado_em
+    with _lock:
+        _dados = DadosReferencia(_versao())
+        _verificado_em = time.monotonic()
+        return _dados
+
+
+def invalidar():
+    """Descarta a copia local e avanca a versao, para todos os processos recarregarem."""
+    global _dados
+    _dados = None
+    if not cache.add(CHAVE_VERSAO, 1, timeout=None):
+        try:
+            cache.incr(CHAVE_VERSAO)
+        except ValueError:
+            cache.set(CHAVE_VERSAO, 1, timeout=None)
+
+
+def estados():
+    """Todos os estados, ordenados pelo nome."""
+    return list(dados().estados.values())
+
+
+def estado(pk):
+    return dados().estados.get(_inteiro(pk))
+
+
+def cidade(pk):
+    return dados().cidades.get(_inteiro(pk))
+
+
+def sigla(estado_id):
+    registro = estado(estado_id)
+    return registro.sigla if registro else ''
+
+
+def cidades(estado_id=None, prefixo=''):
+    """
+    Cidades ordenadas pelo nome, opcionalmente so as de ``estado_id`` e as
+    que comecam com ``prefixo`` (sem diferenciar maiusculas).
+    """
+    atual = dados()
+    if estado_id in (None, ''):
+        chaves, ordenadas = atual.busca
+    else:
+        chaves, ordenadas = atual.busca_por_estado.get(_inteiro(estado_id), ([], []))
+
+    if not prefixo:
+        return list(ordenadas)
+    prefixo = _chave_busca(prefixo)
+    inicio = fim = bisect_left(chaves, prefixo)
+    while fim < len(chaves) and chaves[fim].startswith(prefixo):
+        fim += 1
+    return ordenadas[inicio:fim]
+
+
+def anexar(fornecedores):
+    """
+    Preenche ``cidade`` e ``estado`` dos fornecedores a partir do cache, no
+    lugar de um select_related com as duas tabelas.
+    """
+    atual = dados()
+    for fornecedor in fornecedores:
+        # Um cadastro mais novo que a copia local cai na consulta normal da FK
+        if fornecedor.cidade_id in atual.cidades:
+            fornecedor.cidade = atual.cidades[fornecedor.cidade_id]
+        if fornecedor.estado_id in atual.estados:
+            fornecedor.estado = atual.estados[fornecedor.estado_id]
+    return fornecedores
+
+
+def _inteiro(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+class OpcoesReferencia:
+    """
+    Opcoes de um CampoEscolhaCompartilhada (ver opcoes.py) servidas pelo
+    cache: o campo renderiza e valida Estado/Cidade sem consultar o banco,
+    a nao ser que o valor escolhido falte na copia local.
+    """
+
+    # Maior valor de um BigAutoField; acima disso o pk nao existe e a
+    # consulta falharia no banco
+    PK_MAXIMO = 2 ** 63 - 1
+
+    def __init__(self, model):
+        self.model = model
+        self.queryset = model.objects.all()
+        self.pks = set()
+        self._dados = None
+
+    def incluir(self, valor):
+        """Registra o pk escolhido em um dos forms."""
+        pk = _inteiro(getattr(valor, 'pk', valor))
+        if pk is not None and pk not in self.pks:
+            self.pks.add(pk)
+            self._dados = None
+
+    def _registros(self, atual):
+        return atual.estados if self.model is Estado else atual.cidades
+
+    def dados(self):
+        if self._dados is None:
+            atual = dados()
+            faltando = [
+                pk for pk in self.pks
+                if pk not in self._registros(atual) and 0 < pk <= self.PK_MAXIMO
+            ]
+            if faltando and self.queryset.filter(pk__in=faltando).exists():
+                # Cadastrado em outro processo depois da carga da copia local
+                atual = recarregar()
+            self._dados = atual
+        return self._dados
+
+    @property
+    def por_pk(self):
+        return _PorPk(self._registros(self.dados()))
+
+    def choices(self, campo):
+        return self.dados().choices(self.model, campo)
+
+
+class _PorPk:
+    """Acesso por pk em texto, como o ``por_pk`` de OpcoesCompartilhadas."""
+
+    def __init__(self, registros):
+        self.registros = registros
+
+    def __getitem__(self, pk):
+        registro = self.registros.get(_inteiro(pk))
+        if registro is None:
+            raise KeyError(pk)
+        return registro
+
+
+def opcoes_referencia():
+    return {'estado': OpcoesReferencia(Estado), 'cidade': OpcoesReferencia(Cidade)}
@@ -0,0 +1,191 @@
+"""
+Manutencao incremental do ResumoDiarioPedido.
+
+Cada pedido contribui com 1 em ``num_pedidos`` e cada item com sua quantidade
+e valor (quantidade * valor_unitario) na linha do resumo identificada pela
+chave (dono, dia, status, fornecedor) do seu pedido. As funcoes deste modulo
+aplicam deltas nessa chave a cada escrita; os receivers em signals.py as
+chamam a partir dos sinais de Pedido e ItemPedido.
+
+Escritas que nao disparam sinais (``QuerySet.update``, ``bulk_create``...)
+devem chamar ``recalcular_pedido`` ou o comando ``resumo_pedidos``.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, QuerySet, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ItemPedido, Pedido, ResumoDiarioPedido
+
+
+def chave_pedido(criado_por_id, data_pedido, status, fornecedor_id):
+    """Chave da linha de resumo a que um pedido pertence."""
+    return (criado_por_id, timezone.localdate(data_pedido), status, fornecedor_id)
+
+
+def chave_de(pedido):
+    return chave_pedido(pedido.criado_por_id, pedido.data_pedido, pedido.status, pedido.fornecedor_id)
+
+
+def valor_item(quantidade, valor_unitario):
+    return Decimal(quantidade) * Decimal(str(valor_unitario))
+
+
+def aplicar_delta(chave, pedidos=0, quantidade=0, valor=Decimal('0')):
+    """
+    Soma os deltas na linha de resumo ``chave``, criando a linha se preciso.
+
+    Deltas que so subtraem nunca criam linhas: se a linha nao existe (por
+    exemplo, porque esta sendo excluida junto com o fornecedor) nao ha o que
+    descontar.
+    """
+    if not (pedidos or quantidade or valor):
+        return
+
+    criado_por_id, dia, status, fornecedor_id = chave
+    filtro = {
+        'criado_por_id': criado_por_id,
+        'dia': dia,
+        'status': status,
+        'fornecedor_id': fornecedor_id,
+    }
+    atualizar = {
+        'num_pedidos': F('num_pedidos') + pedidos,
+        'quantidade_itens': F('quantidade_itens') + quantidade,
+        'valor_total': F('valor_total') + valor,
+    }
+
+    if ResumoDiarioPedido.objects.filter(**filtro).update(**atualizar):
+        return
+    if pedidos < 0 or quantidade < 0 or valor < 0:
+        return
+
+    try:
+        with transaction.atomic():
+            ResumoDiarioPedido.objects.create(
+                num_pedidos=pedidos, quantidade_itens=quantidade, valor_total=valor, **filtro
+            )
+    except IntegrityError:
+        # Outra transacao criou a linha entre o UPDATE e o INSERT
+        ResumoDiarioPedido.objects.filter(**filtro).update(**atualizar)
+
+
+def totais_itens(pedido_id):
+    """Quantidade e valor somados dos itens de um pedido."""
+    totais = ItemPedido.objects.filter(pedido_id=pedido_id).aggregate(
+        soma_quantidade=Sum('quantidade'),
+        soma_valor=Sum(F('quantidade') * F('valor_unitario')),
+    )
+    return totais['soma_quantidade'] or 0, totais['soma_valor'] or Decimal('0')
+
+
+def mover_pedido(chave_anterior, chave_nova, pedido_id):
+    """Transfere toda a contribuicao de um pedido de uma chave para outra."""
+    quantidade, valor = totais_itens(pedido_id)
+    aplicar_delta(chave_anterior, pedidos=-1, quantidade=-quantidade, valor=-valor)
+    aplicar_delta(chave_nova, pedidos=1, quantidade=quantidade, valor=valor)
+
+
+def recalcular_pedido(pedido, quantidade_anterior, valor_anterior):
+    """
+    Ajusta o resumo depois de escritas em lote nos itens de ``pedido``.
+    Recebe os totais dos itens antes das escritas e retorna os novos.
+    """
+    quantidade, valor = totais_itens(pedido.pk)
+    aplicar_delta(
+        chave_de(pedido),
+        quantidade=quantidade - quantidade_anterior,
+        valor=valor - valor_anterior,
+    )
+    return quantidade, valor
+
+
+def exclusao_em_cascata_de_pedido(origin):
+    """
+    Indica se a exclusao partiu de um Pedido (instancia ou queryset) ou de
+    ``excluir_itens_do_pedido``: nos dois casos quem exclui cuida do resumo.
+    """
+    if isinstance(origin, Pedido):
+        return True
+    return isinstance(origin, QuerySet) and (origin.model is Pedido or getattr(origin, '_itens_do_pedido', False))
+
+
+def excluir_itens_do_pedido(itens):
+    """
+    Exclui ``itens`` (um queryset de ItemPedido) sem que os sinais descontem
+    cada linha do resumo e do valor_total: o chamador recalcula o pedido
+    depois das escritas, com ``recalcular_pedido``.
+    """
+    itens._itens_do_pedido = True
+    return itens.delete()
+
+
+def calcular_resumo(usuarios=None):
+    """
+    Calcula o resumo completo a partir de Pedido e ItemPedido.
+    Retorna um dicionario chave -> [num_pedidos, quantidade_itens, valor_total].
+    """
+    pedidos = Pedido.objects.all()
+    itens = ItemPedido.objects.all()
+    if usuarios is not None:
+        pedidos = pedidos.filter(criado_por__in=usuarios)
+        itens = itens.filter(pedido__criado_por__in=usuarios)
+
+    resumo = defaultdict(lambda: [0, 0, Decimal('0')])
+
+    linhas_pedidos = pedidos.annotate(dia=TruncDate('data_pedido')).order_by().values_list(
+        'criado_por_id', 'dia', 'status', 'fornecedor_id'
+    ).annotate(total=Count('id'))
+    for criado_por_id, dia, status, fornecedor_id, total in linhas_pedidos:
+        resumo[(criado_por_id, dia, status, fornecedor_id)][0] = total
+
+    linhas_itens = itens.annotate(dia=TruncDate('pedido__data_pedido')).order_by().values_list(
+        'pedido__criado_por_id', 'dia', 'pedido__status', 'pedido__fornecedor_id'
+    ).annotate(
+        soma_quantidade=Sum('quantidade'),
+        soma_valor=Sum(F('quantidade') * F('valor_unitario')),
+    )
+    for criado_por_id, dia, status, fornecedor_id, quantidade, valor in linhas_itens:
+        linha = resumo[(criado_por_id, dia, status, fornecedor_id)]
+        linha[1] = quantidade or 0
+        linha[2] = valor or Decimal('0')
+
+    return dict(resumo)
+
+
+def resumo_gravado(usuarios=None):
+    """Le o resumo atual, ignorando linhas zeradas."""
+    linhas = ResumoDiarioPedido.objects.all()
+    if usuarios is not None:
+        linhas = linhas.filter(criado_por__in=usuarios)
+
+    return {
+        (l.criado_por_id, l.dia, l.status, l.fornecedor_id): [l.num_pedidos, l.quantidade_itens, l.valor_total]
+        for l in linhas.iterator()
+        if l.num_pedidos or l.quantidade_itens or l.valor_total
+    }
+
+
+def reconstruir_resumo(usuarios=None, tamanho_lote=1000):
+    """Apaga e recria o resumo (de todos os usuarios ou de ``usuarios``)."""
+    resumo = calcular_resumo(usuarios)
+    with transaction.atomic():
+        linhas = ResumoDiarioPedido.objects.all()
+        if usuarios is not None:
+            linhas = linhas.filter(criado_por__in=usuarios)
+        linhas.delete()
+
+        ResumoDiarioPedido.objects.bulk_create(
+            [
+                ResumoDiarioPedido(
+                    criado_por_id=criado_por_id, dia=dia, status=status, fornecedor_id=fornecedor_id,
+                    num_pedidos=num_pedidos, quantidade_itens=quantidade, valor_total=valor,
+                )
+                for (criado_por_id, dia, status, fornecedor_id), (num_pedidos, quantidade, valor) in resumo.items()
+            ],
+            batch_size=tamanho_lote,
+        )
+    return len(resumo)
@@ -0,0 +1,125 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import referencia, resumo
+from .contadores import invalidar_total_pedidos
+from .totais import ajustar_valor_total
+from .models import Cidade, Estado, ItemPedido, Pedido
+
+
+# === PEDIDO ===
+
+@receiver(pre_save, sender=Pedido)
+def guardar_chave_pedido(sender, instance, raw=False, **kwargs):
+    instance._chave_resumo_anterior = None
+    if raw or instance.pk is None:
+        return
+
+    anterior = Pedido.objects.filter(pk=instance.pk).values(
+        'criado_por_id', 'data_pedido', 'status', 'fornecedor_id'
+    ).first()
+    if anterior:
+        instance._chave_resumo_anterior = resumo.chave_pedido(**anterior)
+
+
+@receiver(post_save, sender=Pedido)
+def atualizar_resumo_pedido(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    chave = resumo.chave_de(instance)
+    anterior = getattr(instance, '_chave_resumo_anterior', None)
+    if created or anterior is None:
+        resumo.aplicar_delta(chave, pedidos=1)
+        invalidar_total_pedidos(instance.criado_por_id)
+    elif anterior != chave:
+        resumo.mover_pedido(anterior, chave, instance.pk)
+
+
+@receiver(pre_delete, sender=Pedido)
+def descontar_pedido(sender, instance, origin=None, **kwargs):
+    # Os itens sao excluidos antes do pedido. Quando a exclusao parte do
+    # proprio pedido, ele desconta tudo aqui de uma vez e os itens ignoram
+    # a propria exclusao; nos demais casos cada item se desconta.
+    if resumo.exclusao_em_cascata_de_pedido(origin):
+        quantidade, valor = resumo.totais_itens(instance.pk)
+    else:
+        quantidade, valor = 0, 0
+    resumo.aplicar_delta(resumo.chave_de(instance), pedidos=-1, quantidade=-quantidade, valor=-valor)
+
+
+@receiver(post_delete, sender=Pedido)
+def invalidar_contadores_pedido(sender, instance, **kwargs):
+    invalidar_total_pedidos(instance.criado_por_id)
+
+
+# === ITEM DO PEDIDO ===
+
+# Os valores anteriores da linha servem ao resumo diario e ao valor_total do pedido
+@receiver(pre_save, sender=ItemPedido)
+def guardar_item_anterior(sender, instance, raw=False, **kwargs):
+    instance._item_resumo_anterior = None
+    if raw or instance.pk is None:
+        return
+
+    instance._item_resumo_anterior = ItemPedido.objects.filter(pk=instance.pk).values_list(
+        'pedido_id', 'quantidade', 'valor_unitario'
+    ).first()
+
+
+def _aplicar_variacao_item(pedido, quantidade, valor):
+    """Aplica a variacao de uma linha no resumo diario e no valor_total do pedido."""
+    resumo.aplicar_delta(resumo.chave_de(pedido), quantidade=quantidade, valor=valor)
+    ajustar_valor_total(pedido.pk, valor)
+
+
+@receiver(post_save, sender=ItemPedido)
+def atualizar_resumo_item(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    valor = resumo.valor_item(instance.quantidade, instance.valor_unitario)
+    anterior = getattr(instance, '_item_resumo_anterior', None)
+
+    if created or anterior is None:
+        _aplicar_variacao_item(instance.pedido, instance.quantidade, valor)
+        return
+
+    pedido_anterior_id, quantidade_anterior, valor_unitario_anterior = anterior
+    valor_anterior = resumo.valor_item(quantidade_anterior, valor_unitario_anterior)
+
+    if pedido_anterior_id == instance.pedido_id:
+        _aplicar_variacao_item(instance.pedido, instance.quantidade - quantidade_anterior, valor - valor_anterior)
+    else:
+        _aplicar_variacao_item(Pedido.objects.get(pk=pedido_anterior_id), -quantidade_anterior, -valor_anterior)
+        _aplicar_variacao_item(instance.pedido, instance.quantidade, valor)
+
+
+@receiver(post_delete, sender=ItemPedido)
+def descontar_item(sender, instance, origin=None, **kwargs):
+    # Na exclusao do proprio pedido, descontar_pedido ja cuidou do resumo e
+    # nao ha total a manter
+    if resumo.exclusao_em_cascata_de_pedido(origin):
+        return
+
+    pedido = Pedido.objects.filter(pk=instance.pedido_id).first()
+    if pedido is not None:
+        _aplicar_variacao_item(
+            pedido, -instance.quantidade, -resumo.valor_item(instance.quantidade, instance.valor_unitario)
+        )
+
+
+# === ESTADO E CIDADE ===
+
+@receiver(post_save, sender=Estado)
+@receiver(post_delete, sender=Estado)
+@receiver(post_save, sender=Cidade)
+@receiver(post_delete, sender=Cidade)
+def invalidar_referencia(sender, raw=False, **kwargs):
+    if raw:
+        return
+    # Agora para este processo; de novo no commit, para que outro processo
+    # que recarregou no meio da transacao nao fique com a versao antiga
+    referencia.invalidar()
+    transaction.on_commit(referencia.invalidar)
@@ -1,3 +1,1641 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import geracao, referencia
+from .arquivamento import (
+    TABELA_PADRAO, arquivar_mes, garantir_particoes, historico_pedido, inicio_do_mes,
+    meses_para_arquivar, nome_particao, particoes,
+)
+from .auditoria import GravadorAdiado, RegistroMovimentacoes, gravador
+from .management.commands.carga_http import percentil
+from .forms import FornecedorForm, PedidoComItensForm
+from .models import (
+    CategoriaItem, Cidade, Estado, Fornecedor, Frota, Item, ItemPedido, MovimentacaoPedido,
+    Pedido, ResumoDiarioPedido
+)
+from .paginacao import codificar_cursor
+from .resumo import calcular_resumo, excluir_itens_do_pedido, resumo_gravado
+
+
+class DadosTesteMixin:
+    """Cria o cadastro basico de um usuario para os testes."""
+
+    def criar_cadastros(self, username='usuarioteste'):
+        cache.clear()
+        self.user = User.objects.create_user(username, password='senha12345')
+        self.estado = Estado.objects.create(nome='Paraná', sigla='PR')
+        self.cidade = Cidade.objects.create(nome='Paranavaí', estado=self.estado)
+        self.fornecedor = Fornecedor.objects.create(
+            nome='Agro Peças', cnpj='00.000.000/0001-00',
+            cidade=self.cidade, estado=self.estado, criado_por=self.user,
+        )
+        self.categoria = CategoriaItem.objects.create(nome='Peças', criado_por=self.user)
+        self.item = Item.objects.create(nome='Filtro', categoria=self.categoria, criado_por=self.user)
+        self.frota = Frota.objects.create(prefixo='01-001', descricao='Trator', ano=2020, criado_por=self.user)
+
+    def criar_pedido(self, itens=1, quantidade=2, valor_unitario='10.00', **kwargs):
+        dados = {'fornecedor': self.fornecedor, 'descricao': 'Pedido de teste', 'criado_por': self.user}
+        dados.update(kwargs)
+        pedido = Pedido.objects.create(**dados)
+        for _ in range(itens):
+            ItemPedido.objects.create(
+                item=self.item, frota=self.frota, pedido=pedido, quantidade=quantidade,
+                valor_unitario=Decimal(valor_unitario), criado_por=self.user,
+            )
+        return pedido
+
+    def dados_formulario(self, linhas, item=None, **extras):
+        """Dados do PedidoComItensForm com ``linhas`` linhas novas."""
+        dados = {
+            'fornecedor': self.fornecedor.pk,
+            'descricao': 'Pedido de teste',
+            'status': 'pendente',
+            'itens-TOTAL_FORMS': linhas,
+            'itens-INITIAL_FORMS': 0,
+            'itens-MIN_NUM_FORMS': 1,
+            'itens-MAX_NUM_FORMS': 1000,
+        }
+        for i in range(linhas):
+            dados.update({
+                f'itens-{i}-item': (item or self.item).pk,
+                f'itens-{i}-frota': self.frota.pk,
+                f'itens-{i}-quantidade': 1,
+                f'itens-{i}-valor_unitario': '2.50',
+            })
+        dados.update(extras)
+        return dados
+
+
+class ResumoDiarioPedidoTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+
+    def assertResumoConsistente(self):
+        self.assertEqual(resumo_gravado(), calcular_resumo())
+
+    def linha(self, status='pendente'):
+        return ResumoDiarioPedido.objects.get(criado_por=self.user, status=status)
+
+    def test_criacao_de_pedido_e_itens(self):
+        self.criar_pedido(itens=3, quantidade=2, valor_unitario='10.50')
+        self.criar_pedido(itens=1, quantidade=1, valor_unitario='5.00')
+
+        linha = self.linha()
+        self.assertEqual(linha.num_pedidos, 2)
+        self.assertEqual(linha.quantidade_itens, 7)
+        self.assertEqual(linha.valor_total, Decimal('68.00'))
+        self.assertResumoConsistente()
+
+    def test_alteracao_de_status_move_o_pedido(self):
+        pedido = self.criar_pedido(itens=2)
+        pedido.status = 'finalizado'
+        pedido.save()
+
+        self.assertEqual(self.linha('pendente').num_pedidos, 0)
+        self.assertEqual(self.linha('finalizado').num_pedidos, 1)
+        self.assertEqual(self.linha('finalizado').quantidade_itens, 4)
+        self.assertResumoConsistente()
+
+    def test_alteracao_e_troca_de_pedido_do_item(self):
+        pedido = self.criar_pedido(itens=1)
+        outro = self.criar_pedido(itens=0, status='em_andamento')
+        item_pedido = pedido.itempedido_set.get()
+
+        item_pedido.quantidade = 5
+        item_pedido.save()
+        self.assertEqual(self.linha().valor_total, Decimal('50.00'))
+
+        item_pedido.pedido = outro
+        item_pedido.save()
+        self.assertEqual(self.linha().quantidade_itens, 0)
+        self.assertEqual(self.linha('em_andamento').quantidade_itens, 5)
+        self.assertResumoConsistente()
+
+    def test_exclusoes(self):
+        pedido = self.criar_pedido(itens=3)
+        self.criar_pedido(itens=2)
+
+        pedido.itempedido_set.first().delete()
+        self.assertResumoConsistente()
+
+        pedido.delete()
+        self.assertEqual(self.linha().num_pedidos, 1)
+        self.assertEqual(self.linha().quantidade_itens, 4)
+        self.assertResumoConsistente()
+
+        Pedido.objects.all().delete()
+        self.assertResumoConsistente()
+
+    def test_exclusao_em_cascata_do_item_de_catalogo(self):
+        self.criar_pedido(itens=2)
+        self.item.delete()
+
+        self.assertEqual(self.linha().num_pedidos, 1)
+        self.assertEqual(self.linha().quantidade_itens, 0)
+        self.assertResumoConsistente()
+
+    def test_exclusao_em_cascata_do_fornecedor(self):
+        self.criar_pedido(itens=2)
+        self.fornecedor.delete()
+
+        self.assertFalse(ResumoDiarioPedido.objects.exists())
+
+    def test_comando_verifica_e_reconstroi(self):
+        self.criar_pedido(itens=2)
+        call_command('resumo_pedidos', '--verificar', stdout=StringIO())
+
+        ResumoDiarioPedido.objects.update(num_pedidos=10)
+        with self.assertRaises(CommandError):
+            call_command('resumo_pedidos', '--verificar', stdout=StringIO())
+
+        call_command('resumo_pedidos', '--usuario', self.user.username, stdout=StringIO())
+        self.assertEqual(self.linha().num_pedidos, 1)
+        call_command('resumo_pedidos', '--verificar', stdout=StringIO())
+
+
+class PaginacaoCursorTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.client.force_login(self.user)
+
+    def percorrer(self, url, contexto, params=None):
+        """Segue os cursores de proxima pagina e devolve os ids de cada pagina."""
+        params = dict(params or {})
+        paginas = []
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            pagina = response.context['page_obj']
+            paginas.append([obj.pk for obj in response.context[contexto]])
+            if not pagina.has_next():
+                return paginas, response
+            params['cursor'] = pagina.next_cursor
+
+    def test_pedidos_sem_repeticao_e_na_ordem(self):
+        for i in range(45):
+            self.criar_pedido(itens=0, status='finalizado' if i % 2 else 'pendente')
+
+        paginas, _ = self.percorrer(reverse('pedido-list'), 'pedidos')
+
+        self.assertEqual([len(p) for p in paginas], [20, 20, 5])
+        esperado = list(Pedido.objects.order_by('-data_pedido', '-id').values_list('pk', flat=True))
+        self.assertEqual(sum(paginas, []), esperado)
+
+    def test_pagina_anterior(self):
+        for _ in range(45):
+            self.criar_pedido(itens=0)
+
+        primeira = self.client.get(reverse('pedido-list'))
+        segunda = self.client.get(reverse('pedido-list'), {'cursor': primeira.context['page_obj'].next_cursor})
+        volta = self.client.get(reverse('pedido-list'), {'cursor': segunda.context['page_obj'].previous_cursor})
+
+        self.assertFalse(primeira.context['page_obj'].has_previous())
+        self.assertEqual(
+            [p.pk for p in volta.context['pedidos']],
+            [p.pk for p in primeira.context['pedidos']],
+        )
+        self.assertFalse(volta.context['page_obj'].has_previous())
+        self.assertTrue(volta.context['page_obj'].has_next())
+
+    def test_cursor_com_filtro(self):
+        for i in range(30):
+            self.criar_pedido(itens=0, status='finalizado' if i % 2 else 'pendente')
+
+        paginas, response = self.percorrer(reverse('pedido-list'), 'pedidos', {'status': 'finalizado'})
+
+        self.assertEqual([len(p) for p in paginas], [15])
+        self.assertTrue(all(p.status == 'finalizado' for p in response.context['pedidos']))
+
+        for i in range(30):
+            self.criar_pedido(itens=0, status='finalizado')
+        paginas, response = self.percorrer(reverse('pedido-list'), 'pedidos', {'status': 'finalizado'})
+        self.assertEqual([len(p) for p in paginas], [20, 20, 5])
+        self.assertContains(response, 'status=finalizado&cursor=')
+
+    def test_itens_de_pedido(self):
+        for _ in range(7):
+            self.criar_pedido(itens=4)
+
+        paginas, _ = self.percorrer(reverse('itempedido-list'), 'itens_pedido')
+
+        esperado = list(ItemPedido.objects.order_by('pedido_id', 'item_id', 'id').values_list('pk', flat=True))
+        self.assertEqual(sum(paginas, []), esperado)
+
+    def test_cursor_invalido(self):
+        response = self.client.get(reverse('pedido-list'), {'cursor': 'nao-e-um-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(reverse('pedido-list'), {'cursor': codificar_cursor('proxima', [1])})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_com_valores_adulterados(self):
+        self.criar_pedido(itens=0)
+        for valores in (
+            ['nao-e-data', 5],
+            [{'a': 1}, 5],
+            ['2024-01-01T00:00:00+00:00', 'abc'],
+            [None, None],
+            ['2024-01-01T00:00:00+00:00', [1]],
+            ['2024-01-01T00:00:00+00:00', 10**30],
+            ['2024-01-01T00:00:00+00:00', -10**30],
+        ):
+            with self.subTest(valores=valores):
+                response = self.client.get(
+                    reverse('pedido-list'), {'cursor': codificar_cursor('proxima', valores)},
+                )
+                self.assertEqual(response.status_code, 404)
+
+        for valores in (['1', 'x', 3], [10**30, 1, 1]):
+            with self.subTest(valores=valores):
+                response = self.client.get(
+                    reverse('itempedido-list'), {'cursor': codificar_cursor('anterior', valores)},
+                )
+                self.assertEqual(response.status_code, 404)
+
+
+class PedidoListEstatisticasTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.client.force_login(self.user)
+        for status in ['pendente', 'pendente', 'em_andamento', 'finalizado']:
+            self.criar_pedido(itens=3, status=status)
+        self.criar_pedido(itens=0, status='finalizado')
+
+    def test_estatisticas_com_filtro_de_frota(self):
+        response = self.client.get(reverse('pedido-list'), {'itempedido__frota__prefixo': '01'})
+
+        self.assertEqual(response.context['total_filtrado'], 4)
+        self.assertEqual(response.context['total_geral'], 5)
+        self.assertEqual(
+            response.context['stats_status'],
+            {'pendente': 2, 'em_andamento': 1, 'finalizado': 1},
+        )
+
+    def test_total_geral_em_cache(self):
+        self.client.get(reverse('pedido-list'))
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('pedido-list'), {'status': 'pendente'})
+
+        # Apenas a consulta agrupada das estatisticas conta pedidos; o total
+        # geral vem do cache
+        sqls = [q['sql'] for q in consultas.captured_queries]
+        self.assertFalse([sql for sql in sqls if 'COUNT(*)' in sql])
+        self.assertEqual(len([sql for sql in sqls if 'GROUP BY "cadastros_pedido"."status"' in sql]), 1)
+        self.assertEqual(response.context['total_geral'], 5)
+
+        self.criar_pedido(itens=0)
+        response = self.client.get(reverse('pedido-list'))
+        self.assertEqual(response.context['total_geral'], 6)
+
+
+class BuscaTextoPedidoTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.client.force_login(self.user)
+        self.outro_fornecedor = Fornecedor.objects.create(
+            nome='Mecânica Silva', cnpj='00.000.000/0002-00',
+            cidade=self.cidade, estado=self.estado, criado_por=self.user,
+        )
+        self.pedido_agro = self.criar_pedido(itens=3)
+        self.pedido_silva = self.criar_pedido(itens=1, fornecedor=self.outro_fornecedor)
+
+    def buscar(self, **filtros):
+        response = self.client.get(reverse('pedido-list'), filtros)
+        return {pedido.pk for pedido in response.context['pedidos']}
+
+    def test_nome_do_fornecedor(self):
+        self.assertEqual(self.buscar(fornecedor__nome='peças'), {self.pedido_agro.pk})
+        self.assertEqual(self.buscar(fornecedor__nome='ICA SIL'), {self.pedido_silva.pk})
+        self.assertEqual(self.buscar(fornecedor__nome='inexistente'), set())
+
+    def test_termo_curto(self):
+        # Abaixo de 3 caracteres nao ha trigramas; a busca usa icontains
+        self.assertEqual(self.buscar(fornecedor__nome='Si'), {self.pedido_silva.pk})
+
+    def test_indice_acompanha_alteracoes(self):
+        self.outro_fornecedor.nome = 'Tratores Brasil'
+        self.outro_fornecedor.save()
+
+        self.assertEqual(self.buscar(fornecedor__nome='silva'), set())
+        self.assertEqual(self.buscar(fornecedor__nome='brasil'), {self.pedido_silva.pk})
+
+    def test_prefixo_da_frota_sem_repetir_pedidos(self):
+        outra_frota = Frota.objects.create(prefixo='05-002', descricao='Colhedora', ano=2021, criado_por=self.user)
+        ItemPedido.objects.create(
+            item=self.item, frota=outra_frota, pedido=self.pedido_silva, quantidade=1,
+            valor_unitario=Decimal('5.00'), criado_por=self.user,
+        )
+
+        response = self.client.get(reverse('pedido-list'), {'itempedido__frota__prefixo': '-00'})
+        self.assertEqual(len(response.context['pedidos']), 2)
+        self.assertEqual(response.context['total_filtrado'], 2)
+        self.assertEqual(self.buscar(itempedido__frota__prefixo='05-0'), {self.pedido_silva.pk})
+
+    def test_usa_indice_de_busca(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Tabelas FTS5 so existem no SQLite')
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.buscar(fornecedor__nome='peças', itempedido__frota__prefixo='01-0')
+
+        sqls = [q['sql'] for q in consultas.captured_queries if 'cadastros_pedido' in q['sql']]
+        self.assertTrue(sqls)
+        for sql in sqls:
+            self.assertIn('"cadastros_fornecedor_nome_fts" MATCH', sql)
+            self.assertIn('"cadastros_frota_prefixo_fts" MATCH', sql)
+            self.assertNotIn('LIKE', sql)
+
+
+class ListasSemConsultaPorLinhaTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.client.force_login(self.user)
+
+    def criar_pedidos(self, num_pedidos, itens_por_pedido):
+        for _ in range(num_pedidos):
+            pedido = self.criar_pedido(itens=0)
+            ItemPedido.objects.bulk_create([
+                ItemPedido(
+                    item=self.item, frota=self.frota, pedido=pedido, quantidade=3,
+                    valor_unitario=Decimal('2.50'), criado_por=self.user,
+                )
+                for _ in range(itens_por_pedido)
+            ])
+
+    def contar_consultas(self, url):
+        cache.clear()
+        # Cidades e estados vem do cache de referencia, carregado uma vez por processo
+        referencia.dados()
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(consultas), response
+
+    def test_lista_de_pedidos(self):
+        self.criar_pedidos(1, 1)
+        poucos, _ = self.contar_consultas(reverse('pedido-list'))
+
+        self.criar_pedidos(19, 50)
+        # sessao, usuario, pagina, estatisticas e total geral: nada depende
+        # do numero de pedidos ou de itens (os fornecedores do filtro vem do
+        # autocomplete)
+        with self.assertNumQueries(poucos):
+            self.client.get(reverse('pedido-list'))
+        muitos, response = self.contar_consultas(reverse('pedido-list'))
+
+        self.assertEqual(poucos, muitos)
+        self.assertEqual(muitos, 5)
+        pedidos = list(response.context['pedidos'])
+        self.assertEqual(len(pedidos), 20)
+        self.assertEqual(sorted(p.item_count for p in pedidos), [1] + [50] * 19)
+        self.assertContains(response, 'Ver Itens (50)')
+        # Os itens nao sao renderizados na lista, apenas carregados sob demanda
+        self.assertNotContains(response, 'Itens do Pedido #')
+
+    def test_item_count_com_filtro_de_frota(self):
+        self.criar_pedidos(2, 5)
+        response = self.client.get(reverse('pedido-list'), {'itempedido__frota__prefixo': '01'})
+        self.assertEqual([p.item_count for p in response.context['pedidos']], [5, 5])
+
+    def test_lista_de_itens(self):
+        self.criar_pedidos(1, 1)
+        poucos, _ = self.contar_consultas(reverse('itempedido-list'))
+
+        self.criar_pedidos(20, 50)
+        muitos, response = self.contar_consultas(reverse('itempedido-list'))
+
+        self.assertEqual(poucos, muitos)
+        self.assertEqual(response.context['itens_pedido'][0].line_total, Decimal('7.50'))
+
+
+class PedidoItensTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.pedido = self.criar_pedido(itens=3, quantidade=4, valor_unitario='1.25')
+        self.url = reverse('pedido-itens', args=[self.pedido.pk])
+
+    def test_dono_recebe_os_itens(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['itens']), 3)
+        self.assertEqual(response.context['itens'][0].line_total, Decimal('5.00'))
+        self.assertContains(response, f'Itens do Pedido #{self.pedido.pk}')
+
+    def test_outro_usuario_nao_acessa(self):
+        outro = User.objects.create_user('outrousuario', password='senha12345')
+        self.client.force_login(outro)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_anonimo_vai_para_o_login(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_pedido_inexistente(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('pedido-itens', args=[self.pedido.pk + 100]))
+        self.assertEqual(response.status_code, 404)
+
+
+class HistoricoPedidoTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.pedido = self.criar_pedido(itens=0)
+        self.url = reverse('pedido-historico', args=[self.pedido.pk])
+        self.client.force_login(self.user)
+
+    def criar_movimentacoes(self, quantidade, pedido=None):
+        MovimentacaoPedido.objects.bulk_create(
+            MovimentacaoPedido(
+                pedido=pedido or self.pedido, tipo='alteracao_dados', observacao=f'mov {i}', usuario=self.user,
+            )
+            for i in range(quantidade)
+        )
+        # Datas repetidas: o id desempata a ordenacao
+        agora = timezone.now()
+        for i, pk in enumerate(MovimentacaoPedido.objects.order_by('id').values_list('pk', flat=True)):
+            MovimentacaoPedido.objects.filter(pk=pk).update(data_movimentacao=agora - datetime.timedelta(minutes=i // 7))
+
+    def test_percorre_todas_as_paginas_na_ordem(self):
+        self.criar_movimentacoes(70)
+        self.criar_movimentacoes(5, pedido=self.criar_pedido(itens=0))
+
+        params, paginas = {}, []
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            paginas.append([m.pk for m in response.context['movimentacoes']])
+            if not response.context['page_obj'].has_next():
+                break
+            params['cursor'] = response.context['page_obj'].next_cursor
+
+        self.assertEqual([len(p) for p in paginas], [30, 30, 10])
+        esperado = list(
+            MovimentacaoPedido.objects.filter(pedido=self.pedido)
+            .order_by('-data_movimentacao', '-id').values_list('pk', flat=True)
+        )
+        self.assertEqual(sum(paginas, []), esperado)
+
+    def test_consultas_nao_dependem_do_tamanho_da_pagina(self):
+        self.criar_movimentacoes(3)
+        with CaptureQueriesContext(connection) as poucas:
+            self.client.get(self.url)
+        self.criar_movimentacoes(40)
+        with CaptureQueriesContext(connection) as muitas:
+            response = self.client.get(self.url)
+        self.assertEqual(len(poucas), len(muitas))
+        self.assertContains(response, self.user.username)
+
+    def test_outro_usuario_nao_acessa(self):
+        outro = User.objects.create_user('outrousuario', password='senha12345')
+        self.client.force_login(outro)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_usa_indice_composto(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Plano verificado apenas no SQLite')
+        plano = MovimentacaoPedido.objects.filter(pedido=self.pedido).order_by('-data_movimentacao', '-id')[:31].explain()
+        self.assertIn('movimentacao_pedido_data', plano)
+        self.assertNotIn('TEMP B-TREE', plano)
+
+
+class ExportacaoPedidoTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.client.force_login(self.user)
+        self.pendente = self.criar_pedido(itens=2, quantidade=3, valor_unitario='1.50')
+        self.finalizado = self.criar_pedido(itens=1, status='finalizado')
+        self.sem_itens = self.criar_pedido(itens=0)
+
+    def exportar(self, formato, **filtros):
+        # Instanciar modelos denunciaria que o resultado foi carregado inteiro
+        with mock.patch.object(Pedido, 'from_db', side_effect=AssertionError), \
+                mock.patch.object(ItemPedido, 'from_db', side_effect=AssertionError):
+            response = self.client.get(reverse('pedido-exportar', args=[formato]), filtros)
+            conteudo = b''.join(response.streaming_content)
+        return response, conteudo
+
+    def linhas_csv(self, **filtros):
+        response, conteudo = self.exportar('csv', **filtros)
+        self.assertEqual(response.status_code, 200)
+        return list(csv.reader(io.StringIO(conteudo.decode('utf-8-sig')), delimiter=';'))
+
+    def test_csv(self):
+        linhas = self.linhas_csv()
+
+        self.assertEqual(linhas[0][0], 'Tipo')
+        self.assertEqual([linha[0] for linha in linhas[1:]],
+                         ['Pedido', 'Pedido', 'Item', 'Pedido', 'Item', 'Item', 'Total geral'])
+        # Pedidos do mais recente para o mais antigo, com seus itens logo abaixo
+        self.assertEqual(linhas[1][1], str(self.sem_itens.pk))
+        self.assertEqual(linhas[4][1], str(self.pendente.pk))
+        self.assertEqual(linhas[4][9:], ['6', '', '9,00'])
+        self.assertEqual(linhas[5][7:], ['Filtro', '01-001', '3', '1,50', '4,50'])
+        self.assertEqual(linhas[-1][1], '3')
+        self.assertEqual(linhas[-1][9:], ['8', '', '29,00'])
+
+    def test_aplica_os_filtros_da_lista(self):
+        outro = User.objects.create_user('outrousuario', password='senha12345')
+        Pedido.objects.create(fornecedor=self.fornecedor, descricao='De outro usuário', criado_por=outro)
+
+        linhas = self.linhas_csv(status='finalizado')
+        self.assertEqual([linha[1] for linha in linhas[1:-1]], [str(self.finalizado.pk)] * 2)
+
+        linhas = self.linhas_csv(itempedido__frota__prefixo='01-0')
+        self.assertEqual(linhas[-1][1], '2')
+
+        # Filtro invalido: como na lista, nenhum pedido
+        linhas = self.linhas_csv(data_pedido__gte='nao-e-data')
+        self.assertEqual(linhas[-1][:2], ['Total geral', '0'])
+
+    def test_xlsx(self):
+        response, conteudo = self.exportar('xlsx')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('.xlsx', response['Content-Disposition'])
+
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as arquivo:
+            self.assertIsNone(arquivo.testzip())
+            planilha = ElementTree.fromstring(arquivo.read('xl/worksheets/sheet1.xml'))
+
+        ns = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        linhas = planilha.findall('s:sheetData/s:row', ns)
+        self.assertEqual(len(linhas), 8)
+        total = [c.findtext('s:v', namespaces=ns) for c in linhas[-1].findall('s:c', ns)]
+        self.assertEqual(total[9], '8')
+        self.assertEqual(total[11], '29.00')
+
+    def test_formato_invalido(self):
+        response = self.client.get(reverse('pedido-exportar', args=['pdf']))
+        self.assertEqual(response.status_code, 404)
+
+
+class OpcoesFormularioPedidoTest(DadosTesteMixin, TestCase):
+    # sessao + usuario + pedido + itens do formset + fornecedor, itens e
+    # frotas escolhidos
+    NUM_QUERIES_EDICAO = 7
+    # fornecedores + itens + frotas
+    NUM_QUERIES_VALIDACAO = 3
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.client.force_login(self.user)
+
+    def test_edicao_com_consultas_fixas(self):
+        # Cadastros que nao foram escolhidos nao sao buscados nem renderizados
+        Item.objects.create(nome='Correia', categoria=self.categoria, criado_por=self.user)
+        Frota.objects.create(prefixo='02-001', descricao='Colheitadeira', ano=2021, criado_por=self.user)
+
+        for linhas in (1, 10, 100):
+            pedido = self.criar_pedido(itens=0)
+            ItemPedido.objects.bulk_create([
+                ItemPedido(item=self.item, frota=self.frota, pedido=pedido, quantidade=1,
+                           valor_unitario=Decimal('1.00'), criado_por=self.user)
+                for _ in range(linhas)
+            ])
+
+            with self.subTest(linhas=linhas), self.assertNumQueries(self.NUM_QUERIES_EDICAO):
+                response = self.client.get(reverse('pedido-update', args=[pedido.pk]))
+            self.assertEqual(len(response.context['item_formset'].forms), linhas)
+            # Apenas a opcao escolhida em cada linha; a linha vazia nao tem opcoes
+            self.assertContains(response, '>Filtro</option>', count=linhas)
+            self.assertNotContains(response, 'Correia')
+            self.assertNotContains(response, '02-001')
+            self.assertContains(response, 'name="itens-__prefix__-item"')
+            self.assertContains(response, f'data-autocomplete-light-url="{reverse("autocomplete-item")}"',
+                                count=linhas + 1)
+
+    def test_cadastro_sem_consultar_opcoes(self):
+        # sessao + usuario
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('cadastrar-pedido'))
+        self.assertNotContains(response, 'Agro Peças')
+        self.assertContains(response, f'data-autocomplete-light-url="{reverse("autocomplete-fornecedor")}"')
+
+    def test_validacao_com_consultas_fixas(self):
+        for linhas in (1, 10, 100):
+            with self.subTest(linhas=linhas), self.assertNumQueries(self.NUM_QUERIES_VALIDACAO):
+                form = PedidoComItensForm(data=self.dados_formulario(linhas), user=self.user)
+                self.assertTrue(form.is_valid(), form.errors)
+            self.assertEqual(form.item_formset.forms[-1].cleaned_data['item'], self.item)
+
+    def test_opcao_de_outro_usuario_invalida(self):
+        outro = User.objects.create_user('outrousuario', password='senha12345')
+        item_alheio = Item.objects.create(nome='Alheio', categoria=self.categoria, criado_por=outro)
+
+        form = PedidoComItensForm(data=self.dados_formulario(2, item=item_alheio), user=self.user)
+        self.assertFalse(form.is_valid())
+        self.assertIn('item', form.item_formset.errors[0])
+
+
+class AutocompleteTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.client.force_login(self.user)
+        self.outro = User.objects.create_user('outrousuario', password='senha12345')
+
+    def buscar(self, nome_url, **params):
+        response = self.client.get(reverse(nome_url), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def textos(self, resultado):
+        return [r['text'] for r in resultado['results']]
+
+    def test_somente_registros_do_usuario(self):
+        Fornecedor.objects.create(
+            nome='Agro Alheio', cnpj='00.000.000/0002-00',
+            cidade=self.cidade, estado=self.estado, criado_por=self.outro,
+        )
+        self.assertEqual(self.textos(self.buscar('autocomplete-fornecedor', q='agro')), ['Agro Peças'])
+
+    def test_busca_por_prefixo(self):
+        Item.objects.create(nome='Óleo de filtro', categoria=self.categoria, criado_por=self.user)
+        self.assertEqual(self.textos(self.buscar('autocomplete-item', q='fil')), ['Filtro - Peças'])
+        self.assertEqual(self.textos(self.buscar('autocomplete-frota', q='01-')), ['01-001 - Trator'])
+        self.assertEqual(self.textos(self.buscar('autocomplete-frota', q='001')), [])
+
+    def test_paginacao(self):
+        Item.objects.bulk_create([
+            Item(nome=f'Item {i:02d}', categoria=self.categoria, criado_por=self.user)
+            for i in range(25)
+        ])
+        primeira = self.buscar('autocomplete-item', q='item')
+        self.assertEqual(len(primeira['results']), 20)
+        self.assertTrue(primeira['pagination']['more'])
+        self.assertEqual(primeira['results'][0]['text'], 'Item 00 - Peças')
+
+        segunda = self.buscar('autocomplete-item', q='item', page=2)
+        self.assertEqual(self.textos(segunda)[-1], 'Item 24 - Peças')
+        self.assertFalse(segunda['pagination']['more'])
+
+    def test_cidades_do_estado_encaminhado(self):
+        sp = Estado.objects.create(nome='São Paulo', sigla='SP')
+        Cidade.objects.create(nome='Paranapanema', estado=sp)
+        self.assertEqual(len(self.buscar('autocomplete-cidade', q='paran')['results']), 2)
+        resultado = self.buscar('autocomplete-cidade', q='paran', forward=f'{{"estado": "{sp.pk}"}}')
+        self.assertEqual(self.textos(resultado), ['Paranapanema - SP'])
+
+    def test_pedido_por_numero_ou_fornecedor(self):
+        pedido = self.criar_pedido(itens=0)
+        self.assertEqual(self.textos(self.buscar('autocomplete-pedido', q=f'#{pedido.pk}')), [str(pedido)])
+        self.assertEqual(self.textos(self.buscar('autocomplete-pedido', q='agro')), [str(pedido)])
+        # Numeros maiores que qualquer pk nao acham nada, em vez de estourar no banco
+        self.assertEqual(self.textos(self.buscar('autocomplete-pedido', q='9' * 30)), [])
+        self.assertEqual(self.textos(self.buscar('autocomplete-pedido', q='²')), [])
+
+    def test_exige_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('autocomplete-fornecedor'), {'q': 'agro'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_usa_indice_de_prefixo(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Plano verificado apenas no SQLite')
+        plano = Item.objects.filter(criado_por=self.user, nome__istartswith='fil').explain()
+        self.assertIn('cadastros_item_nome_prefixo', plano)
+
+    def test_item_avulso_com_cadastro_alheio_invalido(self):
+        pedido = self.criar_pedido(itens=0)
+        item_alheio = Item.objects.create(nome='Alheio', categoria=self.categoria, criado_por=self.outro)
+        response = self.client.post(reverse('cadastrar-itempedido'), {
+            'item': item_alheio.pk, 'pedido': pedido.pk, 'status': 'pendente',
+            'quantidade': 1, 'valor_unitario': '1.00',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('item', response.context['form'].errors)
+        self.assertFalse(ItemPedido.objects.exists())
+
+    def test_formulario_generico_renderiza_so_a_escolhida(self):
+        Cidade.objects.create(nome='Maringá', estado=self.estado)
+        response = self.client.get(reverse('fornecedor-update', args=[self.fornecedor.pk]))
+        self.assertContains(response, '>Paranavaí - PR</option>')
+        self.assertNotContains(response, 'Maringá')
+        self.assertContains(response, reverse('autocomplete-cidade'))
+
+
+class ReferenciaCacheTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.sp = Estado.objects.create(nome='São Paulo', sigla='SP')
+        self.campinas = Cidade.objects.create(nome='Campinas', estado=self.sp)
+        self.paranagua = Cidade.objects.create(nome='Paranaguá', estado=self.estado)
+        referencia.dados()
+
+    def test_consultas_sem_banco(self):
+        cidade = Cidade.objects.get(pk=self.campinas.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(cidade), 'Campinas - SP')
+            self.assertEqual([e.sigla for e in referencia.estados()], ['PR', 'SP'])
+            self.assertEqual(
+                [c.nome for c in referencia.cidades(prefixo='PARAN')], ['Paranaguá', 'Paranavaí']
+            )
+            self.assertEqual([c.nome for c in referencia.cidades(self.sp.pk)], ['Campinas'])
+            self.assertEqual(referencia.cidades(self.sp.pk, 'paran'), [])
+            self.assertEqual(referencia.cidade(str(self.paranagua.pk)).estado.sigla, 'PR')
+            self.assertIsNone(referencia.cidade('abc'))
+
+    def test_alteracao_invalida_o_cache(self):
+        self.sp.sigla = 'SX'
+        self.sp.save()
+        self.assertEqual(str(Cidade.objects.get(pk=self.campinas.pk)), 'Campinas - SX')
+
+        Cidade.objects.create(nome='Campo Mourão', estado=self.estado)
+        self.assertEqual([c.nome for c in referencia.cidades(prefixo='camp')], ['Campinas', 'Campo Mourão'])
+
+        self.paranagua.delete()
+        self.assertEqual([c.nome for c in referencia.cidades(prefixo='paran')], ['Paranavaí'])
+
+    def test_versao_alterada_por_outro_processo(self):
+        # Escrita em massa, sem sinais: os processos so percebem pela versao
+        Cidade.objects.bulk_create([Cidade(nome='Cascavel', estado=self.estado)])
+        self.assertEqual(referencia.cidades(prefixo='casc'), [])
+
+        cache.incr(referencia.CHAVE_VERSAO)
+        with override_settings(REFERENCIA_CACHE_INTERVALO=0):
+            self.assertEqual([c.nome for c in referencia.cidades(prefixo='casc')], ['Cascavel'])
+
+    def test_autocomplete_de_cidades_do_estado(self):
+        self.client.force_login(self.user)
+        # sessao e usuario
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse('autocomplete-cidade'), {'q': 'c', 'forward': f'{{"estado": "{self.sp.pk}"}}'}
+            )
+        self.assertEqual(
+            response.json()['results'],
+            [{'id': str(self.campinas.pk), 'text': 'Campinas - SP', 'selected_text': 'Campinas - SP'}],
+        )
+
+    def test_formulario_de_fornecedor_sem_consultar_estado_e_cidade(self):
+        dados = {
+            'nome': 'Novo', 'cnpj': '00.000.000/0001-00', 'estado': self.sp.pk, 'cidade': self.campinas.pk,
+        }
+        with self.assertNumQueries(0):
+            form = FornecedorForm(data=dados)
+            self.assertTrue(form.is_valid(), form.errors)
+            html = str(form['estado']) + str(form['cidade'])
+        self.assertEqual(form.cleaned_data['cidade'], self.campinas)
+        self.assertIn('São Paulo - SP', html)
+        self.assertIn('Campinas - SP', html)
+        self.assertNotIn('Paranaguá', html)
+
+        form = FornecedorForm(data=dict(dados, cidade=self.campinas.pk + 100))
+        self.assertFalse(form.is_valid())
+        self.assertIn('cidade', form.errors)
+
+        form = FornecedorForm(data=dict(dados, cidade=2 ** 70))
+        self.assertFalse(form.is_valid())
+        self.assertIn('cidade', form.errors)
+
+    def test_formulario_aceita_cidade_criada_em_outro_processo(self):
+        # Sem sinal nem versao compartilhada (LocMemCache em cada instancia),
+        # a copia local nao sabe da cidade nova
+        Cidade.objects.bulk_create([Cidade(nome='Cascavel', estado=self.estado)])
+        cascavel = Cidade.objects.get(nome='Cascavel')
+        self.assertIsNone(referencia.cidade(cascavel.pk))
+
+        form = FornecedorForm(data={
+            'nome': 'Novo', 'cnpj': '00.000.000/0001-00', 'estado': self.estado.pk, 'cidade': cascavel.pk,
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['cidade'], cascavel)
+        # A copia local foi recarregada para as proximas requisicoes
+        self.assertEqual(referencia.cidade(cascavel.pk), cascavel)
+
+
+class CargaMunicipiosTest(DadosTesteMixin, TestCase):
+    CSV = (
+        'codigo_uf,sigla_uf,nome_uf,codigo_municipio,nome_municipio\n'
+        '41,PR,Paraná,4106902,Curitiba\n'
+        '41,PR,Paraná,4118402,{paranavai}\n'
+        '35,SP,São Paulo,3550308,São Paulo\n'
+    )
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio)
+
+    def arquivo(self, nome, conteudo):
+        caminho = os.path.join(self.diretorio, nome)
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(conteudo)
+        return caminho
+
+    def carregar(self, caminho=None, **opcoes):
+        saida = StringIO()
+        if caminho:
+            opcoes['arquivo'] = caminho
+        call_command('carregar_municipios', stdout=saida, **opcoes)
+        return saida.getvalue()
+
+    def test_carga_idempotente_aproveitando_cadastros_manuais(self):
+        caminho = self.arquivo('municipios.csv', self.CSV.format(paranavai='PARANAVAÍ'))
+
+        saida = self.carregar(caminho, lote=2)
+        self.assertIn('Estados: 1 inserido(s), 1 atualizado(s), 0 inalterado(s)', saida)
+        self.assertIn('Cidades: 2 inserido(s), 1 atualizado(s), 0 inalterado(s)', saida)
+        self.estado.refresh_from_db()
+        self.cidade.refresh_from_db()
+        self.assertEqual((self.estado.codigo_ibge, self.cidade.codigo_ibge), (41, 4118402))
+        self.assertEqual(Cidade.objects.count(), 3)
+
+        saida = self.carregar(caminho)
+        self.assertIn('Estados: 0 inserido(s), 0 atualizado(s), 2 inalterado(s)', saida)
+        self.assertIn('Cidades: 0 inserido(s), 0 atualizado(s), 3 inalterado(s)', saida)
+
+        self.carregar(self.arquivo('municipios.csv', self.CSV.format(paranavai='Paranavaí')))
+        self.cidade.refresh_from_db()
+        self.assertEqual(self.cidade.nome, 'Paranavaí')
+        self.assertEqual(Cidade.objects.count(), 3)
+        # bulk_create nao dispara sinais: a carga invalida o cache de referencia
+        self.assertEqual([c.nome for c in referencia.cidades(prefixo='curi')], ['Curitiba'])
+
+    def test_json_da_api_do_ibge(self):
+        uf = {'id': 41, 'sigla': 'PR', 'nome': 'Paraná'}
+        registros = [
+            {'id': 4106902, 'nome': 'Curitiba', 'microrregiao': {'mesorregiao': {'UF': uf}}},
+            {
+                'id': 4118402, 'nome': 'Paranavaí', 'microrregiao': None,
+                'regiao-imediata': {'regiao-intermediaria': {'UF': uf}},
+            },
+        ]
+        saida = self.carregar(self.arquivo('municipios.json', json.dumps(registros)))
+        self.assertIn('Cidades: 1 inserido(s), 1 atualizado(s), 0 inalterado(s)', saida)
+
+    def test_arquivo_incluido_no_projeto(self):
+        saida = self.carregar()
+        self.assertIn('Estados: 26 inserido(s), 1 atualizado(s), 0 inalterado(s)', saida)
+        self.assertEqual(Estado.objects.exclude(codigo_ibge=None).count(), 27)
+        # Paranavai, cadastrada a mao, e aproveitada em vez de duplicada
+        self.assertEqual(Cidade.objects.count(), 5570)
+        self.assertEqual(Cidade.objects.get(codigo_ibge=4118402).pk, self.cidade.pk)
+
+    def test_arquivo_invalido(self):
+        with self.assertRaises(CommandError):
+            self.carregar(self.arquivo('municipios.csv', 'codigo,nome\n1,Teste\n'))
+        with self.assertRaises(CommandError):
+            self.carregar(self.arquivo('municipios.csv', self.CSV.format(paranavai='x').replace('4106902', 'abc')))
+        with self.assertRaises(CommandError):
+            self.carregar(os.path.join(self.diretorio, 'nao-existe.csv'))
+
+
+class PopularDadosTest(DadosTesteMixin, TestCase):
+    OPCOES = {
+        'usuarios': 2, 'fornecedores': 8, 'categorias': 3, 'itens': 30, 'frotas': 4, 'pedidos': 60,
+        'lote': 25, 'semente': 7, 'ate': datetime.date(2025, 6, 30),
+    }
+
+    def setUp(self):
+        self.criar_cadastros()
+
+    def popular(self, **opcoes):
+        saida = StringIO()
+        call_command('popular_dados', stdout=saida, **{**self.OPCOES, **opcoes})
+        return saida.getvalue()
+
+    def retrato(self):
+        """Conteudo gerado, sem ids, para comparar duas execucoes."""
+        itens = ItemPedido.objects.filter(criado_por__username__startswith='carga').order_by(
+            'criado_por__username', 'pedido__data_pedido', 'pedido__fornecedor__cnpj', 'id',
+        )
+        return [
+            (
+                item.criado_por.username, item.pedido.data_pedido, item.pedido.fornecedor.cnpj,
+                item.pedido.status, item.pedido.valor_total, item.item.nome, item.quantidade, item.valor_unitario,
+            )
+            for item in itens.select_related('criado_por', 'pedido__fornecedor', 'item')
+        ]
+
+    def test_gera_quantidades_pedidas_com_resumo_consistente(self):
+        saida = self.popular()
+        self.assertIn('Pedidos: 120', saida)
+
+        usuarios = User.objects.filter(username__startswith='carga')
+        self.assertEqual(usuarios.count(), 2)
+        self.assertTrue(usuarios[0].check_password('senha12345'))
+        self.assertEqual(Fornecedor.objects.filter(criado_por__in=usuarios).count(), 16)
+        pedidos = Pedido.objects.filter(criado_por__in=usuarios)
+        self.assertEqual(pedidos.count(), 120)
+        self.assertLessEqual(max(pedidos.values_list('data_pedido', flat=True)).date(), self.OPCOES['ate'])
+
+        # valor_total e resumo batem com os itens, apesar do bulk_create
+        for pedido in pedidos.prefetch_related('itempedido_set'):
+            self.assertEqual(
+                pedido.valor_total, sum(i.quantidade * i.valor_unitario for i in pedido.itempedido_set.all()),
+            )
+        self.assertEqual(calcular_resumo(usuarios), resumo_gravado(usuarios))
+
+        criacoes = MovimentacaoPedido.objects.filter(pedido__in=pedidos, tipo='criacao')
+        self.assertEqual(criacoes.count(), 120)
+        self.assertEqual(
+            MovimentacaoPedido.objects.filter(pedido__in=pedidos, tipo='adicao_item').count(),
+            ItemPedido.objects.filter(pedido__in=pedidos).count(),
+        )
+
+    def test_mesma_semente_gera_os_mesmos_dados(self):
+        self.popular()
+        primeiro = self.retrato()
+        self.popular(limpar=True)
+        self.assertEqual(self.retrato(), primeiro)
+        self.popular(limpar=True, semente=8)
+        self.assertNotEqual(self.retrato(), primeiro)
+
+    def test_linha_copy_distingue_nulo_de_texto_vazio(self):
+        linha = geracao.linha_copy([None, '', 'diz "oi", tchau', Decimal('1.50'), 3, True, '\\N'])
+        self.assertEqual(linha, '\\N,"","diz ""oi"", tchau","1.50","3","True","\\N"\n')
+        # Lida como o COPY ... (FORMAT csv, NULL '\N'): so o campo sem aspas e NULL
+        campos = next(csv.reader([linha.rstrip('\n')]))
+        self.assertEqual(campos[:3], ['\\N', '', 'diz "oi", tchau'])
+
+    def test_exige_limpar_e_preserva_outros_usuarios(self):
+        pedido = Pedido.objects.create(fornecedor=self.fornecedor, descricao='Manual', criado_por=self.user)
+        # Contas reais que so comecam com o prefixo nao sao dados gerados
+        reais = [User.objects.create_user(nome) for nome in ('carga.ltda', 'cargas_sp', 'carga12')]
+        self.popular()
+        with self.assertRaises(CommandError):
+            self.popular()
+        self.popular(limpar=True, pedidos=10)
+        self.assertEqual(list(geracao.usuarios_gerados('carga').values_list('username', flat=True)), [
+            'carga0000', 'carga0001',
+        ])
+        self.assertEqual(Pedido.objects.filter(criado_por__in=geracao.usuarios_gerados('carga')).count(), 20)
+        self.assertTrue(Pedido.objects.filter(pk=pedido.pk).exists())
+        self.assertTrue(Fornecedor.objects.filter(pk=self.fornecedor.pk).exists())
+        self.assertEqual(User.objects.filter(pk__in=[user.pk for user in reais]).count(), 3)
+        self.assertFalse(Pedido.objects.filter(criado_por__in=reais).exists())
+
+
+@override_settings(BANCO_DESCARTAVEL=True)
+class BenchmarkViewsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio)
+        self.base = os.path.join(self.diretorio, 'base.json')
+        self.saida = os.path.join(self.diretorio, 'relatorio.json')
+
+    def benchmark(self, **opcoes):
+        call_command(
+            'benchmark_views', escalas=[40], repeticoes=1, base=self.base, saida=self.saida,
+            stdout=StringIO(), **opcoes,
+        )
+        with open(self.saida, encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+
+    def test_mede_todas_as_views_e_grava_a_base(self):
+        relatorio = self.benchmark(atualizar_base=True)
+
+        escala, = relatorio['escalas']
+        self.assertEqual(escala['escala'], 40)
+        self.assertGreater(escala['itens_pedido'], 0)
+        views = {view['nome']: view for view in escala['views']}
+        self.assertIn('pedido-list', views)
+        self.assertIn('index', views)
+        self.assertEqual(views['cadastrar-pedido']['metodo'], 'POST')
+        for view in views.values():
+            self.assertGreater(view['consultas'], 0, view['nome'])
+            self.assertGreater(view['memoria_pico_kib'], 0, view['nome'])
+
+        with open(self.base, encoding='utf-8') as arquivo:
+            orcamentos = json.load(arquivo)[connection.vendor]['40']
+        self.assertEqual(orcamentos['pedido-list']['consultas'], views['pedido-list']['consultas'])
+        # Os dados gerados foram removidos
+        self.assertFalse(User.objects.filter(username='benchmark_views').exists())
+
+    def test_falha_acima_do_orcamento(self):
+        with open(self.base, 'w', encoding='utf-8') as arquivo:
+            json.dump({connection.vendor: {'40': {'pedido-list': {'consultas': 1, 'tempo_ms': 100000}}}}, arquivo)
+
+        with self.assertRaisesMessage(CommandError, 'pedido-list'):
+            self.benchmark(views=['pedido-list', 'pedido-itens'])
+        with open(self.saida, encoding='utf-8') as arquivo:
+            views = json.load(arquivo)['escalas'][0]['views']
+        self.assertEqual(len(views[0]['violacoes']), 1)
+        self.assertIsNone(views[1]['orcamento'])
+
+    @override_settings(BANCO_DESCARTAVEL=False)
+    def test_recusa_banco_nao_marcado(self):
+        with self.assertRaisesMessage(CommandError, 'descartável'):
+            self.benchmark(views=['pedido-list'])
+        self.assertFalse(User.objects.filter(username='benchmark_views').exists())
+
+        self.benchmark(views=['pedido-list'], permitir_banco=True)
+
+    def test_preserva_conta_real_com_o_mesmo_nome(self):
+        User.objects.create_user('benchmark_views', password='senha12345')
+        with self.assertRaisesMessage(CommandError, 'não foi criado pelo benchmark'):
+            self.benchmark(views=['pedido-list'])
+        self.assertTrue(User.objects.get(username='benchmark_views').has_usable_password())
+
+
+class PercentilTest(SimpleTestCase):
+
+    def test_percentil(self):
+        valores = list(range(1, 101))
+        self.assertEqual(percentil(valores, 50), 50)
+        self.assertEqual(percentil(valores, 99), 99)
+        self.assertEqual(percentil([7.5], 95), 7.5)
+        self.assertEqual(percentil([], 50), 0.0)
+
+
+class CargaHttpTest(LiveServerTestCase):
+
+    def setUp(self):
+        cache.clear()
+        call_command(
+            'popular_dados', usuarios=2, fornecedores=5, itens=20, frotas=2, pedidos=30, semente=1,
+            stdout=StringIO(),
+        )
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio)
+
+    def test_carga_contra_servidor_em_execucao(self):
+        saida = os.path.join(self.diretorio, 'carga.json')
+        # Um usuario virtual: no SQLite, escritas concorrentes falham com
+        # "database is locked" e o teste deixaria de ser deterministico
+        call_command(
+            'carga_http', url=self.live_server_url, usuarios=1, duracao=1, aquecimento=0, saida=saida,
+            mix=['cadastrar-pedido=20', 'pedido-update=20'], stdout=StringIO(),
+        )
+        with open(saida, encoding='utf-8') as arquivo:
+            relatorio = json.load(arquivo)
+
+        self.assertGreater(relatorio['requisicoes'], 0)
+        self.assertEqual(relatorio['erros'], 0)
+        for url in relatorio['urls'].values():
+            self.assertLessEqual(url['p50_ms'], url['p95_ms'])
+            self.assertLessEqual(url['p95_ms'], url['p99_ms'])
+
+    def test_sem_usuarios_de_carga(self):
+        with self.assertRaises(CommandError):
+            call_command('carga_http', url=self.live_server_url, prefixo='inexistente', stdout=StringIO())
+
+
+class SalvarPedidoComItensTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.client.force_login(self.user)
+
+    def assertResumoConsistente(self):
+        self.assertEqual(resumo_gravado(), calcular_resumo())
+
+    def test_criacao(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('cadastrar-pedido'), self.dados_formulario(3, **{
+                'itens-2-quantidade': 4,
+            }))
+        self.assertRedirects(response, reverse('pedido-list'))
+
+        pedido = Pedido.objects.get()
+        self.assertEqual(pedido.itempedido_set.count(), 3)
+        self.assertEqual(pedido.valor_total, Decimal('15.00'))
+        self.assertEqual(set(pedido.itempedido_set.values_list('criado_por', flat=True)), {self.user.pk})
+        self.assertTrue(pedido.movimentacoes.filter(tipo='criacao').exists())
+        self.assertResumoConsistente()
+
+    def test_edicao_inclui_altera_e_exclui(self):
+        pedido = self.criar_pedido(itens=3, quantidade=1, valor_unitario='2.50')
+        ids = list(pedido.itempedido_set.order_by('id').values_list('pk', flat=True))
+
+        dados = self.dados_formulario(4, **{
+            'itens-INITIAL_FORMS': 3,
+            'itens-0-id': ids[0], 'itens-0-quantidade': 10,
+            'itens-1-id': ids[1],
+            'itens-2-id': ids[2], 'itens-2-DELETE': 'on',
+            'itens-3-valor_unitario': '7.00',
+            'status': 'em_andamento',
+        })
+        response = self.client.post(reverse('pedido-update', args=[pedido.pk]), dados)
+        self.assertRedirects(response, reverse('pedido-list'))
+
+        pedido.refresh_from_db()
+        self.assertEqual(
+            sorted(pedido.itempedido_set.values_list('quantidade', 'valor_unitario')),
+            [(1, Decimal('2.50')), (1, Decimal('7.00')), (10, Decimal('2.50'))],
+        )
+        self.assertFalse(ItemPedido.objects.filter(pk=ids[2]).exists())
+        self.assertEqual(pedido.valor_total, Decimal('34.50'))
+        self.assertEqual(pedido.status, 'em_andamento')
+        self.assertResumoConsistente()
+
+    def test_consultas_nao_crescem_com_as_linhas(self):
+        # O primeiro pedido do dia cria a linha do resumo; os seguintes a atualizam
+        self.criar_pedido(itens=0)
+
+        consultas = []
+        for linhas in (10, 100):
+            form = PedidoComItensForm(data=self.dados_formulario(linhas), user=self.user)
+            self.assertTrue(form.is_valid(), form.errors)
+            with CaptureQueriesContext(connection) as capturadas:
+                pedido = form.save()
+            consultas.append(len(capturadas))
+            self.assertEqual(pedido.itempedido_set.count(), linhas)
+
+        self.assertEqual(consultas[0], consultas[1])
+
+    def test_falha_desfaz_tudo(self):
+        with mock.patch.object(ItemPedido.objects, 'bulk_create', side_effect=DatabaseError('falha')):
+            response = self.client.post(reverse('cadastrar-pedido'), self.dados_formulario(2))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(ResumoDiarioPedido.objects.filter(num_pedidos__gt=0).exists())
+
+
+class AuditoriaPedidoTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.client.force_login(self.user)
+
+    def movimentacoes(self, pedido):
+        return sorted(pedido.movimentacoes.values_list('tipo', 'observacao'))
+
+    def inserts_de_movimentacao(self, consultas):
+        return [
+            q for q in consultas.captured_queries
+            if q['sql'].startswith('INSERT INTO "cadastros_movimentacaopedido"')
+        ]
+
+    def test_criacao_grava_tudo_em_um_insert(self):
+        with CaptureQueriesContext(connection) as consultas:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('cadastrar-pedido'), self.dados_formulario(3))
+
+        pedido = Pedido.objects.get()
+        self.assertEqual(self.movimentacoes(pedido), [
+            ('adicao_item', '1x Filtro a R$ 2.50'),
+            ('adicao_item', '1x Filtro a R$ 2.50'),
+            ('adicao_item', '1x Filtro a R$ 2.50'),
+            ('criacao', 'Pedido criado com 3 itens. Valor total: R$ 7.50'),
+        ])
+        self.assertEqual(set(pedido.movimentacoes.values_list('usuario', flat=True)), {self.user.pk})
+        self.assertEqual(len(self.inserts_de_movimentacao(consultas)), 1)
+        self.assertFalse(any('COUNT(' in q['sql'] and 'cadastros_itempedido' in q['sql']
+                             for q in consultas.captured_queries))
+
+    def test_edicao_registra_itens_removidos(self):
+        pedido = self.criar_pedido(itens=2, quantidade=1, valor_unitario='2.50')
+        ids = list(pedido.itempedido_set.order_by('id').values_list('pk', flat=True))
+        dados = self.dados_formulario(2, **{
+            'itens-INITIAL_FORMS': 2,
+            'itens-0-id': ids[0],
+            'itens-1-id': ids[1], 'itens-1-DELETE': 'on',
+            'status': 'finalizado',
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('pedido-update', args=[pedido.pk]), dados)
+
+        self.assertEqual(self.movimentacoes(pedido), [
+            ('alteracao_status', 'Status alterado de "Pendente" para "Finalizado"'),
+            ('remocao_item', '1x Filtro a R$ 2.50'),
+        ])
+
+    def test_item_avulso(self):
+        pedido = self.criar_pedido(itens=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('cadastrar-itempedido'), {
+                'item': self.item.pk, 'pedido': pedido.pk, 'status': 'pendente',
+                'quantidade': 2, 'valor_unitario': '3.00',
+            })
+        item = ItemPedido.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('itempedido-deletar', args=[item.pk]))
+
+        self.assertEqual(self.movimentacoes(pedido), [
+            ('adicao_item', '2x Filtro a R$ 3.00'),
+            ('remocao_item', '2x Filtro a R$ 3.00'),
+        ])
+
+    def test_nada_gravado_quando_a_transacao_falha(self):
+        pedido = self.criar_pedido(itens=0)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(DatabaseError):
+                with RegistroMovimentacoes(self.user) as auditoria:
+                    auditoria.registrar(pedido, 'alteracao_dados')
+                    raise DatabaseError('falha')
+        self.assertEqual(callbacks, [])
+        self.assertFalse(pedido.movimentacoes.exists())
+
+    @override_settings(AUDITORIA_ADIADA=True)
+    def test_modo_adiado_entrega_ao_gravador(self):
+        with mock.patch.object(gravador, 'enviar') as enviar:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('cadastrar-pedido'), self.dados_formulario(2))
+
+        enviar.assert_called_once()
+        self.assertEqual(
+            sorted(m.tipo for m in enviar.call_args.args[0]),
+            ['adicao_item', 'adicao_item', 'criacao'],
+        )
+        self.assertFalse(Pedido.objects.get().movimentacoes.exists())
+
+    def test_gravador_adiado(self):
+        pedido = self.criar_pedido(itens=0)
+        gravados = []
+        gravador_teste = GravadorAdiado(tamanho_lote=10)
+        with mock.patch.object(gravador_teste, 'gravar', side_effect=gravados.extend):
+            for i in range(3):
+                gravador_teste.enviar([MovimentacaoPedido(pedido=pedido, tipo='alteracao_dados', observacao=str(i))])
+            gravador_teste.esperar()
+        self.assertEqual(sorted(m.observacao for m in gravados), ['0', '1', '2'])
+
+
+class ArquivamentoMovimentacaoTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.pedido = self.criar_pedido(itens=0)
+        self.outro_pedido = self.criar_pedido(itens=0)
+        self.destino = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.destino)
+        self.agora = timezone.now()
+
+    def movimentacao(self, pedido, meses_atras, observacao):
+        data = self.agora - datetime.timedelta(days=31 * meses_atras)
+        movimentacao = MovimentacaoPedido.objects.create(
+            pedido=pedido, tipo='alteracao_dados', observacao=observacao, usuario=self.user,
+        )
+        # data_movimentacao e auto_now_add
+        MovimentacaoPedido.objects.filter(pk=movimentacao.pk).update(data_movimentacao=data)
+        return movimentacao
+
+    def arquivar(self, **opcoes):
+        saida = StringIO()
+        call_command('arquivar_movimentacoes', destino=self.destino, stdout=saida, **opcoes)
+        return saida.getvalue()
+
+    def test_arquiva_meses_antigos_e_mantem_o_historico(self):
+        self.movimentacao(self.pedido, 0, 'recente')
+        self.movimentacao(self.pedido, 5, 'tabela de arquivo')
+        self.movimentacao(self.pedido, 14, 'arquivo antigo')
+        self.movimentacao(self.pedido, 15, 'arquivo mais antigo')
+        self.movimentacao(self.outro_pedido, 14, 'outro pedido')
+
+        self.arquivar(meses=12, meses_ativos=3)
+
+        self.assertEqual(list(MovimentacaoPedido.objects.values_list('observacao', flat=True)), ['recente'])
+        arquivos = sorted(os.listdir(self.destino))
+        self.assertEqual(len([a for a in arquivos if a.endswith('.jsonl.gz')]), 2)
+
+        historico = historico_pedido(self.pedido.pk, destino=self.destino)
+        self.assertEqual(
+            [m.observacao for m in historico],
+            ['recente', 'tabela de arquivo', 'arquivo antigo', 'arquivo mais antigo'],
+        )
+        self.assertEqual({m.usuario_id for m in historico}, {self.user.pk})
+        self.assertEqual(
+            [m.observacao for m in historico_pedido(self.outro_pedido.pk, destino=self.destino)],
+            ['outro pedido'],
+        )
+
+    def test_execucao_repetida_nao_duplica(self):
+        self.movimentacao(self.pedido, 14, 'arquivo antigo')
+        self.arquivar(meses=12)
+        self.assertIn('Nenhum mês a arquivar', self.arquivar(meses=12))
+        self.assertEqual(len(historico_pedido(self.pedido.pk, destino=self.destino)), 1)
+
+    def test_indice_evita_descomprimir_outros_meses(self):
+        self.movimentacao(self.outro_pedido, 14, 'outro pedido')
+        self.arquivar(meses=12)
+        with mock.patch('cadastros.arquivamento.gzip.open') as abrir:
+            self.assertEqual(historico_pedido(self.pedido.pk, destino=self.destino), [])
+        abrir.assert_not_called()
+
+    def test_janela_ativa_maior_que_a_retencao(self):
+        with self.assertRaises(CommandError):
+            self.arquivar(meses=2, meses_ativos=3)
+
+    def mes_utc(self, meses_atras):
+        data = self.agora - datetime.timedelta(days=31 * meses_atras)
+        return inicio_do_mes(data.astimezone(datetime.timezone.utc).date())
+
+    def linhas(self, tabela):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT observacao FROM {tabela} ORDER BY observacao')
+            return [linha[0] for linha in cursor.fetchall()]
+
+    def confirmar_chaves_estrangeiras(self):
+        # As FKs da tabela sao adiadas; com verificacoes pendentes na transacao
+        # do teste o PostgreSQL recusa o ALTER TABLE do ATTACH/DETACH. O comando
+        # roda na propria transacao e nao passa por isso
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    def test_particoes_postgresql(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Particoes so existem no PostgreSQL')
+
+        mes_atual = self.mes_utc(0)
+        garantir_particoes(meses_a_frente=5)
+        self.assertTrue({inicio_do_mes(mes_atual, n) for n in range(6)} <= set(particoes()))
+        self.assertEqual(garantir_particoes(meses_a_frente=5), [])
+
+        # Mes antigo sem particao propria: a linha cai na particao padrao
+        self.movimentacao(self.pedido, 14, 'particao padrao')
+        self.movimentacao(self.pedido, 0, 'recente')
+        mes_antigo = self.mes_utc(14)
+        self.assertNotIn(mes_antigo, particoes())
+        self.assertEqual(self.linhas(TABELA_PADRAO), ['particao padrao'])
+        self.assertIn(mes_antigo, meses_para_arquivar(self.agora - datetime.timedelta(days=31 * 12)))
+
+        self.confirmar_chaves_estrangeiras()
+        self.arquivar(meses=12)
+
+        # A particao criada na hora de arquivar foi desanexada e descartada
+        self.assertNotIn(mes_antigo, particoes())
+        self.assertEqual(self.linhas(TABELA_PADRAO), [])
+        self.assertEqual(list(MovimentacaoPedido.objects.values_list('observacao', flat=True)), ['recente'])
+        self.assertEqual(
+            [m.observacao for m in historico_pedido(self.pedido.pk, destino=self.destino)],
+            ['recente', 'particao padrao'],
+        )
+
+    def test_particao_recebe_as_linhas_da_padrao(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Particoes so existem no PostgreSQL')
+
+        self.movimentacao(self.pedido, 14, 'antiga')
+        self.movimentacao(self.outro_pedido, 14, 'outro pedido')
+        mes_antigo = self.mes_utc(14)
+        self.confirmar_chaves_estrangeiras()
+
+        criadas = garantir_particoes(meses_a_frente=0, desde=self.agora - datetime.timedelta(days=31 * 14))
+        self.assertEqual(criadas[0], mes_antigo)
+        self.assertEqual(self.linhas(TABELA_PADRAO), [])
+        self.assertEqual(self.linhas(nome_particao(mes_antigo)), ['antiga', 'outro pedido'])
+
+        self.assertEqual(arquivar_mes(mes_antigo, self.destino), 2)
+        self.assertNotIn(mes_antigo, particoes())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [nome_particao(mes_antigo)])
+            self.assertIsNone(cursor.fetchone()[0])
+        self.assertEqual(
+            [m.observacao for m in historico_pedido(self.outro_pedido.pk, destino=self.destino)],
+            ['outro pedido'],
+        )
+
+
+class ValorTotalPedidoTest(DadosTesteMixin, TestCase):
+
+    def setUp(self):
+        self.criar_cadastros()
+        self.client.force_login(self.user)
+        self.pedido = self.criar_pedido(itens=2, quantidade=1, valor_unitario='10.00')
+        self.outro_pedido = self.criar_pedido(itens=0)
+
+    def valor_total(self, pedido):
+        return Pedido.objects.values_list('valor_total', flat=True).get(pk=pedido.pk)
+
+    def dados_item(self, pedido, quantidade, valor_unitario):
+        return {
+            'item': self.item.pk, 'frota': self.frota.pk, 'pedido': pedido.pk,
+            'status': 'pendente', 'quantidade': quantidade, 'valor_unitario': valor_unitario,
+        }
+
+    def test_views_de_item(self):
+        self.assertEqual(self.valor_total(self.pedido), Decimal('20.00'))
+
+        self.client.post(reverse('cadastrar-itempedido'), self.dados_item(self.pedido, 3, '1.50'))
+        self.assertEqual(self.valor_total(self.pedido), Decimal('24.50'))
+
+        item = self.pedido.itempedido_set.order_by('id').first()
+        self.client.post(reverse('itempedido-update', args=[item.pk]), self.dados_item(self.pedido, 2, '10.00'))
+        self.assertEqual(self.valor_total(self.pedido), Decimal('34.50'))
+
+        # Mudar a linha de pedido desconta de um e soma no outro
+        self.client.post(reverse('itempedido-update', args=[item.pk]), self.dados_item(self.outro_pedido, 2, '10.00'))
+        self.assertEqual(self.valor_total(self.pedido), Decimal('14.50'))
+        self.assertEqual(self.valor_total(self.outro_pedido), Decimal('20.00'))
+
+        self.client.post(reverse('itempedido-deletar', args=[item.pk]))
+        self.assertEqual(self.valor_total(self.outro_pedido), Decimal('0.00'))
+
+    def test_admin(self):
+        admin = User.objects.create_superuser('admin', password='senha12345')
+        self.client.force_login(admin)
+        item = self.pedido.itempedido_set.order_by('id').first()
+
+        dados = self.dados_item(self.pedido, 5, '10.00')
+        dados['criado_por'] = self.user.pk
+        response = self.client.post(reverse('admin:cadastros_itempedido_change', args=[item.pk]), dados)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.valor_total(self.pedido), Decimal('60.00'))
+
+        self.client.post(reverse('admin:cadastros_itempedido_changelist'), {
+            'action': 'delete_selected', '_selected_action': [item.pk], 'post': 'yes',
+        })
+        self.assertEqual(self.valor_total(self.pedido), Decimal('10.00'))
+
+    def test_instancia_desatualizada_nao_sobrescreve(self):
+        pedido = Pedido.objects.get(pk=self.pedido.pk)
+        ItemPedido.objects.create(
+            item=self.item, pedido=self.pedido, quantidade=1,
+            valor_unitario=Decimal('5.00'), criado_por=self.user,
+        )
+        pedido.status = 'finalizado'
+        pedido.save()
+
+        self.assertEqual(self.valor_total(self.pedido), Decimal('25.00'))
+
+    def test_valor_total_explicito_e_gravado(self):
+        pedido = Pedido.objects.get(pk=self.pedido.pk)
+        pedido.valor_total = Decimal('99.00')
+        pedido.save(update_fields=['valor_total'])
+
+        self.assertEqual(self.valor_total(self.pedido), Decimal('99.00'))
+        self.assertEqual(pedido.valor_total, Decimal('99.00'))
+
+    def test_exclusao_recalculada_pelo_chamador(self):
+        excluir_itens_do_pedido(ItemPedido.objects.filter(pedido=self.pedido))
+
+        self.assertFalse(ItemPedido.objects.filter(pedido=self.pedido).exists())
+        # Os sinais nao descontam as linhas: quem exclui recalcula o pedido
+        self.assertEqual(self.valor_total(self.pedido), Decimal('20.00'))
+
+    def test_comando_corrige_divergencias(self):
+        # Escritas que nao disparam sinais deixam o total divergente
+        ItemPedido.objects.filter(pedido=self.pedido).update(quantidade=3)
+        Pedido.objects.filter(pk=self.outro_pedido.pk).update(valor_total=Decimal('7.00'))
+
+        saida = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('valor_total_pedidos', '--verificar', stdout=saida)
+        self.assertIn(f'Pedido #{self.pedido.pk}: gravado 20.00, calculado 60.00', saida.getvalue())
+
+        call_command('valor_total_pedidos', '--lote', '1', stdout=StringIO())
+        self.assertEqual(self.valor_total(self.pedido), Decimal('60.00'))
+        self.assertEqual(self.valor_total(self.outro_pedido), Decimal('0.00'))
+        call_command('valor_total_pedidos', '--verificar', stdout=StringIO())
+
+
+class PlanoConsultasTest(DadosTesteMixin, TestCase):
+    """
+    Roda EXPLAIN em todas as consultas das paginas mais usadas, com alguns
+    usuarios e milhares de linhas, e falha se alguma delas percorrer uma
+    tabela inteira em vez de usar um indice.
+    """
+    TABELAS = {
+        model._meta.db_table for model in (
+            CategoriaItem, Fornecedor, Frota, Item, ItemPedido, MovimentacaoPedido, Pedido, ResumoDiarioPedido,
+        )
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        estado = Estado.objects.create(nome='Paraná', sigla='PR')
+        cidade = Cidade.objects.create(nome='Paranavaí', estado=estado)
+        hoje = timezone.localdate()
+        for n in range(3):
+            user = User.objects.create_user(f'usuario{n}', password='senha12345')
+            fornecedores = Fornecedor.objects.bulk_create(
+                Fornecedor(nome=f'Fornecedor {i}', cnpj='00.000.000/0001-00', cidade=cidade, estado=estado, criado_por=user)
+                for i in range(30)
+            )
+            categorias = CategoriaItem.objects.bulk_create(
+                CategoriaItem(nome=f'Categoria {i}', criado_por=user) for i in range(5)
+            )
+            itens = Item.objects.bulk_create(
+                Item(nome=f'Item {i}', categoria=categorias[i % 5], criado_por=user) for i in range(40)
+            )
+            frotas = Frota.objects.bulk_create(
+                Frota(prefixo=f'{i:02d}-001', descricao='Trator', ano=2020, criado_por=user) for i in range(20)
+            )
+            pedidos = Pedido.objects.bulk_create(
+                Pedido(
+                    fornecedor=fornecedores[i % 30], descricao='Pedido', criado_por=user,
+                    status=Pedido.STATUS_CHOICES[i % 3][0],
+                    previsao_entrega=hoje + datetime.timedelta(days=i % 60 - 30),
+                )
+                for i in range(600)
+            )
+            ItemPedido.objects.bulk_create(
+                ItemPedido(
+                    item=itens[i % 40], frota=frotas[i % 20], pedido=pedidos[i // 3], quantidade=2,
+                    valor_unitario=Decimal('10.00'), criado_por=user,
+                )
+                for i in range(1800)
+            )
+            MovimentacaoPedido.objects.bulk_create(
+                MovimentacaoPedido(pedido=pedidos[i // 4], tipo='alteracao_dados', usuario=user)
+                for i in range(2400)
+            )
+            call_command('resumo_pedidos', stdout=StringIO())
+        cls.user = user
+        cls.pedido = pedidos[0]
+        with connection.cursor() as cursor:
+            # Estatisticas para o planejador, como em um banco em uso
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def plano(self, sql, params):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Com tabelas pequenas o PostgreSQL prefere a varredura mesmo
+                # havendo indice; desligada, ela so aparece se nao houver indice
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}', params)
+                return [linha[0].strip() for linha in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [linha[-1] for linha in cursor.fetchall()]
+
+    def varreduras(self, plano):
+        """Linhas do plano que percorrem uma tabela do app inteira."""
+        if connection.vendor == 'postgresql':
+            marcador = 'Seq Scan on '
+            return [
+                linha for linha in plano
+                if marcador in linha and linha.split(marcador)[1].split()[0] in self.TABELAS
+            ]
+        return [linha for linha in plano if linha.startswith('SCAN ') and linha.split()[1] in self.TABELAS]
+
+    def verificar(self, url, params=None, ordem_do_indice=False):
+        """
+        Verifica o plano de cada consulta feita por ``url``. Com
+        ``ordem_do_indice``, as paginas (consultas com LIMIT) tambem devem sair
+        na ordem do indice, sem ordenar as linhas do usuario (so no SQLite).
+        """
+        consultas = []
+
+        def registrar(execute, sql, parametros, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                consultas.append((sql, parametros))
+            return execute(sql, parametros, many, context)
+
+        with connection.execute_wrapper(registrar):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, url)
+        self.assertTrue(consultas)
+        for sql, parametros in consultas:
+            plano = self.plano(sql, parametros)
+            with self.subTest(url=url, params=params, sql=sql):
+                self.assertEqual(self.varreduras(plano), [])
+                if ordem_do_indice and connection.vendor == 'sqlite' and 'LIMIT' in sql:
+                    self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plano)
+        return response
+
+    def test_dashboard(self):
+        self.verificar(reverse('index'))
+
+    def test_lista_de_pedidos(self):
+        url = reverse('pedido-list')
+        response = self.verificar(url, ordem_do_indice=True)
+        self.verificar(url, {'cursor': response.context['page_obj'].next_cursor}, ordem_do_indice=True)
+        self.verificar(url, {'status': 'pendente'}, ordem_do_indice=True)
+        self.verificar(url, {'data_pedido__gte': '2020-01-01', 'data_pedido__lte': '2100-01-01'})
+        self.verificar(url, {'previsao_entrega__gte': timezone.localdate().isoformat()})
+        self.verificar(url, {'fornecedor__nome': 'dor 1'})
+
+    def test_listas_de_cadastros(self):
+        for nome in ('fornecedor-list', 'frota-list', 'categoriaitem-list', 'item-list'):
+            self.verificar(reverse(nome))
+        response = self.verificar(reverse('itempedido-list'), ordem_do_indice=True)
+        self.verificar(
+            reverse('itempedido-list'), {'cursor': response.context['page_obj'].next_cursor}, ordem_do_indice=True
+        )
+
+    def test_detalhes_do_pedido(self):
+        self.verificar(reverse('pedido-itens', args=[self.pedido.pk]))
+        self.verificar(reverse('pedido-historico', args=[self.pedido.pk]), ordem_do_indice=True)
+
+    def test_autocompletes(self):
+        for nome in ('autocomplete-fornecedor', 'autocomplete-item', 'autocomplete-frota'):
+            self.verificar(reverse(nome), {'q': 'i'})
@@ -0,0 +1,76 @@
+"""
+Manutencao incremental de Pedido.valor_total.
+
+Cada escrita em um ItemPedido aplica a diferenca do valor da linha
+(quantidade * valor_unitario) no valor_total do pedido com um UPDATE
+``F('valor_total') + delta``, sem ler nem regravar o pedido. Os receivers em
+signals.py chamam ``ajustar_valor_total`` para as escritas individuais
+(views e admin); o PedidoComItensForm, que grava os itens em lote, define o
+total diretamente. Como o valor gravado e a referencia, ``Pedido.save()`` em
+um pedido existente so grava o valor_total quando ele esta em
+``update_fields``.
+
+Escritas que nao disparam sinais podem deixar o total divergente;
+``verificar_valor_total`` e o comando ``valor_total_pedidos`` encontram e
+corrigem essas divergencias.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import TOTAL_LINHA, ItemPedido, Pedido
+
+CENTAVO = Decimal('0.01')
+
+
+def ajustar_valor_total(pedido_id, delta):
+    """Soma ``delta`` ao valor_total do pedido, direto no banco."""
+    if delta:
+        Pedido.objects.filter(pk=pedido_id).update(valor_total=F('valor_total') + delta)
+
+
+def valor_total_calculado():
+    """Expressao com a soma das linhas do pedido, para anotar consultas de Pedido."""
+    soma = ItemPedido.objects.filter(pedido=OuterRef('pk')).order_by().values('pedido').annotate(
+        total=Sum(TOTAL_LINHA)
+    ).values('total')
+    return Coalesce(Subquery(soma), Decimal('0'), output_field=Pedido._meta.get_field('valor_total'))
+
+
+def verificar_valor_total(pedidos=None, tamanho_lote=1000, corrigir=False):
+    """
+    Percorre ``pedidos`` (todos, por padrao) em lotes pela chave primaria e
+    gera, para cada pedido divergente, (id, valor gravado, valor calculado).
+    Com ``corrigir``, cada lote divergente e regravado em um bulk_update.
+
+    A comparacao e feita em Python, com os valores ja convertidos para
+    Decimal: no SQLite a soma no banco e feita em ponto flutuante.
+    """
+    if pedidos is None:
+        pedidos = Pedido.objects.all()
+
+    ultimo_id = 0
+    while True:
+        lote = list(
+            pedidos.filter(pk__gt=ultimo_id).order_by('pk').annotate(
+                calculado=valor_total_calculado()
+            ).values_list('pk', 'valor_total', 'calculado')[:tamanho_lote]
+        )
+        if not lote:
+            return
+        ultimo_id = lote[-1][0]
+
+        divergentes = [
+            (pk, gravado, calculado.quantize(CENTAVO))
+            for pk, gravado, calculado in lote
+            if gravado != calculado
+        ]
+        if corrigir and divergentes:
+            with transaction.atomic():
+                Pedido.objects.bulk_update(
+                    [Pedido(pk=pk, valor_total=calculado) for pk, _, calculado in divergentes],
+                    ['valor_total'],
+                )
+        yield from divergentes
@@ -4,6 +4,8 @@ from .views import CategoriaItemCreate, CidadeCreate, EstadoCreate, FornecedorCr
 from .views import EstadoUpdate, CidadeUpdate, FornecedorUpdate, FrotaUpdate, CategoriaItemUpdate, ItemUpdate, PedidoUpdate, ItemPedidoUpdate
 from .views import EstadoDelete, CidadeDelete, FornecedorDelete, FrotaDelete, CategoriaItemDelete, ItemDelete, PedidoDelete, ItemPedidoDelete
 from .views import EstadoList, CidadeList, FornecedorList, FrotaList, CategoriaItemList, ItemList, PedidoList, ItemPedidoList
+from .views import PedidoItens, PedidoHistorico, PedidoExport
+from .views import FornecedorAutocomplete, ItemAutocomplete, FrotaAutocomplete, CidadeAutocomplete, PedidoAutocomplete
 #Importar aqui TAMBÉM as views para LIST
 
 
@@ -47,6 +49,20 @@ urlpatterns = [
     path('listar/item/', ItemList.as_view(), name='item-list'),
     path('listar/pedido/', PedidoList.as_view(), name='pedido-list'),
     path('listar/itempedido/', ItemPedidoList.as_view(), name='itempedido-list'),
+
+    #VIEWS DE DETALHE (carregadas sob demanda)
+    path('pedido/<int:pk>/itens/', PedidoItens.as_view(), name='pedido-itens'),
+    path('pedido/<int:pk>/historico/', PedidoHistorico.as_view(), name='pedido-historico'),
+
+    #EXPORTAÇÃO (aplica os mesmos filtros da lista de pedidos)
+    path('exportar/pedido/<str:formato>/', PedidoExport.as_view(), name='pedido-exportar'),
+
+    #AUTOCOMPLETE DOS SELECTS (busca por prefixo, paginada)
+    path('autocomplete/fornecedor/', FornecedorAutocomplete.as_view(), name='autocomplete-fornecedor'),
+    path('autocomplete/item/', ItemAutocomplete.as_view(), name='autocomplete-item'),
+    path('autocomplete/frota/', FrotaAutocomplete.as_view(), name='autocomplete-frota'),
+    path('autocomplete/cidade/', CidadeAutocomplete.as_view(), name='autocomplete-cidade'),
+    path('autocomplete/pedido/', PedidoAutocomplete.as_view(), name='autocomplete-pedido'),
     
     #localhost:8000/editar/view1/1/ (id=1) - Int:pk tem a função de pegar o id do objeto que queremos editar
 ]
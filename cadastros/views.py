@@ -5,14 +5,23 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.contrib.messages.views import SuccessMessageMixin
 from django.core.exceptions import PermissionDenied
-from django.http import JsonResponse
-from django_filters.views import FilterView
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from dal import autocomplete
+from django_filters.views import FilterMixin, FilterView
 from .models import (
     Estado, Cidade, Fornecedor, Frota,
-    CategoriaItem, Item, ItemPedido, Pedido, MovimentacaoPedido
+    CategoriaItem, Item, ItemPedido, MovimentacaoPedido, Pedido, TOTAL_LINHA
 )
-from .forms import PedidoComItensForm
+from . import referencia
+from .auditoria import RegistroMovimentacoes
+from .forms import FornecedorForm, FornecedorUpdateForm, ItemPedidoAvulsoForm, PedidoComItensForm
 from .filters import PedidoFilter
+from .paginacao import INTEIRO_MAXIMO, PaginacaoCursorMixin
+from .contadores import total_pedidos
+from .exportacao import gerar_csv, gerar_xlsx, linhas_exportacao
 
 
 class SuccessDeleteMixin:
@@ -23,6 +32,15 @@ class SuccessDeleteMixin:
         return super().delete(request, *args, **kwargs)
 
 
+class FormUsuarioMixin:
+    """Passa o usuário logado para o form, que restringe as escolhas aos registros dele."""
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['user'] = self.request.user
+        return kwargs
+
+
 class OwnerRequiredMixin:
     def get_object(self, queryset=None):
         obj = super().get_object(queryset)
@@ -51,7 +69,7 @@ class FornecedorCreate(LoginRequiredMixin, SuccessMessageMixin, CreateView):
     template_name = 'cadastros/form.html'
     model = Fornecedor
     success_url = reverse_lazy('fornecedor-list')
-    fields = ['nome', 'cnpj', 'telefone', 'email', 'cidade', 'estado']
+    form_class = FornecedorForm
     extra_context = {'titulo': 'Cadastrar Fornecedor'}
     success_message = "Fornecedor cadastrado com sucesso!"
     
@@ -99,17 +117,20 @@ class ItemCreate(LoginRequiredMixin, SuccessMessageMixin, CreateView):
         return super().form_valid(form)
 
 
-class ItemPedidoCreate(LoginRequiredMixin, SuccessMessageMixin, CreateView):
+class ItemPedidoCreate(LoginRequiredMixin, FormUsuarioMixin, SuccessMessageMixin, CreateView):
     template_name = 'cadastros/form.html'
     model = ItemPedido
     success_url = reverse_lazy('itempedido-list')
-    fields = ['item', 'frota', 'pedido', 'status', 'quantidade', 'valor_unitario']
+    form_class = ItemPedidoAvulsoForm
     extra_context = {'titulo': 'Cadastrar Item do Pedido'}
     success_message = "Item do pedido cadastrado com sucesso!"
     
     def form_valid(self, form):
         form.instance.criado_por = self.request.user
-        return super().form_valid(form)
+        with RegistroMovimentacoes(self.request.user) as auditoria:
+            response = super().form_valid(form)
+            auditoria.registrar_itens(adicionados=[self.object])
+        return response
 
 
 class PedidoCreate(LoginRequiredMixin, View):
@@ -130,15 +151,13 @@ class PedidoCreate(LoginRequiredMixin, View):
 
         if form_wrapper.is_valid():
             try:
-                pedido = form_wrapper.save()
-
-                MovimentacaoPedido.objects.create(
-                    pedido=pedido,
-                    tipo='criacao',
-                    status_novo=pedido.status,
-                    observacao=f'Pedido criado com {pedido.itempedido_set.count()} itens. Valor total: R$ {pedido.valor_total}',
-                    usuario=request.user
-                )
+                with RegistroMovimentacoes(request.user) as auditoria:
+                    pedido = form_wrapper.save(auditoria=auditoria)
+                    auditoria.registrar(
+                        pedido, 'criacao',
+                        status_novo=pedido.status,
+                        observacao=f'Pedido criado com {len(form_wrapper.item_formset.new_objects)} itens. Valor total: R$ {pedido.valor_total}',
+                    )
 
                 messages.success(request, f'Pedido #{pedido.id} criado com sucesso!')
                 return redirect('pedido-list')
@@ -174,7 +193,7 @@ class FornecedorUpdate(LoginRequiredMixin, OwnerRequiredMixin, SuccessMessageMix
     template_name = 'cadastros/form.html'
     model = Fornecedor
     success_url = reverse_lazy('fornecedor-list')
-    fields = ['nome', 'cnpj', 'telefone', 'email', 'cidade']
+    form_class = FornecedorUpdateForm
     extra_context = {'titulo': 'Atualizar Fornecedor'}
     success_message = "Fornecedor atualizado com sucesso!"
 
@@ -216,10 +235,6 @@ class PedidoUpdate(LoginRequiredMixin, OwnerRequiredMixin, View):
                 'fornecedor__cidade',
                 'fornecedor__estado',
                 'criado_por'
-            ).prefetch_related(
-                'itempedido_set__item',
-                'itempedido_set__item__categoria',
-                'itempedido_set__frota'
             ).get(pk=pk, criado_por=request.user)
         except Pedido.DoesNotExist:
             messages.error(request, 'Pedido não encontrado.')
@@ -251,26 +266,23 @@ class PedidoUpdate(LoginRequiredMixin, OwnerRequiredMixin, View):
 
         if form_wrapper.is_valid():
             try:
-                pedido_atualizado = form_wrapper.save()
-
-                if status_anterior != pedido_atualizado.status:
-                    MovimentacaoPedido.objects.create(
-                        pedido=pedido_atualizado,
-                        tipo='alteracao_status',
-                        status_anterior=status_anterior,
-                        status_novo=pedido_atualizado.status,
-                        observacao=f'Status alterado de "{pedido_atualizado.get_status_display()}" para "{dict(Pedido.STATUS_CHOICES).get(pedido_atualizado.status)}"',
-                        usuario=request.user
-                    )
-                else:
-                    MovimentacaoPedido.objects.create(
-                        pedido=pedido_atualizado,
-                        tipo='alteracao_dados',
-                        status_anterior=status_anterior,
-                        status_novo=pedido_atualizado.status,
-                        observacao=f'Dados do pedido atualizados. Valor total: R$ {pedido_atualizado.valor_total}',
-                        usuario=request.user
-                    )
+                with RegistroMovimentacoes(request.user) as auditoria:
+                    pedido_atualizado = form_wrapper.save(auditoria=auditoria)
+
+                    if status_anterior != pedido_atualizado.status:
+                        auditoria.registrar(
+                            pedido_atualizado, 'alteracao_status',
+                            status_anterior=status_anterior,
+                            status_novo=pedido_atualizado.status,
+                            observacao=f'Status alterado de "{dict(Pedido.STATUS_CHOICES).get(status_anterior)}" para "{pedido_atualizado.get_status_display()}"',
+                        )
+                    else:
+                        auditoria.registrar(
+                            pedido_atualizado, 'alteracao_dados',
+                            status_anterior=status_anterior,
+                            status_novo=pedido_atualizado.status,
+                            observacao=f'Dados do pedido atualizados. Valor total: R$ {pedido_atualizado.valor_total}',
+                        )
 
                 messages.success(request, f'Pedido #{pedido_atualizado.id} atualizado com sucesso!')
                 return redirect('pedido-list')
@@ -285,10 +297,6 @@ class PedidoUpdate(LoginRequiredMixin, OwnerRequiredMixin, View):
                 'fornecedor__cidade',
                 'fornecedor__estado',
                 'criado_por'
-            ).prefetch_related(
-                'itempedido_set__item',
-                'itempedido_set__item__categoria',
-                'itempedido_set__frota'
             ).get(pk=pk, criado_por=request.user)
         except Pedido.DoesNotExist:
             messages.error(request, 'Pedido não encontrado.')
@@ -303,11 +311,11 @@ class PedidoUpdate(LoginRequiredMixin, OwnerRequiredMixin, View):
         return render(request, self.template_name, context)
 
 
-class ItemPedidoUpdate(LoginRequiredMixin, OwnerRequiredMixin, SuccessMessageMixin, UpdateView):
+class ItemPedidoUpdate(LoginRequiredMixin, OwnerRequiredMixin, FormUsuarioMixin, SuccessMessageMixin, UpdateView):
     template_name = 'cadastros/form.html'
     model = ItemPedido
     success_url = reverse_lazy('itempedido-list')
-    fields = ['item', 'frota', 'pedido', 'status', 'quantidade', 'valor_unitario']
+    form_class = ItemPedidoAvulsoForm
     extra_context = {'titulo': 'Atualizar Item do Pedido'}
     success_message = "Item do pedido atualizado com sucesso!"
 
@@ -360,6 +368,11 @@ class ItemPedidoDelete(LoginRequiredMixin, OwnerRequiredMixin, SuccessDeleteMixi
     success_url = reverse_lazy('itempedido-list')
     success_message = "Item do pedido excluído com sucesso!"
 
+    def form_valid(self, form):
+        with RegistroMovimentacoes(self.request.user) as auditoria:
+            auditoria.registrar_itens(removidos=[self.object])
+            return super().form_valid(form)
+
 
 class EstadoList(LoginRequiredMixin, ListView):
     template_name = 'listas/estado.html'
@@ -388,15 +401,18 @@ class FornecedorList(LoginRequiredMixin, ListView):
     paginate_by = 20
 
     def get_queryset(self):
+        # Cidade e estado vêm do cache de referência em get_context_data
         return Fornecedor.objects.select_related(
-            'cidade',
-            'cidade__estado',
-            'estado',
             'criado_por'
         ).filter(
             criado_por=self.request.user
         ).order_by('-id')
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        referencia.anexar(context['fornecedores'])
+        return context
+
 
 class FrotaList(LoginRequiredMixin, ListView):
     template_name = 'listas/frota.html'
@@ -437,25 +453,37 @@ class ItemList(LoginRequiredMixin, ListView):
         ).order_by('nome')
 
 
-class PedidoList(LoginRequiredMixin, FilterView):
+class PedidoList(LoginRequiredMixin, PaginacaoCursorMixin, FilterView):
     template_name = 'listas/pedido.html'
     model = Pedido
     context_object_name = 'pedidos'
     filterset_class = PedidoFilter
     paginate_by = 20
+    ordenacao_cursor = ('-data_pedido', '-id')
 
     def get_queryset(self):
+        # Contagem em subconsulta correlacionada: evita um GROUP BY sobre
+        # todas as colunas do pedido e das tabelas do select_related
+        item_count = Coalesce(
+            Subquery(
+                ItemPedido.objects.filter(pedido=OuterRef('pk')).order_by().values('pedido').annotate(
+                    total=Count('id')
+                ).values('total')
+            ),
+            0,
+        )
+
+        # Os itens não são pré-carregados: a linha expansível busca os itens
+        # de um pedido sob demanda em PedidoItens
+        # A cidade do fornecedor vem do cache de referência em get_context_data
         return Pedido.objects.select_related(
             'fornecedor',
-            'fornecedor__cidade',
             'criado_por'
-        ).prefetch_related(
-            'itempedido_set__item',
-            'itempedido_set__item__categoria',
-            'itempedido_set__frota'
+        ).annotate(
+            item_count=item_count
         ).filter(
             criado_por=self.request.user
-        ).order_by('-data_pedido')
+        ).order_by('-data_pedido', '-id')
 
     def get_filterset_kwargs(self, filterset_class):
         kwargs = super().get_filterset_kwargs(filterset_class)
@@ -464,24 +492,116 @@ class PedidoList(LoginRequiredMixin, FilterView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        filtered_queryset = context['filter'].qs
-
-        context['total_filtrado'] = filtered_queryset.count()
-        context['total_geral'] = self.get_queryset().count()
+        referencia.anexar(pedido.fornecedor for pedido in context['pedidos'])
+
+        # Uma única consulta agrupada por status fornece as estatísticas e o
+        # total filtrado. distinct: um filtro que faça JOIN com os itens não
+        # pode contar o mesmo pedido uma vez por item
+        contagem = dict(
+            context['filter'].qs.order_by().values_list('status').annotate(
+                total=Count('id', distinct=True)
+            )
+        )
+
+        context['total_filtrado'] = sum(contagem.values())
+        context['total_geral'] = total_pedidos(self.request.user)
         context['stats_status'] = {
-            'pendente': filtered_queryset.filter(status='pendente').count(),
-            'em_andamento': filtered_queryset.filter(status='em_andamento').count(),
-            'finalizado': filtered_queryset.filter(status='finalizado').count(),
+            'pendente': contagem.get('pendente', 0),
+            'em_andamento': contagem.get('em_andamento', 0),
+            'finalizado': contagem.get('finalizado', 0),
         }
 
         return context
 
 
-class ItemPedidoList(LoginRequiredMixin, ListView):
+class PedidoItens(LoginRequiredMixin, View):
+    """Fragmento HTML com os itens de um pedido, carregado pela lista de pedidos."""
+    template_name = 'listas/pedido_itens.html'
+
+    def get(self, request, pk):
+        pedido = get_object_or_404(Pedido.objects.only('id', 'criado_por'), pk=pk)
+        if pedido.criado_por_id != request.user.id:
+            raise PermissionDenied("Você não tem permissão para visualizar este registro.")
+
+        itens = ItemPedido.objects.filter(pedido=pedido).select_related(
+            'item',
+            'item__categoria',
+            'frota'
+        ).annotate(
+            line_total=TOTAL_LINHA
+        ).order_by('item_id', 'id')
+
+        return render(request, self.template_name, {'pedido': pedido, 'itens': itens})
+
+
+class PedidoHistorico(LoginRequiredMixin, PaginacaoCursorMixin, ListView):
+    """
+    Linha do tempo das movimentações de um pedido, da mais recente para a
+    mais antiga. A paginação por cursor percorre o índice
+    (pedido, -data_movimentacao, -id), então pedidos com milhares de
+    movimentações custam o mesmo por página. Os meses já arquivados
+    (ver arquivamento.py) não aparecem aqui.
+    """
+    template_name = 'listas/pedido_historico.html'
+    context_object_name = 'movimentacoes'
+    paginate_by = 30
+    ordenacao_cursor = ('-data_movimentacao', '-id')
+
+    def get_queryset(self):
+        self.pedido = get_object_or_404(
+            Pedido.objects.select_related('fornecedor').only('id', 'status', 'criado_por', 'fornecedor__nome'),
+            pk=self.kwargs['pk'],
+        )
+        if self.pedido.criado_por_id != self.request.user.id:
+            raise PermissionDenied("Você não tem permissão para visualizar este registro.")
+
+        return MovimentacaoPedido.objects.filter(
+            pedido_id=self.pedido.pk
+        ).select_related(
+            'usuario'
+        ).order_by('-data_movimentacao', '-id')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['pedido'] = self.pedido
+        return context
+
+
+class PedidoExport(LoginRequiredMixin, FilterMixin, View):
+    """Exporta os pedidos com os mesmos filtros da lista, gerando o arquivo aos poucos."""
+    filterset_class = PedidoFilter
+    formatos = {
+        'csv': (gerar_csv, 'text/csv; charset=utf-8'),
+        'xlsx': (gerar_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    }
+
+    def get_queryset(self):
+        return Pedido.objects.filter(criado_por=self.request.user)
+
+    def get(self, request, formato):
+        if formato not in self.formatos:
+            raise Http404('Formato de exportação inválido.')
+        gerar, content_type = self.formatos[formato]
+
+        # Mesmo critério da FilterView: filtros inválidos não exportam nada
+        filterset = self.get_filterset(self.get_filterset_class())
+        if not filterset.is_bound or filterset.is_valid() or not self.get_strict():
+            pedidos = filterset.qs
+        else:
+            pedidos = filterset.queryset.none()
+
+        response = StreamingHttpResponse(gerar(linhas_exportacao(pedidos)), content_type=content_type)
+        nome_arquivo = f'pedidos-{timezone.localdate():%Y-%m-%d}.{formato}'
+        response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+        return response
+
+
+class ItemPedidoList(LoginRequiredMixin, PaginacaoCursorMixin, ListView):
     template_name = 'listas/itempedido.html'
     model = ItemPedido
     context_object_name = 'itens_pedido'
     paginate_by = 20
+    ordenacao_cursor = ('pedido_id', 'item_id', 'id')
 
     def get_queryset(self):
         return ItemPedido.objects.select_related(
@@ -491,6 +611,81 @@ class ItemPedidoList(LoginRequiredMixin, ListView):
             'pedido',
             'pedido__fornecedor',
             'criado_por'
+        ).annotate(
+            line_total=TOTAL_LINHA
         ).filter(
             criado_por=self.request.user
-        ).order_by('-id')
\ No newline at end of file
+        ).order_by('pedido_id', 'item_id', 'id')
+
+
+class AutocompleteMixin(LoginRequiredMixin):
+    """
+    Base das buscas dos selects com autocomplete: registros do usuário cujo
+    ``campo_busca`` começa com o texto digitado, em páginas de ``paginate_by``.
+    A busca por prefixo usa os índices criados na migração 0005.
+    """
+    model = None
+    campo_busca = 'nome'
+    relacionados = ()
+    do_usuario = True
+    paginate_by = 20
+
+    def get_queryset(self):
+        queryset = self.model.objects.select_related(*self.relacionados)
+        if self.do_usuario:
+            queryset = queryset.filter(criado_por=self.request.user)
+        if self.q:
+            queryset = queryset.filter(**{f'{self.campo_busca}__istartswith': self.q})
+        return queryset.order_by(self.campo_busca, 'pk')
+
+    def get_selected_result_label(self, result):
+        # Mesmo texto da opção renderizada pelo formulário
+        return str(result)
+
+
+class FornecedorAutocomplete(AutocompleteMixin, autocomplete.Select2QuerySetView):
+    model = Fornecedor
+
+
+class ItemAutocomplete(AutocompleteMixin, autocomplete.Select2QuerySetView):
+    model = Item
+    relacionados = ('categoria',)
+
+    def get_result_label(self, result):
+        return f'{result.nome} - {result.categoria.nome}'
+
+
+class FrotaAutocomplete(AutocompleteMixin, autocomplete.Select2QuerySetView):
+    model = Frota
+    campo_busca = 'prefixo'
+
+    def get_result_label(self, result):
+        return f'{result.prefixo} - {result.descricao}'
+
+
+class CidadeAutocomplete(AutocompleteMixin, autocomplete.Select2QuerySetView):
+    # Cidades são dados de referência, compartilhados entre os usuários: a
+    # busca e a paginação são feitas sobre o cache do processo, sem consultar
+    # o banco. Com o estado enviado pelo formulário, lista só as cidades dele
+    model = Cidade
+    do_usuario = False
+
+    def get_queryset(self):
+        return referencia.cidades(self.forwarded.get('estado'), self.q)
+
+
+class PedidoAutocomplete(AutocompleteMixin, autocomplete.Select2QuerySetView):
+    model = Pedido
+    relacionados = ('fornecedor',)
+
+    def get_queryset(self):
+        pedidos = Pedido.objects.select_related(*self.relacionados).filter(criado_por=self.request.user)
+        if self.q:
+            # Número do pedido (com ou sem #) ou início do nome do fornecedor
+            filtro = Q(fornecedor__nome__istartswith=self.q)
+            numero = self.q.lstrip('#')
+            # Um número acima do maior pk estouraria no banco em vez de não achar nada
+            if numero.isdecimal() and int(numero) <= INTEIRO_MAXIMO:
+                filtro |= Q(pk=int(numero))
+            pedidos = pedidos.filter(filtro)
+        return pedidos.order_by('-data_pedido', '-pk')
@@ -0,0 +1,17 @@
+"""
+Configuracao do gunicorn, lida automaticamente a partir da raiz do projeto.
+
+Ao iniciar, o processo mestre limpa o diretorio das metricas
+(naes2025/metricas.py): os arquivos de uma execucao anterior, com pids que
+podem ser reutilizados, nao devem somar na nova.
+"""
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+
+def on_starting(server):
+    diretorio = Path(os.environ.get('METRICAS_DIR', Path(tempfile.gettempdir()) / 'naes2025-metricas'))
+    shutil.rmtree(diretorio, ignore_errors=True)
+    diretorio.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,208 @@
+"""
+Captura das consultas lentas, com o plano de execucao de uma amostra delas.
+
+Durante cada requisicao, ConsultasLentasMiddleware instala um
+execute_wrapper em todas as conexoes. Consultas que passam de
+``CONSULTAS_LENTAS_LIMITE_MS`` geram uma linha JSON de aviso no logger
+``naes2025.consultas_lentas``, com o nome da URL de origem e a impressao
+digital do SQL normalizado (literais e parametros trocados por ``?``, listas
+de IN e de VALUES colapsadas), que agrupa as variantes da mesma consulta do
+ORM.
+
+Cada ocorrencia tambem e gravada em ``CONSULTAS_LENTAS_DIR``, um buffer
+circular em disco: segmentos JSONL por processo com no maximo
+``ITENS_POR_SEGMENTO`` linhas, dos quais so os ``CONSULTAS_LENTAS_SEGMENTOS``
+mais recentes sao mantidos. Para a fracao ``CONSULTAS_LENTAS_EXPLAIN`` das
+ocorrencias de SELECT a linha inclui o EXPLAIN da consulta; com
+``CONSULTAS_LENTAS_ANALYZE`` (so PostgreSQL) e um EXPLAIN ANALYZE, que
+executa a consulta de novo. O comando consultas_lentas resume o buffer.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ITENS_POR_SEGMENTO = 500
+TAMANHO_MAXIMO_SQL = 4000
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAMETRO = re.compile(r'%s|%\(\w+\)s')
+_LISTA = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_LINHAS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_ESPACOS = re.compile(r'\s+')
+
+
+def normalizar(sql):
+    """SQL sem os valores: o mesmo texto para todas as execucoes da consulta."""
+    sql = _LITERAL.sub('?', sql)
+    sql = _PARAMETRO.sub('?', sql)
+    sql = _NUMERO.sub('?', sql)
+    sql = _LISTA.sub('(...)', sql)
+    sql = _LINHAS.sub('(...)', sql)
+    return _ESPACOS.sub(' ', sql).strip()
+
+
+def impressao_digital(sql_normalizado):
+    return hashlib.sha1(sql_normalizado.encode('utf-8')).hexdigest()[:12]
+
+
+def diretorio():
+    return Path(settings.CONSULTAS_LENTAS_DIR)
+
+
+class BufferCircular:
+    """Segmentos JSONL em disco; ao abrir um segmento novo, os excedentes mais antigos saem."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dono = None
+        self._segmento = None
+        self._linhas = 0
+
+    def gravar(self, registro):
+        linha = json.dumps(registro, ensure_ascii=False) + '\n'
+        with self._lock:
+            dono = (os.getpid(), str(diretorio()))
+            if self._dono != dono or self._linhas >= ITENS_POR_SEGMENTO:
+                self._novo_segmento(dono)
+            with open(self._segmento, 'a', encoding='utf-8') as arquivo:
+                arquivo.write(linha)
+            self._linhas += 1
+
+    def _novo_segmento(self, dono):
+        pasta = Path(dono[1])
+        pasta.mkdir(parents=True, exist_ok=True)
+        # O nome comeca pelo instante, entao a ordem alfabetica e a cronologica
+        self._segmento = pasta / f'{time.time_ns():020d}-{dono[0]}.jsonl'
+        self._dono = dono
+        self._linhas = 0
+        # Com o segmento novo, ficam no maximo CONSULTAS_LENTAS_SEGMENTOS
+        existentes = sorted(pasta.glob('*.jsonl'))
+        excedentes = len(existentes) - max(getattr(settings, 'CONSULTAS_LENTAS_SEGMENTOS', 10) - 1, 0)
+        for caminho in existentes[:max(excedentes, 0)]:
+            caminho.unlink(missing_ok=True)
+
+
+buffer = BufferCircular()
+
+
+def ler_registros(pasta=None):
+    """Registros do buffer, do mais antigo para o mais recente."""
+    for caminho in sorted(Path(pasta or diretorio()).glob('*.jsonl')):
+        try:
+            linhas = caminho.read_text(encoding='utf-8').splitlines()
+        except FileNotFoundError:
+            # Segmento descartado por outro processo durante a leitura
+            continue
+        for linha in linhas:
+            try:
+                yield json.loads(linha)
+            except ValueError:
+                # Linha sendo escrita por outro processo
+                continue
+
+
+def _explain(connection, sql, params):
+    opcoes = {}
+    if getattr(settings, 'CONSULTAS_LENTAS_ANALYZE', False) and connection.vendor == 'postgresql':
+        opcoes['analyze'] = True
+    prefixo = connection.ops.explain_query_prefix(**opcoes)
+    # O EXPLAIN e o savepoint nao sao consultas da requisicao: sem os
+    # execute_wrappers, nem esta captura nem a medicao do DesempenhoMiddleware
+    # os contam
+    wrappers = connection.execute_wrappers
+    connection.execute_wrappers = []
+    try:
+        # Savepoint: no PostgreSQL um erro no EXPLAIN abortaria a transacao da requisicao
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'{prefixo} {sql}', params)
+            # PostgreSQL devolve uma coluna de texto por linha; SQLite, (id, pai, -, detalhe)
+            return [' '.join(str(coluna) for coluna in linha) for linha in cursor.fetchall()]
+    finally:
+        connection.execute_wrappers = wrappers
+
+
+class CapturaConsultas:
+    """execute_wrapper que registra as consultas acima do limite."""
+
+    def __init__(self, origem, limite_ms, amostra_explain):
+        self.origem = origem
+        self.limite = limite_ms / 1000
+        self.amostra_explain = amostra_explain
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        resultado = execute(sql, params, many, context)
+        duracao = time.perf_counter() - inicio
+        if duracao >= self.limite:
+            self.registrar(sql, params, many, context['connection'], duracao)
+        return resultado
+
+    def registrar(self, sql, params, many, connection, duracao):
+        normalizado = normalizar(sql)
+        registro = {
+            'momento': timezone.now().isoformat(),
+            'url': self.origem() if callable(self.origem) else self.origem,
+            'impressao': impressao_digital(normalizado),
+            'duracao_ms': round(duracao * 1000, 2),
+            'banco': connection.alias,
+            'sql': normalizado[:TAMANHO_MAXIMO_SQL],
+        }
+        logger.warning(json.dumps(registro, ensure_ascii=False))
+
+        if (not many and self.amostra_explain > 0 and random.random() < self.amostra_explain
+                and normalizado[:6].upper() == 'SELECT'):
+            try:
+                registro['plano'] = _explain(connection, sql, params)
+            except Exception as erro:
+                registro['plano_erro'] = str(erro)
+
+        try:
+            buffer.gravar(registro)
+        except OSError:
+            logger.exception('Não foi possível gravar a consulta lenta em %s', diretorio())
+
+
+def _limite_ms():
+    return getattr(settings, 'CONSULTAS_LENTAS_LIMITE_MS', None)
+
+
+@contextmanager
+def capturar(origem):
+    """Registra as consultas lentas do bloco; ``origem`` e um texto ou uma funcao que o retorna."""
+    limite = _limite_ms()
+    if limite is None:
+        yield
+        return
+    captura = CapturaConsultas(origem, limite, getattr(settings, 'CONSULTAS_LENTAS_EXPLAIN', 0))
+    with ExitStack() as pilha:
+        for alias in connections:
+            pilha.enter_context(connections[alias].execute_wrapper(captura))
+        yield
+
+
+class ConsultasLentasMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # A URL so e resolvida depois, dentro de get_response
+        def origem():
+            return request.resolver_match.view_name if request.resolver_match else request.path
+
+        with capturar(origem):
+            return self.get_response(request)
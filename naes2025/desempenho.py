@@ -0,0 +1,138 @@
+"""
+Medicao de desempenho por requisicao, leve o bastante para producao.
+
+Para uma fracao ``DESEMPENHO_AMOSTRAGEM`` das requisicoes (0 desliga, 1 mede
+todas), DesempenhoMiddleware registra o nome da URL, o numero de consultas,
+o tempo no banco, o tempo de renderizacao dos templates e o tempo total.
+Os valores saem no cabecalho ``Server-Timing`` (visivel nas ferramentas do
+navegador) e numa linha JSON no logger ``naes2025.desempenho``. Todas as
+requisicoes, medidas ou nao, entram nas metricas de latencia (metricas.py).
+
+Requisicoes fora da amostra custam um sorteio e a soma nas metricas, com
+as chaves ja montadas na primeira requisicao de cada (url, metodo, status).
+Nas medidas, cada consulta passa por um execute_wrapper e cada
+renderizacao de template de nivel mais externo e cronometrada. O tempo de template inclui as consultas feitas
+durante a renderizacao (querysets avaliados no template); para respostas em
+streaming, o total nao inclui o envio do corpo.
+"""
+import contextvars
+import functools
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+from . import metricas
+
+logger = logging.getLogger(__name__)
+
+_medicao = contextvars.ContextVar('medicao_desempenho', default=None)
+
+
+class Medicao:
+    """Acumula as consultas e os tempos de uma requisicao; e o execute_wrapper dela."""
+
+    __slots__ = ('consultas', 'banco', 'template', 'renderizando')
+
+    def __init__(self):
+        self.consultas = 0
+        self.banco = 0.0
+        self.template = 0.0
+        self.renderizando = False
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.banco += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+def _medir_render(render):
+    @functools.wraps(render)
+    def render_medido(self, context):
+        medicao = _medicao.get()
+        # Includes e templates renderizados dentro de outro ja estao no tempo dele
+        if medicao is None or medicao.renderizando:
+            return render(self, context)
+        medicao.renderizando = True
+        inicio = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            medicao.template += time.perf_counter() - inicio
+            medicao.renderizando = False
+
+    render_medido.medido = True
+    return render_medido
+
+
+def instalar_medicao_templates():
+    """Cronometra Template.render; fora de uma medicao o custo e uma leitura de ContextVar."""
+    if not getattr(Template.render, 'medido', False):
+        Template.render = _medir_render(Template.render)
+
+
+def _nome_url(request):
+    return request.resolver_match.view_name if request.resolver_match else ''
+
+
+def _amostragem():
+    return getattr(settings, 'DESEMPENHO_AMOSTRAGEM', 0)
+
+
+class DesempenhoMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instalar_medicao_templates()
+
+    def __call__(self, request):
+        taxa = _amostragem()
+        if taxa <= 0 or (taxa < 1 and random.random() >= taxa):
+            # Fora da amostra entra so nas metricas de vazao e latencia
+            inicio = time.perf_counter()
+            response = self.get_response(request)
+            metricas.registrar_requisicao(
+                _nome_url(request), request.method, response.status_code, time.perf_counter() - inicio,
+            )
+            return response
+
+        medicao = Medicao()
+        token = _medicao.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pilha:
+                for alias in connections:
+                    pilha.enter_context(connections[alias].execute_wrapper(medicao))
+                response = self.get_response(request)
+        finally:
+            _medicao.reset(token)
+        total = time.perf_counter() - inicio
+
+        url = _nome_url(request)
+        metricas.registrar_requisicao(url, request.method, response.status_code, total, medicao.consultas)
+        response['Server-Timing'] = ', '.join(filter(None, [
+            f'url;desc="{url}"' if url else '',
+            f'db;dur={medicao.banco * 1000:.1f};desc="{medicao.consultas} consultas"',
+            f'tpl;dur={medicao.template * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ]))
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'url': url,
+                'metodo': request.method,
+                'caminho': request.path,
+                'status': response.status_code,
+                'consultas': medicao.consultas,
+                'banco_ms': round(medicao.banco * 1000, 2),
+                'template_ms': round(medicao.template * 1000, 2),
+                'total_ms': round(total * 1000, 2),
+            }, ensure_ascii=False))
+        return response
@@ -0,0 +1,348 @@
+"""
+Registro de metricas da aplicacao, exposto no formato texto do Prometheus.
+
+Cada processo grava os seus valores num arquivo proprio (``{pid}.db``) em
+``METRICAS_DIR``, mapeado em memoria com mmap; a exposicao le e soma os
+arquivos de todos os processos. Assim os workers do gunicorn, que nao
+compartilham memoria, aparecem como uma instancia so. Os arquivos de workers
+encerrados continuam somando: contadores e histogramas nao diminuem quando
+um worker e reciclado. O diretorio e limpo quando o gunicorn inicia (ver
+gunicorn.conf.py).
+
+Formato do arquivo: 8 bytes de cabecalho com o total usado e, em seguida,
+registros ``[tamanho da chave][chave][valor double]`` alinhados em 8 bytes.
+O registro e escrito antes de o total ser atualizado, entao quem le nunca
+ve um registro pela metade.
+"""
+import bisect
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+TAMANHO_INICIAL = 64 * 1024
+_CABECALHO = struct.Struct('<I4x')
+_TAMANHO_CHAVE = struct.Struct('<I')
+_VALOR = struct.Struct('<d')
+
+
+class ArquivoValores:
+    """Valores de um processo num arquivo mapeado em memoria."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        existe = caminho.exists() and caminho.stat().st_size >= TAMANHO_INICIAL
+        self.arquivo = open(caminho, 'r+b' if existe else 'w+b')
+        if not existe:
+            self.arquivo.truncate(TAMANHO_INICIAL)
+        self.mapa = mmap.mmap(self.arquivo.fileno(), 0)
+        self.usado = _CABECALHO.unpack_from(self.mapa, 0)[0] or _CABECALHO.size
+        # Um pid reaproveitado continua o arquivo do processo anterior
+        self.posicoes = {chave: posicao for chave, posicao, _ in _registros(self.mapa, self.usado)}
+
+    def somar(self, chave, valor):
+        posicao = self.posicoes.get(chave)
+        if posicao is None:
+            posicao = self._novo(chave)
+        atual = _VALOR.unpack_from(self.mapa, posicao)[0]
+        _VALOR.pack_into(self.mapa, posicao, atual + valor)
+
+    def _novo(self, chave):
+        codificada = chave.encode('utf-8')
+        tamanho = _alinhar(_TAMANHO_CHAVE.size + len(codificada)) + _VALOR.size
+        if self.usado + tamanho > len(self.mapa):
+            self._crescer(self.usado + tamanho)
+
+        inicio = self.usado
+        _TAMANHO_CHAVE.pack_into(self.mapa, inicio, len(codificada))
+        self.mapa[inicio + _TAMANHO_CHAVE.size:inicio + _TAMANHO_CHAVE.size + len(codificada)] = codificada
+        posicao = inicio + tamanho - _VALOR.size
+        _VALOR.pack_into(self.mapa, posicao, 0.0)
+        self.usado += tamanho
+        _CABECALHO.pack_into(self.mapa, 0, self.usado)
+        self.posicoes[chave] = posicao
+        return posicao
+
+    def _crescer(self, minimo):
+        tamanho = len(self.mapa)
+        while tamanho < minimo:
+            tamanho *= 2
+        self.mapa.close()
+        self.arquivo.truncate(tamanho)
+        self.mapa = mmap.mmap(self.arquivo.fileno(), 0)
+
+    def fechar(self):
+        self.mapa.close()
+        self.arquivo.close()
+
+
+def _alinhar(tamanho):
+    return (tamanho + 7) // 8 * 8
+
+
+def _registros(dados, usado):
+    """(chave, posicao do valor, valor) de cada registro em ``dados``."""
+    inicio = _CABECALHO.size
+    while inicio < usado:
+        tamanho_chave = _TAMANHO_CHAVE.unpack_from(dados, inicio)[0]
+        fim_chave = inicio + _TAMANHO_CHAVE.size + tamanho_chave
+        chave = bytes(dados[inicio + _TAMANHO_CHAVE.size:fim_chave]).decode('utf-8')
+        posicao = _alinhar(fim_chave)
+        yield chave, posicao, _VALOR.unpack_from(dados, posicao)[0]
+        inicio = posicao + _VALOR.size
+
+
+def ler_diretorio(diretorio):
+    """Soma dos valores de todos os arquivos de ``diretorio``."""
+    totais = {}
+    for caminho in sorted(Path(diretorio).glob('*.db')):
+        dados = caminho.read_bytes()
+        if len(dados) < _CABECALHO.size:
+            continue
+        for chave, _, valor in _registros(dados, _CABECALHO.unpack_from(dados, 0)[0]):
+            totais[chave] = totais.get(chave, 0.0) + valor
+    return totais
+
+
+class Registro:
+    """Metricas declaradas e o arquivo de valores do processo atual."""
+
+    def __init__(self):
+        self.metricas = []
+        self._lock = threading.Lock()
+        self._arquivo = None
+        self._dono = None
+
+    def diretorio(self):
+        return Path(settings.METRICAS_DIR)
+
+    def _valores(self):
+        # Um novo processo (fork) ou outro diretorio (testes) abre outro arquivo
+        dono = (os.getpid(), str(self.diretorio()))
+        if self._dono != dono:
+            if self._arquivo is not None and self._dono[0] == dono[0]:
+                self._arquivo.fechar()
+            self.diretorio().mkdir(parents=True, exist_ok=True)
+            self._arquivo = ArquivoValores(self.diretorio() / f'{dono[0]}.db')
+            self._dono = dono
+        return self._arquivo
+
+    def somar(self, chaves_valores):
+        with self._lock:
+            valores = self._valores()
+            for chave, valor in chaves_valores:
+                valores.somar(chave, valor)
+
+    def exposicao(self):
+        """Texto no formato de exposicao do Prometheus (versao 0.0.4)."""
+        totais = ler_diretorio(self.diretorio())
+        amostras = {}
+        for chave, valor in totais.items():
+            nome, rotulos = json.loads(chave)
+            amostras.setdefault(nome, []).append((rotulos, valor))
+
+        linhas = []
+        for metrica in self.metricas:
+            linhas.append(f'# HELP {metrica.nome} {metrica.ajuda}')
+            linhas.append(f'# TYPE {metrica.nome} {metrica.tipo}')
+            for nome, rotulos, valor in metrica.amostras(amostras):
+                linhas.append(f'{nome}{_formatar_rotulos(rotulos)} {_formatar_valor(valor)}')
+        return '\n'.join(linhas) + '\n'
+
+
+registro = Registro()
+
+
+def _chave(nome, rotulos):
+    return json.dumps([nome, rotulos], ensure_ascii=False, separators=(',', ':'))
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatar_rotulos(rotulos):
+    if not rotulos:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos) + '}'
+
+
+def _formatar_valor(valor):
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    return repr(float(valor)) if valor != int(valor) else str(int(valor))
+
+
+class Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=(), registro=registro):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.registro = registro
+        # Chaves ja montadas por combinacao de rotulos: sao tantas quantas as
+        # series, o mesmo limite dos arquivos de valores
+        self._cache_chaves = {}
+        registro.metricas.append(self)
+
+    def _rotulos(self, valores):
+        if set(valores) != set(self.rotulos):
+            raise ValueError(f'{self.nome} espera os rótulos {self.rotulos}, recebeu {tuple(valores)}')
+        return [[nome, str(valores[nome])] for nome in self.rotulos]
+
+    def _chaves(self, valores):
+        """Chaves gravadas para os rotulos ``valores``; o JSON e montado uma vez por serie."""
+        identificacao = tuple(valores.items())
+        chaves = self._cache_chaves.get(identificacao)
+        if chaves is None:
+            chaves = self._cache_chaves[identificacao] = self._montar_chaves(self._rotulos(valores))
+        return chaves
+
+    def _montar_chaves(self, rotulos):
+        return _chave(self.nome, rotulos)
+
+    def amostras(self, amostras):
+        for rotulos, valor in sorted(amostras.get(self.nome, []), key=lambda amostra: amostra[0]):
+            yield self.nome, rotulos, valor
+
+
+class Contador(Metrica):
+    """Contador monotonicamente crescente; o nome deve terminar em _total."""
+    tipo = 'counter'
+
+    def inc(self, valor=1, **rotulos):
+        self.registro.somar([(self._chaves(rotulos), valor)])
+
+
+class Histograma(Metrica):
+    """Histograma de faixas fixas; grava as faixas ja acumuladas, como o Prometheus as expoe."""
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, faixas, rotulos=(), registro=registro):
+        super().__init__(nome, ajuda, rotulos, registro)
+        self.faixas = tuple(sorted(faixas)) + (math.inf,)
+        self.textos_faixas = [_formatar_valor(faixa) for faixa in self.faixas]
+
+    def _montar_chaves(self, rotulos):
+        return (
+            [_chave(f'{self.nome}_bucket', rotulos + [['le', texto]]) for texto in self.textos_faixas],
+            _chave(f'{self.nome}_sum', rotulos),
+            _chave(f'{self.nome}_count', rotulos),
+        )
+
+    def observar(self, valor, **rotulos):
+        faixas, soma, contagem = self._chaves(rotulos)
+        # As faixas acumuladas comecam na primeira que comporta o valor
+        escritas = [(chave, 1) for chave in faixas[bisect.bisect_left(self.faixas, valor):]]
+        escritas += [(soma, valor), (contagem, 1)]
+        self.registro.somar(escritas)
+
+    @contextmanager
+    def cronometrar(self, **rotulos):
+        """Observa a duracao, em segundos, do bloco."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def amostras(self, amostras):
+        # Faixas ainda sem observacoes nao estao nos arquivos, mas o Prometheus
+        # espera todas elas em cada serie
+        faixas = {}
+        for rotulos, valor in amostras.get(self.nome + '_bucket', []):
+            *base, (_, texto) = rotulos
+            faixas[texto, json.dumps(base)] = valor
+
+        series = sorted(amostras.get(self.nome + '_count', []), key=lambda amostra: amostra[0])
+        somas = {json.dumps(rotulos): valor for rotulos, valor in amostras.get(self.nome + '_sum', [])}
+        for rotulos, contagem in series:
+            chave = json.dumps(rotulos)
+            for texto in self.textos_faixas:
+                yield self.nome + '_bucket', rotulos + [['le', texto]], faixas.get((texto, chave), 0.0)
+            yield self.nome + '_sum', rotulos, somas.get(chave, 0.0)
+            yield self.nome + '_count', rotulos, contagem
+
+
+class Calculada(Metrica):
+    """Gauge calculado na exposicao a partir dos valores ja somados."""
+    tipo = 'gauge'
+
+    def __init__(self, nome, ajuda, calcular, registro=registro):
+        super().__init__(nome, ajuda, (), registro)
+        self.calcular = calcular
+
+    def amostras(self, amostras):
+        for rotulos, valor in self.calcular(amostras):
+            yield self.nome, rotulos, valor
+
+
+# === METRICAS DA APLICACAO ===
+
+REQUISICOES = Contador(
+    'naes_requisicoes_total', 'Requisições atendidas, por nome da URL, método e status.',
+    ['url', 'metodo', 'status'],
+)
+DURACAO_REQUISICAO = Histograma(
+    'naes_requisicao_duracao_segundos', 'Tempo total da requisição, por nome da URL.',
+    [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10], ['url'],
+)
+CONSULTAS_REQUISICAO = Histograma(
+    'naes_requisicao_consultas', 'Consultas ao banco por requisição medida, por nome da URL.',
+    [1, 2, 5, 10, 20, 50, 100, 200, 500], ['url'],
+)
+CACHE = Contador(
+    'naes_cache_total', 'Leituras dos caches da aplicação, por cache e resultado (acerto/falha).',
+    ['cache', 'resultado'],
+)
+DURACAO_FORMULARIO = Histograma(
+    'naes_formulario_salvar_duracao_segundos', 'Tempo para salvar um formulário, por formulário.',
+    [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5], ['formulario'],
+)
+
+
+def _taxas_acerto(amostras):
+    por_cache = {}
+    for rotulos, valor in amostras.get(CACHE.nome, []):
+        rotulos = dict(rotulos)
+        contagem = por_cache.setdefault(rotulos['cache'], {'acerto': 0.0, 'falha': 0.0})
+        contagem[rotulos['resultado']] = contagem.get(rotulos['resultado'], 0.0) + valor
+    for cache, contagem in sorted(por_cache.items()):
+        total = contagem['acerto'] + contagem['falha']
+        yield [['cache', cache]], contagem['acerto'] / total if total else 0.0
+
+
+TAXA_ACERTO_CACHE = Calculada(
+    'naes_cache_taxa_acerto', 'Fração das leituras de cada cache que foram acertos.', _taxas_acerto,
+)
+
+
+# O metodo vem do cliente: fora destes, vira "outro", senao cada valor
+# inventado criaria uma serie nova nos arquivos e no cache de chaves
+METODOS = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'])
+
+
+def registrar_requisicao(url, metodo, status, duracao, consultas=None):
+    url = url or 'desconhecida'
+    if metodo not in METODOS:
+        metodo = 'outro'
+    REQUISICOES.inc(url=url, metodo=metodo, status=status)
+    DURACAO_REQUISICAO.observar(duracao, url=url)
+    if consultas is not None:
+        CONSULTAS_REQUISICAO.observar(consultas, url=url)
+
+
+def exposicao(request):
+    """Endpoint interno de metricas: so responde aos IPs de METRICAS_IPS."""
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICAS_IPS', ()):
+        raise Http404
+    return HttpResponse(registro.exposicao(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -10,6 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import importlib.util
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -31,6 +34,9 @@ ALLOWED_HOSTS = ["*"]
 # Application definition
 
 INSTALLED_APPS = [
+    # django-autocomplete-light precisa vir antes do admin
+    'dal',
+    'dal_select2',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -44,7 +50,6 @@ INSTALLED_APPS = [
     "usuario.apps.UsuarioConfig",
     'crispy_forms',
     'crispy_bootstrap5',
-    "debug_toolbar",
     "django_filters",
 ]
 
@@ -52,7 +57,8 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = 'bootstrap5'
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',  # Debug Tool Bar - deve ser o primeiro
+    'naes2025.desempenho.DesempenhoMiddleware',  # Deve ser o primeiro para medir o tempo total
+    'naes2025.consultas_lentas.ConsultasLentasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -104,6 +110,32 @@ DATABASES = {
     }
 }
 
+# Marca o banco acima como descartável: só então o benchmark_views grava os
+# dados sintéticos nele. Nunca ative apontando para o banco de produção
+BANCO_DESCARTAVEL = os.environ.get('BANCO_DESCARTAVEL') == '1'
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Cache em memória local: não depende de serviço externo. Com mais de uma
+# instância, um backend compartilhado (Redis/Memcached) evita que uma instância
+# sirva snapshots invalidados em outra até o fim do TTL.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "naes2025",
+    }
+}
+
+# Snapshot das estatísticas do dashboard (paginasweb/cache_dashboard.py)
+DASHBOARD_CACHE_ALIAS = "default"
+DASHBOARD_CACHE_TIMEOUT = 300  # segundos
+
+# Cache de Estado/Cidade em cada processo (cadastros/referencia.py). A versão
+# fica no cache "default": com um cache compartilhado (Redis, Memcached), uma
+# alteração em um processo chega aos outros em até este intervalo
+REFERENCIA_CACHE_INTERVALO = 5  # segundos
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -165,6 +197,58 @@ MESSAGE_TAGS = {
 
 #Configuração Django Debug Tool Bar
 
+# Só em desenvolvimento (DEBUG) e se estiver instalada; em produção a medição
+# das requisições fica com o DesempenhoMiddleware
+DEBUG_TOOLBAR = DEBUG and importlib.util.find_spec('debug_toolbar') is not None
+
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.insert(0, 'debug_toolbar.middleware.DebugToolbarMiddleware')  # Deve ser o primeiro
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
+
+# Medição de desempenho por requisição (naes2025/desempenho.py): fração das
+# requisições medidas, com cabeçalho Server-Timing e uma linha JSON no log.
+# Em produção mede 1% por padrão; a variável de ambiente ajusta a fração.
+# Em desenvolvimento a debug toolbar já faz esse papel
+DESEMPENHO_AMOSTRAGEM = float(os.environ.get('DESEMPENHO_AMOSTRAGEM', 0.0 if DEBUG_TOOLBAR else 0.01))
+
+# Métricas no formato do Prometheus (naes2025/metricas.py), expostas em
+# /metricas/ apenas para os IPs abaixo. Cada processo grava os valores num
+# arquivo mmap deste diretório; o gunicorn o limpa ao iniciar
+METRICAS_DIR = Path(os.environ.get('METRICAS_DIR', Path(tempfile.gettempdir()) / 'naes2025-metricas'))
+METRICAS_IPS = ['127.0.0.1', '::1']
+
+# Consultas lentas (naes2025/consultas_lentas.py): as que passam do limite
+# (None desliga) vão para o log e para um buffer circular em disco, que o
+# comando consultas_lentas resume. Uma fração delas é gravada com o EXPLAIN;
+# o EXPLAIN ANALYZE (só PostgreSQL) executa a consulta de novo
+CONSULTAS_LENTAS_LIMITE_MS = 200
+CONSULTAS_LENTAS_EXPLAIN = 0.1
+CONSULTAS_LENTAS_ANALYZE = False
+CONSULTAS_LENTAS_DIR = Path(os.environ.get(
+    'CONSULTAS_LENTAS_DIR', Path(tempfile.gettempdir()) / 'naes2025-consultas-lentas'
+))
+CONSULTAS_LENTAS_SEGMENTOS = 10
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "naes2025.desempenho": {"handlers": ["console"], "level": "INFO", "propagate": False},
+        "naes2025.consultas_lentas": {"handlers": ["console"], "level": "WARNING", "propagate": False},
+    },
+}
+
+# Auditoria dos pedidos (cadastros/auditoria.py): com True, as movimentações
+# são gravadas por uma thread de fundo em vez de no commit da requisição
+AUDITORIA_ADIADA = False
+
+# Arquivos JSONL (comprimidos) com as movimentações de pedido arquivadas
+# pelo comando arquivar_movimentacoes (cadastros/arquivamento.py)
+ARQUIVO_MOVIMENTACOES_DIR = BASE_DIR / 'arquivo' / 'movimentacoes'
@@ -18,15 +18,18 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 
+from . import metricas
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include("paginasweb.urls")),
     path("cadastros/", include("cadastros.urls")),
     path("usuario/", include("usuario.urls")),
+    path("metricas/", metricas.exposicao, name="metricas"),
 ]
 
-# Configuração do Django Debug Toolbar (apenas em modo DEBUG)
-if settings.DEBUG:
+# Configuração do Django Debug Toolbar (apenas em modo DEBUG, se estiver instalada)
+if settings.DEBUG_TOOLBAR:
     import debug_toolbar
     urlpatterns = [
         path('__debug__/', include(debug_toolbar.urls)),
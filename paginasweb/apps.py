@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PaginaswebConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'paginasweb'
+
+    def ready(self):
+        # Registra a invalidacao do cache do dashboard
+        from . import signals  # noqa: F401
@@ -0,0 +1,119 @@
+"""
+Cache por usuario do snapshot de estatisticas do dashboard.
+
+Cada usuario tem um contador de geracao no cache. O snapshot e gravado sob
+uma chave que inclui essa geracao, entao invalidar significa apenas avancar
+o contador: snapshots antigos deixam de ser lidos e expiram pelo TTL. Isso
+evita que uma requisicao que calculou o snapshot antes de uma escrita grave
+dados desatualizados depois da invalidacao.
+
+A geracao so avanca no commit da transacao (transaction.on_commit). Se
+avancasse antes, uma requisicao concorrente poderia ler a geracao nova,
+calcular o snapshot com os dados ainda nao confirmados e grava-lo sob ela,
+onde ficaria ate o TTL. Avancando depois do commit, quem le a geracao nova
+ja enxerga as escritas.
+"""
+import logging
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from naes2025 import metricas
+
+logger = logging.getLogger(__name__)
+
+# Altere sempre que a estrutura de EstatisticasDashboard mudar, para que
+# snapshots gravados por versoes anteriores do codigo sejam ignorados
+VERSAO_SNAPSHOT = 1
+
+CHAVE_ACERTOS = 'dashboard:acertos'
+CHAVE_FALHAS = 'dashboard:falhas'
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+
+def _chave_geracao(user_id):
+    return f'dashboard:{user_id}:geracao'
+
+
+def _chave_snapshot(user_id, geracao):
+    return f'dashboard:{user_id}:v{VERSAO_SNAPSHOT}:g{geracao}'
+
+
+def _geracao(cache, user_id):
+    geracao = cache.get(_chave_geracao(user_id))
+    if geracao is None:
+        # A geracao nao expira; se for descartada pelo cache, recomeca em 0
+        cache.add(_chave_geracao(user_id), 0, timeout=None)
+        geracao = cache.get(_chave_geracao(user_id), 0)
+    return geracao
+
+
+def _incrementar(cache, chave):
+    cache.add(chave, 0, timeout=None)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        # A chave expirou entre o add e o incr
+        cache.set(chave, 1, timeout=None)
+
+
+def obter_snapshot(user, calcular):
+    """
+    Retorna o snapshot em cache de ``user`` ou o calcula com ``calcular(user)``
+    e grava no cache.
+    """
+    cache = _cache()
+    geracao = _geracao(cache, user.pk)
+    chave = _chave_snapshot(user.pk, geracao)
+
+    snapshot = cache.get(chave)
+    if snapshot is not None:
+        _incrementar(cache, CHAVE_ACERTOS)
+        metricas.CACHE.inc(cache='dashboard', resultado='acerto')
+        logger.debug('Snapshot do dashboard em cache para o usuario %s', user.pk)
+        return snapshot
+
+    _incrementar(cache, CHAVE_FALHAS)
+    metricas.CACHE.inc(cache='dashboard', resultado='falha')
+    snapshot = calcular(user)
+    cache.set(chave, snapshot, timeout=_timeout())
+    return snapshot
+
+
+def invalidar_snapshot(user_id):
+    """Descarta o snapshot do dashboard do usuario, avancando a geracao no commit."""
+    if user_id is None:
+        return
+    transaction.on_commit(partial(_avancar_geracao, user_id))
+
+
+def _avancar_geracao(user_id):
+    cache = _cache()
+    chave = _chave_geracao(user_id)
+    if not cache.add(chave, 1, timeout=None):
+        try:
+            cache.incr(chave)
+        except ValueError:
+            cache.set(chave, 1, timeout=None)
+
+
+def contadores_cache():
+    """Retorna acertos, falhas e a taxa de acerto do cache do dashboard."""
+    cache = _cache()
+    acertos = cache.get(CHAVE_ACERTOS, 0)
+    falhas = cache.get(CHAVE_FALHAS, 0)
+    total = acertos + falhas
+    return {
+        'acertos': acertos,
+        'falhas': falhas,
+        'taxa_acerto': acertos / total if total else 0.0,
+    }
@@ -0,0 +1,165 @@
+"""
+Serviço de estatísticas do dashboard (página inicial).
+
+Concentra todas as consultas da PaginaInicial em um número fixo de queries,
+13 ao todo: os contadores de pedidos e itens saem de uma agregação do resumo
+diário, os demais de um COUNT por tabela (4), e cada um dos 8 painéis é uma
+consulta separada com ``ORDER BY ... LIMIT``; nenhum painel é buscado junto
+com outro. Os painéis de "últimos" e de pedidos urgentes seguem os índices
+por dono e leem só as linhas exibidas; os rankings por agregado só ordenam
+o resultado do GROUP BY. Cidades e estados vêm do cache de referência;
+com ele carregado, a sessão e o usuário da requisição, a página faz 15
+consultas (``PaginaInicialTest.NUM_QUERIES``).
+"""
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from cadastros.models import (
+    CategoriaItem, Fornecedor, Frota, Item, Pedido, ResumoDiarioPedido
+)
+from cadastros.referencia import anexar
+from paginasweb.templatetags.custom_filters import br_currency
+
+# Quantidade de registros exibidos em cada painel do dashboard
+TAMANHO_PAINEL = 5
+
+STATUS_ABERTOS = ['pendente', 'em_andamento']
+
+
+@dataclass
+class EstatisticasDashboard:
+    """Resultado consolidado das estatísticas de um usuário."""
+
+    total_pedidos: int = 0
+    total_fornecedores: int = 0
+    total_frota: int = 0
+    total_itens: int = 0
+    total_categorias: int = 0
+    pedidos_pendentes: int = 0
+    pedidos_em_andamento: int = 0
+    pedidos_entregues: int = 0
+    pedidos_este_mes: int = 0
+    valor_total_pedidos: Decimal = Decimal('0')
+    quantidade_total_itens: int = 0
+    ultimos_pedidos: list = field(default_factory=list)
+    pedidos_urgentes: list = field(default_factory=list)
+    ultimos_fornecedores: list = field(default_factory=list)
+    top_fornecedores: list = field(default_factory=list)
+    fornecedores_valor: list = field(default_factory=list)
+    fornecedores_atrasados: list = field(default_factory=list)
+    ultimos_itens: list = field(default_factory=list)
+    top_itens: list = field(default_factory=list)
+
+    def como_contexto(self):
+        """Retorna os campos como dicionário pronto para o contexto do template."""
+        return dict(self.__dict__)
+
+
+def _contadores_pedidos(user):
+    """
+    Contadores de pedidos e itens lidos do resumo diário: a consulta percorre
+    uma linha por dia/status/fornecedor em vez de todos os pedidos e itens.
+    """
+    inicio_mes = timezone.localdate().replace(day=1)
+    resultado = ResumoDiarioPedido.objects.filter(criado_por=user).aggregate(
+        total_pedidos=Sum('num_pedidos'),
+        pedidos_pendentes=Sum('num_pedidos', filter=Q(status='pendente')),
+        pedidos_em_andamento=Sum('num_pedidos', filter=Q(status='em_andamento')),
+        pedidos_entregues=Sum('num_pedidos', filter=Q(status='finalizado')),
+        pedidos_este_mes=Sum('num_pedidos', filter=Q(dia__gte=inicio_mes)),
+        valor_total_pedidos=Sum('valor_total'),
+        quantidade_total_itens=Sum('quantidade_itens'),
+    )
+    return {chave: valor or 0 for chave, valor in resultado.items()}
+
+
+def _paineis_pedidos(user):
+    """Últimos pedidos e pedidos urgentes, cada painel pelo seu índice."""
+    data_limite = timezone.now().date() + timedelta(days=7)
+    pedidos = Pedido.objects.filter(criado_por=user).select_related('fornecedor')
+
+    return {
+        'ultimos_pedidos': list(pedidos.order_by('-data_pedido', '-id')[:TAMANHO_PAINEL]),
+        'pedidos_urgentes': list(
+            pedidos.filter(previsao_entrega__lte=data_limite, status__in=STATUS_ABERTOS)
+            .order_by('previsao_entrega', 'id')[:TAMANHO_PAINEL]
+        ),
+    }
+
+
+def _paineis_fornecedores(user):
+    """Últimos fornecedores e os três rankings de fornecedores."""
+    hoje = timezone.now().date()
+    fornecedores = Fornecedor.objects.filter(criado_por=user)
+
+    ultimos = list(fornecedores.order_by('-id')[:TAMANHO_PAINEL])
+    top = list(
+        fornecedores.annotate(num_pedidos=Count('pedido')).filter(num_pedidos__gt=0)
+        .order_by('-num_pedidos', 'id')[:TAMANHO_PAINEL]
+    )
+    por_valor = list(
+        fornecedores.annotate(
+            valor_total=Sum(F('pedido__itempedido__quantidade') * F('pedido__itempedido__valor_unitario')),
+        ).filter(valor_total__gt=0).order_by('-valor_total', 'id')[:TAMANHO_PAINEL]
+    )
+    # O filtro fica no JOIN: só os pedidos atrasados entram no agrupamento
+    atrasados = list(
+        fornecedores.filter(
+            pedido__previsao_entrega__lt=hoje,
+            pedido__status__in=STATUS_ABERTOS,
+            pedido__criado_por=user,
+        ).annotate(pedidos_atrasados=Count('pedido')).order_by('-pedidos_atrasados', 'id')[:TAMANHO_PAINEL]
+    )
+    # Cidade e estado vêm do cache de referência, sem JOIN
+    anexar(ultimos + top + por_valor + atrasados)
+
+    return {
+        'ultimos_fornecedores': ultimos,
+        'top_fornecedores': top,
+        'fornecedores_valor': [
+            {
+                'fornecedor': fornecedor,
+                'valor_total': fornecedor.valor_total,
+                'valor_formatado': br_currency(fornecedor.valor_total),
+            }
+            for fornecedor in por_valor
+        ],
+        'fornecedores_atrasados': atrasados,
+    }
+
+
+def _paineis_itens(user):
+    """Últimos itens e itens mais pedidos."""
+    itens = Item.objects.filter(criado_por=user).select_related('categoria')
+
+    return {
+        'ultimos_itens': list(itens.order_by('-id')[:TAMANHO_PAINEL]),
+        'top_itens': list(
+            itens.annotate(num_pedidos=Count('itempedido')).filter(num_pedidos__gt=0)
+            .order_by('-num_pedidos', 'id')[:TAMANHO_PAINEL]
+        ),
+    }
+
+
+def calcular_estatisticas(user):
+    """
+    Calcula todas as estatísticas do dashboard de ``user``.
+
+    O número de consultas é fixo, independente do volume de dados: uma
+    agregação por tabela para os contadores (pedidos e itens vêm juntos do
+    resumo diário) e uma consulta ``ORDER BY ... LIMIT`` separada por painel.
+    """
+    dados = {}
+    dados.update(_contadores_pedidos(user))
+    dados['total_fornecedores'] = Fornecedor.objects.filter(criado_por=user).count()
+    dados['total_frota'] = Frota.objects.filter(criado_por=user).count()
+    dados['total_itens'] = Item.objects.filter(criado_por=user).count()
+    dados['total_categorias'] = CategoriaItem.objects.filter(criado_por=user).count()
+    dados.update(_paineis_pedidos(user))
+    dados.update(_paineis_fornecedores(user))
+    dados.update(_paineis_itens(user))
+    return EstatisticasDashboard(**dados)
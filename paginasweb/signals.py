@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+
+from cadastros.models import (
+    CategoriaItem, Fornecedor, Frota, Item, ItemPedido, Pedido
+)
+from .cache_dashboard import invalidar_snapshot
+
+# Modelos cujas alteracoes mudam as estatisticas do dashboard do dono
+MODELOS_DASHBOARD = [Pedido, ItemPedido, Fornecedor, Item, Frota, CategoriaItem]
+
+
+def invalidar_dashboard(sender, instance, **kwargs):
+    invalidar_snapshot(instance.criado_por_id)
+
+
+for modelo in MODELOS_DASHBOARD:
+    post_save.connect(invalidar_dashboard, sender=modelo, dispatch_uid=f'dashboard_save_{modelo.__name__}')
+    post_delete.connect(invalidar_dashboard, sender=modelo, dispatch_uid=f'dashboard_delete_{modelo.__name__}')
@@ -1,3 +1,395 @@
-from django.test import TestCase
+import json
+import tempfile
+from pathlib import Path
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from cadastros import referencia
+from cadastros.models import (
+    CategoriaItem, Cidade, Estado, Fornecedor, Frota, Item, ItemPedido, Pedido
+)
+
+from naes2025 import consultas_lentas, metricas
+
+from .cache_dashboard import contadores_cache, invalidar_snapshot
+from .estatisticas import calcular_estatisticas
+
+
+def criar_dados(user, num_fornecedores, pedidos_por_fornecedor, itens_por_pedido):
+    """Cria um conjunto de dados do usuario para os testes do dashboard."""
+    estado = Estado.objects.create(nome='Paraná', sigla='PR')
+    cidade = Cidade.objects.create(nome='Paranavaí', estado=estado)
+    categoria = CategoriaItem.objects.create(nome='Peças', criado_por=user)
+    frota = Frota.objects.create(prefixo='01-001', descricao='Trator', ano=2020, criado_por=user)
+    itens = [
+        Item.objects.create(nome=f'Item {i}', categoria=categoria, criado_por=user)
+        for i in range(3)
+    ]
+    ontem = timezone.now().date() - timedelta(days=1)
+
+    for f in range(num_fornecedores):
+        fornecedor = Fornecedor.objects.create(
+            nome=f'Fornecedor {f}', cnpj='00.000.000/0001-00',
+            cidade=cidade, estado=estado, criado_por=user,
+        )
+        for p in range(pedidos_por_fornecedor):
+            pedido = Pedido.objects.create(
+                fornecedor=fornecedor, descricao='Pedido de teste',
+                status=['pendente', 'em_andamento', 'finalizado'][p % 3],
+                previsao_entrega=ontem, criado_por=user,
+            )
+            for i in range(itens_por_pedido):
+                ItemPedido.objects.create(
+                    item=itens[i % len(itens)], frota=frota, pedido=pedido,
+                    quantidade=f + 1, valor_unitario=Decimal('10.50'), criado_por=user,
+                )
+
+
+class EstatisticasDashboardTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('usuarioteste', password='senha12345')
+
+    def test_contadores(self):
+        criar_dados(self.user, num_fornecedores=2, pedidos_por_fornecedor=3, itens_por_pedido=2)
+        estatisticas = calcular_estatisticas(self.user)
+
+        self.assertEqual(estatisticas.total_pedidos, 6)
+        self.assertEqual(estatisticas.total_fornecedores, 2)
+        self.assertEqual(estatisticas.total_itens, 3)
+        self.assertEqual(estatisticas.total_categorias, 1)
+        self.assertEqual(estatisticas.total_frota, 1)
+        self.assertEqual(estatisticas.pedidos_pendentes, 2)
+        self.assertEqual(estatisticas.pedidos_em_andamento, 2)
+        self.assertEqual(estatisticas.pedidos_entregues, 2)
+        self.assertEqual(estatisticas.pedidos_este_mes, 6)
+        # 6 itens com quantidade 1 e 6 itens com quantidade 2
+        self.assertEqual(estatisticas.quantidade_total_itens, 18)
+        self.assertEqual(estatisticas.valor_total_pedidos, Decimal('189.00'))
+
+    def test_paineis(self):
+        criar_dados(self.user, num_fornecedores=7, pedidos_por_fornecedor=1, itens_por_pedido=1)
+        estatisticas = calcular_estatisticas(self.user)
+
+        self.assertEqual(len(estatisticas.ultimos_pedidos), 5)
+        self.assertEqual(
+            [p.pk for p in estatisticas.ultimos_pedidos],
+            list(Pedido.objects.filter(criado_por=self.user).order_by('-data_pedido').values_list('pk', flat=True)[:5]),
+        )
+        self.assertEqual(
+            [f.nome for f in estatisticas.ultimos_fornecedores],
+            ['Fornecedor 6', 'Fornecedor 5', 'Fornecedor 4', 'Fornecedor 3', 'Fornecedor 2'],
+        )
+        # O fornecedor com maior quantidade por item tem o maior valor total
+        self.assertEqual(estatisticas.fornecedores_valor[0]['fornecedor'].nome, 'Fornecedor 6')
+        self.assertEqual(estatisticas.fornecedores_valor[0]['valor_formatado'], '73,50')
+        # Apenas pedidos pendentes/em andamento estao atrasados
+        self.assertEqual(len(estatisticas.fornecedores_atrasados), 5)
+        self.assertEqual(len(estatisticas.pedidos_urgentes), 5)
+        self.assertTrue(all(p.status != 'finalizado' for p in estatisticas.pedidos_urgentes))
+        self.assertEqual(len(estatisticas.top_fornecedores), 5)
+        self.assertEqual([i.num_pedidos for i in estatisticas.top_itens], [7])
+
+    def test_sem_dados(self):
+        estatisticas = calcular_estatisticas(self.user)
+
+        self.assertEqual(estatisticas.total_pedidos, 0)
+        self.assertEqual(estatisticas.valor_total_pedidos, 0)
+        self.assertEqual(estatisticas.top_fornecedores, [])
+        self.assertEqual(estatisticas.fornecedores_valor, [])
+
+
+class PaginaInicialTest(TestCase):
+    # sessao + usuario + 5 contadores + 8 paineis
+    NUM_QUERIES = 15
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('usuarioteste', password='senha12345')
+        self.client.force_login(self.user)
+
+    def test_numero_de_queries_fixo(self):
+        criar_dados(self.user, num_fornecedores=1, pedidos_por_fornecedor=1, itens_por_pedido=1)
+        # Cidades e estados vem do cache de referencia, carregado uma vez por processo
+        referencia.dados()
+        with self.assertNumQueries(self.NUM_QUERIES):
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            criar_dados(self.user, num_fornecedores=10, pedidos_por_fornecedor=6, itens_por_pedido=4)
+        referencia.dados()
+        with self.assertNumQueries(self.NUM_QUERIES):
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_pedidos'], 61)
+
+    def test_anonimo(self):
+        self.client.logout()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+
+
+class CacheDashboardTest(TestCase):
+    # sessao + usuario
+    NUM_QUERIES_CACHE = 2
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('usuarioteste', password='senha12345')
+        self.client.force_login(self.user)
+        criar_dados(self.user, num_fornecedores=2, pedidos_por_fornecedor=2, itens_por_pedido=2)
+
+    def test_segunda_requisicao_usa_cache(self):
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(self.NUM_QUERIES_CACHE):
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['total_pedidos'], 4)
+        self.assertEqual(contadores_cache(), {'acertos': 1, 'falhas': 1, 'taxa_acerto': 0.5})
+
+    def test_escrita_invalida_cache(self):
+        self.client.get(reverse('index'))
+        pedido = Pedido.objects.filter(criado_por=self.user).first()
+        pedido.status = 'finalizado'
+        # A geracao do snapshot so avanca no commit
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido.save()
+
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['pedidos_entregues'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido.delete()
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['total_pedidos'], 3)
+        self.assertEqual(contadores_cache()['acertos'], 0)
+
+    def test_invalidacao_espera_o_commit(self):
+        self.client.get(reverse('index'))
+        with self.captureOnCommitCallbacks() as callbacks:
+            Pedido.objects.filter(criado_por=self.user).first().delete()
+            # Antes do commit a geracao nao muda: nada e recalculado com dados nao confirmados
+            self.client.get(reverse('index'))
+            self.assertEqual(contadores_cache()['acertos'], 1)
+
+        for callback in callbacks:
+            callback()
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['total_pedidos'], 3)
+
+    def test_cache_por_usuario(self):
+        outro = User.objects.create_user('outrousuario', password='senha12345')
+        self.client.get(reverse('index'))
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidar_snapshot(outro.pk)
+
+        with self.assertNumQueries(self.NUM_QUERIES_CACHE):
+            self.client.get(reverse('index'))
+
+
+class DesempenhoMiddlewareTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('usuarioteste', password='senha12345')
+        self.client.force_login(self.user)
+        criar_dados(self.user, num_fornecedores=2, pedidos_por_fornecedor=2, itens_por_pedido=2)
+        referencia.dados()
+
+    @override_settings(DESEMPENHO_AMOSTRAGEM=1.0)
+    def test_server_timing_e_log(self):
+        with self.assertLogs('naes2025.desempenho', 'INFO') as logs:
+            response = self.client.get(reverse('index'))
+
+        registro = json.loads(logs.records[0].getMessage())
+        self.assertEqual(registro['url'], 'index')
+        self.assertEqual(registro['status'], 200)
+        self.assertEqual(registro['consultas'], PaginaInicialTest.NUM_QUERIES)
+        self.assertGreater(registro['template_ms'], 0)
+        self.assertGreaterEqual(registro['total_ms'], registro['template_ms'])
+
+        metricas = response['Server-Timing']
+        self.assertIn('url;desc="index"', metricas)
+        self.assertIn(f'desc="{PaginaInicialTest.NUM_QUERIES} consultas"', metricas)
+        self.assertIn('tpl;dur=', metricas)
+        self.assertIn('total;dur=', metricas)
+
+    @override_settings(DESEMPENHO_AMOSTRAGEM=0)
+    def test_sem_amostragem(self):
+        with self.assertNoLogs('naes2025.desempenho'):
+            response = self.client.get(reverse('index'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class MetricasTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        temporario = tempfile.TemporaryDirectory()
+        self.addCleanup(temporario.cleanup)
+        self.diretorio = Path(temporario.name)
+        configuracao = override_settings(METRICAS_DIR=self.diretorio)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        self.user = User.objects.create_user('usuarioteste', password='senha12345')
+        self.client.force_login(self.user)
+        criar_dados(self.user, num_fornecedores=2, pedidos_por_fornecedor=2, itens_por_pedido=2)
+        referencia.dados()
+
+    @override_settings(DESEMPENHO_AMOSTRAGEM=1.0)
+    def test_exposicao(self):
+        with self.assertLogs('naes2025.desempenho', 'INFO'):
+            self.client.get(reverse('index'))
+            self.client.get(reverse('index'))
+            response = self.client.get(reverse('metricas'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        texto = response.content.decode()
+        self.assertIn('# TYPE naes_requisicao_duracao_segundos histogram', texto)
+        self.assertIn('naes_requisicoes_total{url="index",metodo="GET",status="200"} 2', texto)
+        self.assertIn('naes_requisicao_duracao_segundos_bucket{url="index",le="+Inf"} 2', texto)
+        self.assertIn('naes_requisicao_duracao_segundos_count{url="index"} 2', texto)
+        self.assertIn('naes_requisicao_consultas_count{url="index"} 2', texto)
+        self.assertIn('naes_requisicao_consultas_bucket{url="index",le="1"} 0', texto)
+        # Primeira leitura calcula o snapshot, a segunda vem do cache
+        self.assertIn('naes_cache_total{cache="dashboard",resultado="acerto"} 1', texto)
+        self.assertIn('naes_cache_taxa_acerto{cache="dashboard"} 0.5', texto)
+
+    def test_faixas_do_histograma(self):
+        metricas.DURACAO_FORMULARIO.observar(0.02, formulario='pedido')
+        texto = metricas.registro.exposicao()
+        self.assertIn('naes_formulario_salvar_duracao_segundos_bucket{formulario="pedido",le="0.01"} 0', texto)
+        self.assertIn('naes_formulario_salvar_duracao_segundos_bucket{formulario="pedido",le="0.025"} 1', texto)
+
+    def test_chaves_montadas_uma_vez_por_serie(self):
+        with mock.patch('naes2025.metricas._chave', wraps=metricas._chave) as chave:
+            metricas.registrar_requisicao('teste-chaves', 'GET', 200, 0.01)
+            metricas.registrar_requisicao('teste-chaves', 'GET', 200, 0.025)
+        # Contador, faixas, soma e contagem do histograma: so na primeira requisicao
+        self.assertEqual(chave.call_count, 1 + len(metricas.DURACAO_REQUISICAO.faixas) + 2)
+
+        texto = metricas.registro.exposicao()
+        self.assertIn('naes_requisicao_duracao_segundos_bucket{url="teste-chaves",le="0.01"} 1', texto)
+        self.assertIn('naes_requisicao_duracao_segundos_bucket{url="teste-chaves",le="0.025"} 2', texto)
+
+    def test_metodos_desconhecidos_viram_outro(self):
+        for indice in range(5):
+            self.client.generic(f'X{indice}', reverse('index'))
+        self.client.generic('PATCH', reverse('index'))
+
+        texto = metricas.registro.exposicao()
+        self.assertNotIn('metodo="X', texto)
+        # A pagina inicial so aceita GET: os demais metodos recebem 405
+        self.assertIn('naes_requisicoes_total{url="index",metodo="outro",status="405"} 5', texto)
+        self.assertIn('naes_requisicoes_total{url="index",metodo="PATCH",status="405"} 1', texto)
+
+    def test_ip_nao_autorizado(self):
+        response = self.client.get(reverse('metricas'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 404)
+
+    def test_soma_dos_processos(self):
+        # Dois workers: cada um com o seu arquivo no mesmo diretorio
+        for pid, valor in ((101, 2), (102, 3)):
+            arquivo = metricas.ArquivoValores(self.diretorio / f'{pid}.db')
+            arquivo.somar(metricas._chave('naes_cache_total', [['cache', 'x'], ['resultado', 'falha']]), valor)
+            arquivo.fechar()
+
+        totais = metricas.ler_diretorio(self.diretorio)
+        self.assertEqual(totais['["naes_cache_total",[["cache","x"],["resultado","falha"]]]'], 5)
+
+
+class ConsultasLentasTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        temporario = tempfile.TemporaryDirectory()
+        self.addCleanup(temporario.cleanup)
+        self.diretorio = Path(temporario.name)
+        # Limite zero: todas as consultas da requisicao contam como lentas
+        configuracao = override_settings(
+            CONSULTAS_LENTAS_DIR=self.diretorio, CONSULTAS_LENTAS_LIMITE_MS=0, CONSULTAS_LENTAS_EXPLAIN=1.0,
+        )
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        self.user = User.objects.create_user('usuarioteste', password='senha12345')
+        self.client.force_login(self.user)
+        criar_dados(self.user, num_fornecedores=2, pedidos_por_fornecedor=2, itens_por_pedido=2)
+        referencia.dados()
+
+    def test_normalizacao(self):
+        a = consultas_lentas.normalizar('SELECT * FROM t WHERE id IN (%s, %s, %s) AND nome = \'x\' LIMIT 21')
+        b = consultas_lentas.normalizar('SELECT *\n  FROM t WHERE id IN (%s) AND nome = \'it\'\'s\' LIMIT 5')
+        self.assertEqual(a, 'SELECT * FROM t WHERE id IN (...) AND nome = ? LIMIT ?')
+        self.assertEqual(a, b)
+        self.assertEqual(
+            consultas_lentas.normalizar('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)'),
+            'INSERT INTO t (a, b) VALUES (...)',
+        )
+
+    def test_registra_com_plano_e_resume(self):
+        with self.assertLogs('naes2025.consultas_lentas', 'WARNING') as logs:
+            self.client.get(reverse('index'))
+
+        # As consultas do EXPLAIN (e os savepoints dele) nao sao registradas
+        registros = list(consultas_lentas.ler_registros(self.diretorio))
+        self.assertEqual(len(logs.records), PaginaInicialTest.NUM_QUERIES)
+        self.assertEqual(len(registros), PaginaInicialTest.NUM_QUERIES)
+        self.assertEqual({registro['url'] for registro in registros}, {'index'})
+        selects = [registro for registro in registros if registro['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        self.assertTrue(all(registro.get('plano') for registro in selects))
+        self.assertEqual(json.loads(logs.records[0].getMessage())['impressao'], registros[0]['impressao'])
+
+        saida = StringIO()
+        call_command('consultas_lentas', top=3, planos=True, limpar=True, stdout=saida)
+        texto = saida.getvalue()
+        mais_lenta = max(
+            {registro['impressao'] for registro in registros},
+            key=lambda impressao: sum(r['duracao_ms'] for r in registros if r['impressao'] == impressao),
+        )
+        self.assertIn(mais_lenta, texto)
+        self.assertIn('index (', texto)
+        self.assertFalse(list(self.diretorio.glob('*.jsonl')))
+
+    @override_settings(DESEMPENHO_AMOSTRAGEM=1.0)
+    def test_explain_fora_da_medicao(self):
+        with self.assertLogs('naes2025.consultas_lentas', 'WARNING'), \
+                self.assertLogs('naes2025.desempenho', 'INFO') as logs:
+            response = self.client.get(reverse('index'))
+
+        # Cada SELECT ganhou um EXPLAIN com savepoint, mas a medicao so conta a pagina
+        self.assertEqual(json.loads(logs.records[0].getMessage())['consultas'], PaginaInicialTest.NUM_QUERIES)
+        self.assertIn(f'desc="{PaginaInicialTest.NUM_QUERIES} consultas"', response['Server-Timing'])
+
+    def test_buffer_limitado(self):
+        captura = consultas_lentas.CapturaConsultas('teste', 0, 0)
+        with override_settings(CONSULTAS_LENTAS_SEGMENTOS=2), \
+                mock.patch.object(consultas_lentas, 'ITENS_POR_SEGMENTO', 2), \
+                connection.execute_wrapper(captura), \
+                self.assertLogs('naes2025.consultas_lentas', 'WARNING'):
+            for numero in range(7):
+                User.objects.filter(pk=numero).exists()
+
+        self.assertEqual(len(list(self.diretorio.glob('*.jsonl'))), 2)
+        # Ficam so as ocorrencias mais recentes: 7 = 2 + 2 + 2 + 1
+        self.assertEqual(len(list(consultas_lentas.ler_registros(self.diretorio))), 3)
+
+    @override_settings(CONSULTAS_LENTAS_LIMITE_MS=None)
+    def test_desligado(self):
+        with self.assertNoLogs('naes2025.consultas_lentas'):
+            self.client.get(reverse('index'))
+        self.assertFalse(list(self.diretorio.glob('*.jsonl')))